@@ -6,34 +6,72 @@ from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from dependencies import limiter
 import pathlib
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from frontend_server import FrontendServer
 
 
 # Import the hosts router
 from routers.hosts_router import router as hosts_router
 from routers.lighthouse_router import router as lighthouse_router
-from routers.nebula_process_router import router as nebula_process_router
+from routers.nebula_process_router import router as nebula_process_router, autostart_lighthouse, shutdown_lighthouse
 from routers.client_router import router as client_router
 from routers.ca_router import router as ca_router
-from routers.invites_router import router as invites_router 
+from routers.invites_router import router as invites_router, invite_archiver
+from routers.certs_router import router as certs_router, renewal_scheduler
+from host_registry import get_registry
+from invite_store import get_invite_store
+from pagination import Pagination, PageRequest
+from host_index import get_host_index
+from cert_cache import cert_info_cache
+from cert_expiry import cert_expiry_index
+from host_bundles import host_bundles
+from config_template import config_template
+from routers.ca_router import cert_path as ca_cert_path
+from drain import install_signal_handlers
+from user_cache import CachedUserDatabase, get_user_cache
+from vars import CERT_RENEW_INTERVAL, SERVER_WARMUP, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_BUSY_TIMEOUT_MS, DB_MMAP_SIZE
+import asyncio
+import time
 
 # --- FastAPI Users imports & setup (new) ---
-from typing import Optional, AsyncGenerator
+from typing import Any, Optional, AsyncGenerator
 import uuid
 from fastapi import Request
 from pydantic import BaseModel, EmailStr
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import select
+from sqlalchemy import event, select, tuple_
+from sqlalchemy.exc import OperationalError
 from fastapi_users import FastAPIUsers
 from fastapi_users.authentication import AuthenticationBackend, BearerTransport, JWTStrategy
-from fastapi_users.db import SQLAlchemyBaseUserTableUUID, SQLAlchemyUserDatabase
+from fastapi_users.db import SQLAlchemyBaseUserTableUUID
 from fastapi_users.manager import BaseUserManager, UUIDIDMixin
+from fastapi.security import OAuth2PasswordRequestForm
+from password_hashing import AsyncPasswordHelper, get_password_helper
 
 # Database (async SQLAlchemy)
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite+aiosqlite:///./nebula.db")
-engine = create_async_engine(DATABASE_URL, echo=False)
+
+def create_db_engine(url: str = DATABASE_URL) -> AsyncEngine:
+    """
+    Async engine for the user database. SQLite connections are set up for
+    concurrent use: WAL (readers and the writer don't block each other),
+    synchronous=NORMAL, a busy timeout instead of failing with "database is
+    locked", and memory-mapped reads; a pool of them is kept open and reused.
+    """
+    engine = create_async_engine(url, echo=False, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine.sync_engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            # Durable at checkpoints rather than every commit; WAL keeps the database consistent
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+            cursor.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+            cursor.close()
+    return engine
+
+engine = create_db_engine()
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 Base = declarative_base()
 
@@ -69,16 +107,39 @@ async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 async def get_user_db(session: AsyncSession = Depends(get_async_session)):
-    yield SQLAlchemyUserDatabase(session, User)
+    # Token auth looks users up by id on every request; those lookups are cached
+    yield CachedUserDatabase(session, User)
 
 class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
     reset_password_token_secret = os.environ.get("JWT_SECRET", "CHANGE_ME")
     verification_token_secret = os.environ.get("JWT_SECRET", "CHANGE_ME")
 
+    def __init__(self, user_db, password_helper: Optional[AsyncPasswordHelper] = None):
+        super().__init__(user_db, password_helper or get_password_helper())
+
     async def on_after_register(self, user: User, request: Optional[Request] = None):
         # Optional: send welcome/verification email, audit log, etc.
         pass
 
+    # BaseUserManager's own methods, with their password hashing done on the thread pool
+
+    async def create(self, user_create, safe: bool = False, request: Optional[Request] = None) -> User:
+        async with self.password_helper.prepared(user_create.password):
+            return await super().create(user_create, safe, request)
+
+    async def authenticate(self, credentials: OAuth2PasswordRequestForm) -> Optional[User]:
+        # Unknown emails get a hash instead, so they take as long as wrong passwords
+        user = await self.user_db.get_by_email(credentials.username)
+        async with self.password_helper.prepared(credentials.password, user.hashed_password if user else None):
+            return await super().authenticate(credentials)
+
+    async def _update(self, user: User, update_dict: dict[str, Any]) -> User:
+        password = update_dict.get("password")
+        if password is None:
+            return await super()._update(user, update_dict)
+        async with self.password_helper.prepared(password):
+            return await super()._update(user, update_dict)
+
 async def get_user_manager(user_db=Depends(get_user_db)):
     yield UserManager(user_db)
 
@@ -105,13 +166,53 @@ current_active_user = fastapi_users.current_user(active=True)
 current_superuser = fastapi_users.current_user(active=True, superuser=True)
 # --- end FastAPI Users setup ---
 
+def warmup() -> None:
+    """
+    Load the caches the first requests would otherwise pay for, before the worker takes traffic.
+    """
+    start = time.perf_counter()
+    config_template.tree()
+    if os.path.exists(ca_cert_path):
+        cert_info_cache.get_json(ca_cert_path)
+    hosts = get_host_index().warm()
+    certs = cert_expiry_index.scan()
+    print(f"Warmup done in {time.perf_counter() - start:.2f}s: {hosts} hosts indexed, {certs} certificates scanned")
+
 # Use FastAPI lifespan event for startup config
 @asynccontextmanager
 async def lifespan(app):
     # Create DB tables on startup
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    except OperationalError:
+        # Another worker created them at the same moment; this pass only checks they exist
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    # Pick up any orgs/hosts that only exist in the YAML tree
+    get_registry().import_yaml_tree()
+    # Move a legacy invites.yaml into the invite store and compact expired invites
+    get_invite_store().import_yaml()
+    get_invite_store().archive_expired()
+    # Bring the lighthouse back if it was running when the API stopped
+    await asyncio.to_thread(autostart_lighthouse)
+    # Periodically renew certificates that are about to expire
+    renewal_task = asyncio.create_task(renewal_scheduler()) if CERT_RENEW_INTERVAL > 0 else None
+    # Expired invites are archived here (and at startup above), not by listings
+    archive_task = asyncio.create_task(invite_archiver())
+    if SERVER_WARMUP:
+        await asyncio.to_thread(warmup)
+    # On SIGTERM, let long-polls and log streams finish at once so the worker drains quickly
+    install_signal_handlers()
     yield
+    if renewal_task is not None:
+        renewal_task.cancel()
+    archive_task.cancel()
+    await asyncio.to_thread(shutdown_lighthouse)
+    # Write any registry changes the background YAML export hasn't caught up with
+    await asyncio.to_thread(get_registry().flush_export)
+    # Requests have drained; don't leave superseded bundles (old host keys) behind
+    await asyncio.to_thread(host_bundles.sweep, True)
 
 app = FastAPI(
     lifespan=lifespan
@@ -179,6 +280,11 @@ app.include_router(
     prefix="/admin",
     dependencies=[Depends(current_superuser)]
 )
+app.include_router(
+    certs_router,
+    prefix="/admin",
+    dependencies=[Depends(current_superuser)]
+)
 
 # Client router doesn't need admin auth
 app.include_router(
@@ -216,11 +322,39 @@ class AdminUserRead(BaseModel):
     class Config:
         from_attributes = True
 
-@app.get("/admin/api/users", response_model=list[AdminUserRead], dependencies=[Depends(current_superuser)])
-async def list_users(session: AsyncSession = Depends(get_async_session)):
-    result = await session.execute(select(User))
-    users = result.scalars().all()
-    return users
+class AdminUserPage(BaseModel):
+    users: list[AdminUserRead]
+    next_cursor: Optional[str] = None
+
+# sort name -> User columns (and cursor fields) of its unique order
+USER_SORT_KEYS = {"email": ("email", "id"), "id": ("id",)}
+user_pagination = Pagination(USER_SORT_KEYS, default_sort="email")
+
+@app.get("/admin/api/users", response_model=list[AdminUserRead] | AdminUserPage, dependencies=[Depends(current_superuser)])
+async def list_users(page: PageRequest = Depends(user_pagination)):
+    async def fetch(sort, descending, after, limit):
+        columns = [getattr(User, field) for field in USER_SORT_KEYS[sort]]
+        query = select(User).order_by(*(c.desc() if descending else c for c in columns))
+        if after is not None:
+            # Every sort ends in the user id, which the cursor carries as a string
+            try:
+                after = [*after[:-1], uuid.UUID(str(after[-1]))]
+            except ValueError:
+                raise ValueError("Invalid cursor")
+            key = tuple_(*columns)
+            # types= so the id is bound through the GUID column type
+            after = tuple_(*after, types=[c.type for c in columns])
+            query = query.where(key < after if descending else key > after)
+        if limit is not None:
+            query = query.limit(limit)
+        # A session per batch: streamed responses outlive the request's dependencies
+        async with async_session_maker() as session:
+            result = await session.execute(query)
+            return result.scalars().all()
+
+    result = await page.respond("users", fetch, lambda user: AdminUserRead.model_validate(user).model_dump(mode="json"))
+    # Unpaginated requests keep returning a bare list
+    return result["users"] if isinstance(result, dict) and not page.paginated else result
 
 @app.patch("/admin/api/users/{user_id}", response_model=AdminUserRead, dependencies=[Depends(current_superuser)])
 async def update_user(user_id: uuid.UUID, payload: AdminUserUpdate, session: AsyncSession = Depends(get_async_session), user_db=Depends(get_user_db), user_manager=Depends(get_user_manager)):
@@ -239,7 +373,7 @@ async def update_user(user_id: uuid.UUID, payload: AdminUserUpdate, session: Asy
         to_update["is_verified"] = payload.is_verified
     if payload.password:
         # Hash password using the same helper as the app manager
-        hashed = user_manager.password_helper.hash(payload.password)
+        hashed = await user_manager.password_helper.hash_async(payload.password)
         to_update["hashed_password"] = hashed
 
     if to_update:
@@ -248,6 +382,7 @@ async def update_user(user_id: uuid.UUID, payload: AdminUserUpdate, session: Asy
         session.add(user)
         await session.commit()
         await session.refresh(user)
+        get_user_cache().invalidate(user_id)
 
     return user
 
@@ -258,31 +393,19 @@ async def delete_user(user_id: uuid.UUID, session: AsyncSession = Depends(get_as
         raise HTTPException(status_code=404, detail="User not found")
     await session.delete(user)
     await session.commit()
+    get_user_cache().invalidate(user_id)
     return {"status": "deleted"}
 # --- end Admin Users Management ---
 
 
 
-# Mount static files for frontend
+# Serve the built frontend
 
 frontend_dist = pathlib.Path(__file__).parent / "frontend" / "dist"
-image_extensions = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".svg", ".ico", ".bmp", ".tiff"}
 if frontend_dist.exists():
-    # Mount static files at /assets (Vite default)
-    app.mount("/assets", StaticFiles(directory=frontend_dist / "assets"), name="assets")
-
-    # SPA fallback and image serving for all other paths
-    @app.get("/{full_path:path}")
-    async def spa_fallback(full_path: str):
-        # Restrict fallback for paths starting with /admin/api or /client/api
-        if full_path.startswith("admin/api") or full_path.startswith("client/api"):
-            return {"detail": "Not Found"}, 404
-
-        file_path = frontend_dist / full_path
-        ext = file_path.suffix.lower()
-        if file_path.exists() and file_path.is_file() and ext in image_extensions:
-            return FileResponse(file_path)
-        index_file = frontend_dist / "index.html"
-        if index_file.exists():
-            return FileResponse(index_file)
-        return {"detail": "Not Found"}, 404
+    frontend = FrontendServer(frontend_dist)
+
+    # Vite assets, root-level images, and index.html for every other (client-side) route
+    @app.api_route("/{full_path:path}", methods=["GET", "HEAD"])
+    async def spa_fallback(full_path: str, request: Request):
+        return frontend.respond(request, full_path)
@@ -0,0 +1,230 @@
+"""
+Micro-benchmarks for Nebula Tower hot paths.
+
+Usage:
+  python benchmark.py render --hosts 1000
+  python benchmark.py login --logins 50 --concurrency 10
+  python benchmark.py db --users 1000 --tasks 20 --ops 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import yaml
+
+from config_template import config_template, YamlDumper
+from vars import PASSWORD_ARGON2_MEMORY_COST, PASSWORD_ARGON2_TIME_COST, PASSWORD_HASH_WORKERS
+
+
+def _report(label: str, count: int, elapsed: float) -> None:
+    print(f"{label}: {count} in {elapsed:.3f}s ({elapsed / count * 1000:.3f} ms each)")
+
+
+def bench_render(args: argparse.Namespace) -> None:
+    """
+    Per-host config render cost: the old copy + parse + pure-Python dump path
+    against rendering from the cached template.
+    """
+    from routers.hosts_router import host_config_overrides
+
+    print(f"YAML dumper: {YamlDumper.__name__}")
+    overrides = host_config_overrides("benchorg")
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "config.yaml")
+
+        start = time.perf_counter()
+        for _ in range(args.hosts):
+            with open(config_template.path, 'r') as f:
+                config = yaml.safe_load(f)
+            config.update(overrides)
+            with open(out, 'w') as f:
+                yaml.safe_dump(config, f)
+        _report("parse + safe_dump per host", args.hosts, time.perf_counter() - start)
+
+        config_template.tree()  # warm the cache
+        start = time.perf_counter()
+        for _ in range(args.hosts):
+            config_template.write(out, overrides)
+        _report("cached template render", args.hosts, time.perf_counter() - start)
+
+
+def bench_login(args: argparse.Namespace) -> None:
+    """
+    Login throughput through /auth/jwt/login, and the longest the event loop
+    (every other request in the worker) was blocked meanwhile, with password
+    verification on the event loop against on the password thread pool.
+    """
+    tmp = tempfile.TemporaryDirectory()
+    # Before api is imported, which creates the engine
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp.name}/bench.db"
+    import httpx
+    from fastapi import Depends
+
+    import api
+    from password_hashing import AsyncPasswordHelper
+
+    class InlinePasswordHelper(AsyncPasswordHelper):
+        # Hashes on the calling thread, as fastapi-users' PasswordHelper does
+        async def hash_async(self, password: str) -> str:
+            return self.hash(password)
+
+        async def verify_and_update_async(self, plain_password: str, hashed_password: str):
+            return self.verify_and_update(plain_password, hashed_password)
+
+    email, password = "bench@example.com", "bench-password"
+
+    async def login_round(client: httpx.AsyncClient, helper: AsyncPasswordHelper) -> tuple[float, float]:
+        async def user_manager(user_db=Depends(api.get_user_db)):
+            yield api.UserManager(user_db, helper)
+        api.app.dependency_overrides[api.get_user_manager] = user_manager
+
+        slots = asyncio.Semaphore(args.concurrency)
+        done = asyncio.Event()
+        max_stall = 0.0
+
+        async def login() -> None:
+            async with slots:
+                r = await client.post("/auth/jwt/login", data={"username": email, "password": password})
+                r.raise_for_status()
+
+        async def probe() -> None:
+            nonlocal max_stall
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.001)
+                max_stall = max(max_stall, time.perf_counter() - start - 0.001)
+
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(args.logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+        return elapsed, max_stall
+
+    async def run() -> None:
+        async with api.engine.begin() as conn:
+            await conn.run_sync(api.Base.metadata.create_all)
+        pool = AsyncPasswordHelper(time_cost=args.time_cost, memory_cost=args.memory_cost, workers=args.workers)
+        async with api.async_session_maker() as session:
+            session.add(api.User(email=email, hashed_password=pool.hash(password), is_active=True, is_verified=True))
+            await session.commit()
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for label, helper in (
+                ("on the event loop", InlinePasswordHelper(time_cost=args.time_cost, memory_cost=args.memory_cost, workers=1)),
+                (f"thread pool ({args.workers} workers)", pool),
+            ):
+                elapsed, max_stall = await login_round(client, helper)
+                _report(f"logins, argon2 t={args.time_cost} m={args.memory_cost}KiB, {label}", args.logins, elapsed)
+                print(f"  {args.logins / elapsed:.1f} logins/s, event loop blocked up to {max_stall * 1000:.1f} ms")
+        api.app.dependency_overrides.clear()
+        await api.engine.dispose()
+
+    try:
+        asyncio.run(run())
+    finally:
+        tmp.cleanup()
+
+
+def bench_db(args: argparse.Namespace) -> None:
+    """
+    User database read/write throughput under concurrent sessions: a
+    default SQLAlchemy engine against the tuned one from create_db_engine().
+    """
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp.name}/app.db"
+    import uuid
+
+    from sqlalchemy import update
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    import api
+
+    async def run_engine(engine) -> tuple[int, int, int, float]:
+        async with engine.begin() as conn:
+            await conn.run_sync(api.Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        ids = [uuid.uuid4() for _ in range(args.users)]
+        async with session_maker() as session:
+            session.add_all(
+                api.User(id=user_id, email=f"user{i}@example.com", hashed_password="x") for i, user_id in enumerate(ids)
+            )
+            await session.commit()
+
+        reads = writes = errors = 0
+
+        async def worker(seed: int) -> None:
+            nonlocal reads, writes, errors
+            rng = random.Random(seed)
+            for _ in range(args.ops):
+                user_id = rng.choice(ids)
+                try:
+                    async with session_maker() as session:
+                        if rng.random() < args.write_ratio:
+                            await session.execute(
+                                update(api.User).where(api.User.id == user_id).values(is_verified=rng.random() < 0.5)
+                            )
+                            await session.commit()
+                            writes += 1
+                        else:
+                            await session.get(api.User, user_id)
+                            reads += 1
+                except OperationalError:
+                    # "database is locked"
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(seed) for seed in range(args.tasks)))
+        elapsed = time.perf_counter() - start
+        await engine.dispose()
+        return reads, writes, errors, elapsed
+
+    async def run() -> None:
+        for label, engine in (
+            ("default engine", create_async_engine(f"sqlite+aiosqlite:///{tmp.name}/default.db")),
+            ("tuned engine", api.create_db_engine(f"sqlite+aiosqlite:///{tmp.name}/tuned.db")),
+        ):
+            reads, writes, errors, elapsed = await run_engine(engine)
+            _report(f"{label}: sessions", reads + writes + errors, elapsed)
+            print(f"  {reads / elapsed:.0f} reads/s, {writes / elapsed:.0f} writes/s, {errors} failed with database is locked")
+
+    try:
+        asyncio.run(run())
+    finally:
+        tmp.cleanup()
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Nebula Tower micro-benchmarks")
+    sub = p.add_subparsers(dest="bench", required=True)
+
+    render = sub.add_parser("render", help="Host config.yaml render cost")
+    render.add_argument("--hosts", type=int, default=500, help="Number of host configs to render")
+    render.set_defaults(func=bench_render)
+
+    login = sub.add_parser("login", help="Login throughput and event loop blocking during password checks")
+    login.add_argument("--logins", type=int, default=50, help="Number of logins")
+    login.add_argument("--concurrency", type=int, default=10, help="Logins in flight at once")
+    login.add_argument("--time-cost", type=int, default=PASSWORD_ARGON2_TIME_COST, help="Argon2 passes")
+    login.add_argument("--memory-cost", type=int, default=PASSWORD_ARGON2_MEMORY_COST, help="Argon2 memory in KiB")
+    login.add_argument("--workers", type=int, default=PASSWORD_HASH_WORKERS, help="Password thread pool size")
+    login.set_defaults(func=bench_login)
+
+    db = sub.add_parser("db", help="User database throughput with concurrent sessions")
+    db.add_argument("--users", type=int, default=1000, help="Users in the database")
+    db.add_argument("--tasks", type=int, default=20, help="Concurrent sessions")
+    db.add_argument("--ops", type=int, default=200, help="Operations per session task")
+    db.add_argument("--write-ratio", type=float, default=0.2, help="Share of operations that are writes")
+    db.set_defaults(func=bench_db)
+
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    args.func(args)
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Optional
+
+from nebula_api import AsyncNebulaAPI, get_nebula_api
+from nebula_cert import CERTIFICATE_V2_BANNER, CertificateV2, pem_blocks
+
+
+def _stamp(path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _print_in_process(path: str) -> Optional[str]:
+    """
+    Render `nebula-cert print -json` output for a file of v2 certificates
+    without forking. Returns None if the file holds anything else (e.g. v1).
+    """
+    with open(path, 'rb') as f:
+        blocks = pem_blocks(f.read())
+    if not blocks or any(banner != CERTIFICATE_V2_BANNER for banner, _ in blocks):
+        return None
+    try:
+        certs = [CertificateV2.unmarshal(raw).to_json() for _, raw in blocks]
+    except ValueError:
+        return None
+    return json.dumps(certs)
+
+
+class CertInfoCache:
+    """
+    In-memory cache of certificate details (`nebula-cert print -json`).
+
+    Entries are keyed by path and validated against the file's mtime and
+    size, so a re-signed certificate is picked up even without an explicit
+    invalidate(). v2 certificates are parsed in-process; anything else is
+    printed once through nebula-cert and then served from memory.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, tuple[tuple, str, object]] = {}
+        self._lock = threading.Lock()
+        self._nebula = get_nebula_api()
+        self._async_nebula = AsyncNebulaAPI()
+
+    def _lookup(self, path: str, stamp: tuple) -> Optional[tuple[str, object]]:
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is not None and entry[0] == stamp:
+            return entry[1], entry[2]
+        return None
+
+    def _store(self, path: str, stamp: tuple, text: str) -> object:
+        try:
+            parsed = json.loads(text)
+        except ValueError:
+            # Error output from nebula-cert; don't cache it
+            return None
+        with self._lock:
+            self._entries[path] = (stamp, text, parsed)
+        return parsed
+
+    def get(self, path: str) -> str:
+        """
+        Return the JSON details string for the certificate at path.
+        """
+        path = os.path.abspath(path)
+        stamp = _stamp(path)
+        if stamp is None:
+            return self._nebula.print_cert(path)
+        hit = self._lookup(path, stamp)
+        if hit is not None:
+            return hit[0]
+        text = _print_in_process(path)
+        if text is None:
+            text = self._nebula.print_cert(path)
+        self._store(path, stamp, text)
+        return text
+
+    async def get_async(self, path: str) -> str:
+        """
+        Same as get(), without blocking the event loop on a cache miss.
+        """
+        path = os.path.abspath(path)
+        stamp = await asyncio.to_thread(_stamp, path)
+        if stamp is None:
+            return await self._async_nebula.print_cert(path)
+        hit = self._lookup(path, stamp)
+        if hit is not None:
+            return hit[0]
+        text = await asyncio.to_thread(_print_in_process, path)
+        if text is None:
+            text = await self._async_nebula.print_cert(path)
+        self._store(path, stamp, text)
+        return text
+
+    def get_json(self, path: str):
+        """
+        Return the parsed details, or None if they could not be read.
+        """
+        path = os.path.abspath(path)
+        stamp = _stamp(path)
+        if stamp is not None:
+            hit = self._lookup(path, stamp)
+            if hit is not None:
+                return hit[1]
+        text = self.get(path)
+        try:
+            return json.loads(text)
+        except ValueError:
+            return None
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        """
+        Drop the cached entry for path, or every entry if path is None.
+        """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(path), None)
+
+
+cert_info_cache = CertInfoCache()
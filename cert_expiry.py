@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from typing import Optional
+
+from cert_cache import cert_info_cache
+from vars import DATA_DIR, ORGS_DIR
+
+LIGHTHOUSE_CERT = os.path.join(DATA_DIR, 'lighthouse', 'host.crt')
+# Certificates written by other worker processes are picked up by a periodic rescan
+RESCAN_INTERVAL = 300
+
+
+def _stamp(path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _parse_time(value: str) -> int:
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+
+
+def cert_not_after(path: str) -> Optional[int]:
+    """
+    Return the notAfter (unix time) of the certificate at path, or None if it can't be read.
+    """
+    certs = cert_info_cache.get_json(path)
+    if not certs:
+        return None
+    try:
+        return _parse_time(certs[0]["details"]["notAfter"])
+    except (KeyError, TypeError, ValueError, IndexError):
+        return None
+
+
+def _describe(path: str) -> dict:
+    """
+    Work out which host a certificate path belongs to.
+    """
+    path = os.path.abspath(path)
+    if path == os.path.abspath(LIGHTHOUSE_CERT):
+        return {"kind": "lighthouse", "org": None, "name": "lighthouse1"}
+    # ORGS_DIR/<org>/hosts/<name>/host.crt
+    host_dir = os.path.dirname(path)
+    org_dir = os.path.dirname(os.path.dirname(host_dir))
+    return {"kind": "host", "org": os.path.basename(org_dir), "name": os.path.basename(host_dir)}
+
+
+class CertExpiryIndex:
+    """
+    Index of certificate expiry times: every host.crt under ORGS_DIR plus the lighthouse cert.
+
+    Entries are kept in a list sorted by notAfter, so "everything expiring
+    before T" is a single bisect. Certificates are parsed once (through the
+    certificate cache) and re-read only when their mtime/size changes;
+    create_certs calls update() so new certificates are indexed immediately.
+    """
+
+    def __init__(self, orgs_dir: str = ORGS_DIR, lighthouse_cert: str = LIGHTHOUSE_CERT):
+        self.orgs_dir = orgs_dir
+        self.lighthouse_cert = lighthouse_cert
+        self._lock = threading.Lock()
+        # path -> (stamp, not_after)
+        self._entries: dict[str, tuple[tuple, int]] = {}
+        self._by_expiry: list[tuple[int, str]] = []
+        self._last_scan: Optional[float] = None
+
+    def _paths(self):
+        if os.path.isdir(self.orgs_dir):
+            for org in os.listdir(self.orgs_dir):
+                hosts_dir = os.path.join(self.orgs_dir, org, 'hosts')
+                if not os.path.isdir(hosts_dir):
+                    continue
+                for name in os.listdir(hosts_dir):
+                    path = os.path.join(hosts_dir, name, 'host.crt')
+                    if os.path.exists(path):
+                        yield os.path.abspath(path)
+        if os.path.exists(self.lighthouse_cert):
+            yield os.path.abspath(self.lighthouse_cert)
+
+    def scan(self) -> int:
+        """
+        Walk ORGS_DIR and the lighthouse dir, (re)indexing changed certificates
+        and dropping deleted ones. Returns the number of indexed certificates.
+        """
+        seen = set()
+        for path in self._paths():
+            seen.add(path)
+            self.update(path)
+        with self._lock:
+            for path in set(self._entries) - seen:
+                self._drop(path)
+            self._last_scan = time.monotonic()
+            return len(self._entries)
+
+    def update(self, path: str) -> Optional[int]:
+        """
+        (Re)index one certificate, e.g. right after it was signed. Returns its notAfter.
+        """
+        path = os.path.abspath(path)
+        stamp = _stamp(path)
+        if stamp is None:
+            self.remove(path)
+            return None
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+        not_after = cert_not_after(path)
+        with self._lock:
+            self._drop(path)
+            if not_after is not None:
+                self._entries[path] = (stamp, not_after)
+                insort(self._by_expiry, (not_after, path))
+        return not_after
+
+    def remove(self, path: str) -> None:
+        with self._lock:
+            self._drop(os.path.abspath(path))
+
+    def remove_host_dir(self, host_dir: str) -> None:
+        self.remove(os.path.join(host_dir, 'host.crt'))
+
+    def _drop(self, path: str) -> None:
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            del self._by_expiry[bisect_left(self._by_expiry, (entry[1], path))]
+
+    def _ensure_fresh(self) -> None:
+        if self._last_scan is None or time.monotonic() - self._last_scan > RESCAN_INTERVAL:
+            self.scan()
+
+    def expiring(self, within_seconds: float, limit: Optional[int] = None) -> list[dict]:
+        """
+        Certificates whose notAfter is within `within_seconds` from now
+        (including already expired ones), soonest first.
+        """
+        self._ensure_fresh()
+        cutoff = int(time.time() + within_seconds)
+        with self._lock:
+            end = bisect_right(self._by_expiry, (cutoff, "\uffff"))
+            if limit is not None:
+                end = min(end, limit)
+            selected = self._by_expiry[:end]
+        return [{"path": path, "not_after": not_after, **_describe(path)} for not_after, path in selected]
+
+    def summary(self) -> dict:
+        self._ensure_fresh()
+        now = time.time()
+        with self._lock:
+            total = len(self._by_expiry)
+            expired = bisect_right(self._by_expiry, (int(now), "\uffff"))
+            soonest = self._by_expiry[0] if self._by_expiry else None
+        return {
+            "total": total,
+            "expired": expired,
+            "next_expiry": {"path": soonest[1], "not_after": soonest[0], **_describe(soonest[1])} if soonest else None,
+        }
+
+
+cert_expiry_index = CertExpiryIndex()
@@ -0,0 +1,192 @@
+import fcntl
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from vars import CERT_RENEW_LOCK, CERT_RENEW_RATE, SIGN_WORKERS
+
+# Per-job cap on the error messages kept for the progress report
+MAX_REPORTED_ERRORS = 50
+
+
+class RateLimiter:
+    """
+    Spaces calls out to at most `rate` per second across all worker threads.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class RenewalJob:
+    """
+    One bulk renewal run over a fixed list of certificates, with progress counters.
+    """
+
+    def __init__(self, targets: list[dict], window_days: float, trigger: str):
+        self.id = uuid.uuid4().hex
+        self.targets = targets
+        self.window_days = window_days
+        self.trigger = trigger
+        self.status = "pending"
+        self.renewed = 0
+        self.failed = 0
+        self.errors: list[dict] = []
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def _record(self, target: dict, error: Optional[str]) -> None:
+        with self._lock:
+            if error is None:
+                self.renewed += 1
+                return
+            self.failed += 1
+            if len(self.errors) < MAX_REPORTED_ERRORS:
+                self.errors.append({"org": target.get("org"), "name": target.get("name"), "error": error})
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            done = self.renewed + self.failed
+            total = len(self.targets)
+            elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+            return {
+                "id": self.id,
+                "status": self.status,
+                "trigger": self.trigger,
+                "window_days": self.window_days,
+                "total": total,
+                "renewed": self.renewed,
+                "failed": self.failed,
+                "remaining": total - done,
+                "progress": done / total if total else 1.0,
+                "rate_per_second": done / elapsed if elapsed else 0.0,
+                "errors": list(self.errors),
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class RenewalManager:
+    """
+    Runs bulk certificate renewal jobs, one at a time, in a background thread.
+
+    Each job re-signs its targets on a pool of SIGN_WORKERS threads, paced by
+    a shared rate limit (CERT_RENEW_RATE certificates per second) so a large
+    renewal doesn't starve the API of CPU or the CA key of I/O. A running job
+    holds a flock on `lock_path`, so with several worker processes a manual
+    renewal on one can't overlap a scheduled one on another.
+    """
+
+    def __init__(self, renew: Callable[[dict], None], workers: int = SIGN_WORKERS, rate: float = CERT_RENEW_RATE,
+                 lock_path: str = CERT_RENEW_LOCK):
+        # renew(target) re-signs one certificate and raises on failure
+        self.renew = renew
+        self.workers = workers
+        self.rate = rate
+        self.lock_path = lock_path
+        self._jobs: dict[str, RenewalJob] = {}
+        self._current: Optional[RenewalJob] = None
+        self._lock = threading.Lock()
+
+    def start(self, targets: list[dict], window_days: float, trigger: str = "manual") -> RenewalJob:
+        """
+        Start a job renewing targets. Raises RuntimeError if one is already running.
+        """
+        with self._lock:
+            if self._current is not None and self._current.status in ("pending", "running"):
+                raise RuntimeError(f"Renewal job {self._current.id} is already running")
+            lock_fd = self._acquire_lock()
+            job = RenewalJob(targets, window_days, trigger)
+            self._jobs[job.id] = job
+            self._current = job
+        threading.Thread(target=self._run, args=(job, lock_fd), name=f"cert-renewal-{job.id[:8]}", daemon=True).start()
+        return job
+
+    def _acquire_lock(self) -> int:
+        """
+        Take the cross-process renewal lock. Raises RuntimeError if another
+        worker holds it.
+        """
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            raise RuntimeError("A renewal job is already running")
+        return fd
+
+    def get(self, job_id: str) -> Optional[RenewalJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> list[RenewalJob]:
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def current(self) -> Optional[RenewalJob]:
+        with self._lock:
+            return self._current
+
+    def _run(self, job: RenewalJob, lock_fd: int) -> None:
+        try:
+            self._run_job(job)
+        finally:
+            # Closing the descriptor releases the flock
+            os.close(lock_fd)
+
+    def _run_job(self, job: RenewalJob) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        limiter = RateLimiter(self.rate)
+
+        def renew_one(target: dict) -> None:
+            if job.cancelled:
+                return
+            limiter.wait()
+            if job.cancelled:
+                return
+            try:
+                self.renew(target)
+            except Exception as e:
+                job._record(target, str(e))
+            else:
+                job._record(target, None)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="cert-renew") as pool:
+            for _ in pool.map(renew_one, job.targets):
+                pass
+        job.finished_at = time.time()
+        if job.cancelled:
+            job.status = "cancelled"
+        elif job.failed:
+            job.status = "completed_with_errors"
+        else:
+            job.status = "completed"
+        print(f"Certificate renewal job {job.id} {job.status}: {job.renewed} renewed, {job.failed} failed")
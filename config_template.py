@@ -0,0 +1,58 @@
+import os
+import threading
+from typing import Optional
+
+import yaml
+
+from vars import ROOT_DIR
+
+# Prefer the libyaml-backed loader/dumper; fall back to the pure-Python ones
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+TEMPLATE_PATH = os.path.join(ROOT_DIR, 'config.yml.example')
+
+
+class ConfigTemplate:
+    """
+    Parsed copy of config.yml.example, loaded once and reloaded when its mtime changes.
+
+    Host configs are rendered by overlaying per-host top-level sections
+    (static_host_map, lighthouse, firewall, pki, ...) onto a copy of the
+    cached tree and emitting the result directly, instead of copying the
+    example into the host directory and re-parsing it.
+    """
+
+    def __init__(self, path: str = TEMPLATE_PATH):
+        self.path = path
+        self._tree: Optional[dict] = None
+        self._mtime_ns: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def tree(self) -> dict:
+        """
+        Return the cached template tree. Treat it as read-only; render() copies it.
+        """
+        mtime_ns = os.stat(self.path).st_mtime_ns
+        with self._lock:
+            if self._tree is None or self._mtime_ns != mtime_ns:
+                with open(self.path, 'r') as f:
+                    self._tree = yaml.load(f, Loader=YamlLoader) or {}
+                self._mtime_ns = mtime_ns
+            return self._tree
+
+    def build(self, overrides: dict) -> dict:
+        # Overrides replace whole top-level sections, so a shallow copy is enough
+        config = dict(self.tree())
+        config.update(overrides)
+        return config
+
+    def render(self, overrides: dict) -> str:
+        return yaml.dump(self.build(overrides), Dumper=YamlDumper)
+
+    def write(self, path: str, overrides: dict) -> None:
+        with open(path, 'w') as f:
+            yaml.dump(self.build(overrides), f, Dumper=YamlDumper)
+
+
+config_template = ConfigTemplate()
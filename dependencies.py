@@ -1,5 +1,40 @@
+import asyncio
+import hashlib
+import math
+from typing import Callable, Optional
+
+from fastapi import HTTPException, Request
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
+from rate_limiter import get_rate_limiter, parse_rate
+
 # Define the limiter here, so it can be imported by your main app and routers.
-limiter = Limiter(key_func=get_remote_address)
\ No newline at end of file
+# Its counters are per process; use rate_limit() where limits must hold across workers.
+limiter = Limiter(key_func=get_remote_address)
+
+
+def rate_limit(scope: str, rate: str, key_func: Callable[[Request], Optional[str]]):
+    """
+    FastAPI dependency enforcing `rate` (e.g. "5/minute") per key_func(request),
+    shared by all worker processes. Requests without a key aren't limited.
+    Rejects with 429 and Retry-After before the endpoint does any work.
+    """
+    # Fail at import time on a malformed limit
+    parse_rate(rate)
+
+    async def check(request: Request) -> None:
+        key = key_func(request)
+        if not key:
+            return
+        # Keys can be secrets (invite codes), so only a digest is stored
+        digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+        allowed, retry_after = await asyncio.to_thread(get_rate_limiter().hit, f"{scope}:{digest}", rate)
+        if not allowed:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Rate limit exceeded: {rate}",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+    return check
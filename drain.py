@@ -0,0 +1,59 @@
+import signal
+import threading
+from typing import Callable
+
+_draining = threading.Event()
+_callbacks: list[Callable[[], None]] = []
+_callbacks_lock = threading.Lock()
+
+
+def draining() -> bool:
+    """
+    True once the server has started shutting down; long-lived responses should wrap up.
+    """
+    return _draining.is_set()
+
+
+def on_drain(callback: Callable[[], None]) -> None:
+    """
+    Call `callback` when draining starts, e.g. to release long-poll waiters.
+    """
+    with _callbacks_lock:
+        _callbacks.append(callback)
+
+
+def begin_drain() -> None:
+    """
+    Start draining: mark the process as shutting down and run the on_drain callbacks.
+    """
+    if _draining.is_set():
+        return
+    _draining.set()
+    with _callbacks_lock:
+        callbacks = list(_callbacks)
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception as e:
+            print(f"Drain callback failed: {e}")
+
+
+def install_signal_handlers() -> None:
+    """
+    Start draining on SIGTERM/SIGINT, then hand the signal on to the server's
+    own handler (uvicorn's, which stops accepting and waits for in-flight
+    requests). Must run in the main thread after the server set its handlers,
+    e.g. from the app's lifespan startup.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+
+        def handler(signum, frame, previous=previous):
+            begin_drain()
+            previous(signum, frame)
+
+        signal.signal(sig, handler)
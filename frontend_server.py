@@ -0,0 +1,176 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import pathlib
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import FileResponse, JSONResponse, Response
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+# Vite fingerprints everything it writes to assets/ (index-BZ3x8a_k.js), so those never change
+HASHED_ASSET_RE = re.compile(r'^assets/.+[-.][A-Za-z0-9_-]{8,}\.\w+$')
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Everything else (index.html above all) is revalidated through its ETag
+REVALIDATE = "no-cache"
+
+# Served from memory, with gzip/brotli variants; anything else is served from disk
+COMPRESSIBLE_TYPES = {"application/javascript", "text/javascript", "application/json", "application/xml",
+                      "image/svg+xml", "application/wasm", "application/manifest+json"}
+MIN_COMPRESS_SIZE = 1024
+
+# Root-level files (copied from public/) served as themselves; other paths get index.html
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".svg", ".ico", ".bmp", ".tiff"}
+API_PREFIXES = ("admin/api", "client/api")
+
+
+@dataclass
+class StaticFile:
+    path: pathlib.Path
+    media_type: str
+    etag: str
+    cache_control: str
+    stat: os.stat_result
+    # None for files served from disk
+    body: Optional[bytes] = None
+    # content-encoding -> compressed body
+    encodings: dict[str, bytes] = field(default_factory=dict)
+
+
+def _compressible(media_type: str) -> bool:
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+
+def _precompressed(path: pathlib.Path, suffix: str, body: bytes, compress) -> Optional[bytes]:
+    """
+    The compressed variant of a file: a prebuilt `<file><suffix>` next to it
+    when it's up to date, else compressed now and written there for the next
+    worker. Returns None if compressing doesn't make the file smaller.
+    """
+    variant = path.with_name(path.name + suffix)
+    try:
+        if variant.stat().st_mtime_ns >= path.stat().st_mtime_ns:
+            return variant.read_bytes()
+    except FileNotFoundError:
+        pass
+    data = compress(body)
+    if len(data) >= len(body):
+        return None
+    tmp = variant.with_name(f"{variant.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, variant)
+    except OSError:
+        # Read-only dist; keep the variant in memory only
+        pass
+    return data
+
+
+def _accepted_encodings(accept_encoding: str) -> set[str]:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class FrontendServer:
+    """
+    Serves the built frontend (frontend/dist) from a manifest made once at
+    startup, so requests don't touch the filesystem to find files.
+
+    index.html and other text assets are held in memory together with gzip
+    and (when the brotli package is installed) brotli variants; variants
+    are written next to the files, and prebuilt .gz/.br files are used as
+    they are. Fingerprinted Vite assets are sent as immutable, everything
+    else is revalidated through its ETag. Rebuilding the frontend needs a
+    restart to be picked up.
+    """
+
+    def __init__(self, dist_dir: pathlib.Path):
+        self.dist_dir = pathlib.Path(dist_dir)
+        self.files: dict[str, StaticFile] = {}
+        self.index: Optional[StaticFile] = None
+        self.load()
+
+    def load(self) -> None:
+        files = {}
+        for path in sorted(self.dist_dir.rglob("*")):
+            if not path.is_file() or path.suffix in (".gz", ".br") or path.name.endswith(".tmp"):
+                continue
+            rel = path.relative_to(self.dist_dir).as_posix()
+            files[rel] = self._load_file(rel, path)
+        self.files = files
+        self.index = files.get("index.html")
+
+    def _load_file(self, rel: str, path: pathlib.Path) -> StaticFile:
+        stat = path.stat()
+        media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        cache_control = IMMUTABLE if HASHED_ASSET_RE.match(rel) else REVALIDATE
+        if not _compressible(media_type):
+            return StaticFile(path, media_type, f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"', cache_control, stat)
+        body = path.read_bytes()
+        static = StaticFile(path, media_type, f'"{hashlib.md5(body).hexdigest()}"', cache_control, stat, body)
+        if len(body) >= MIN_COMPRESS_SIZE:
+            variants = [("gzip", ".gz", lambda data: gzip.compress(data, 9, mtime=0))]
+            if brotli is not None:
+                variants.insert(0, ("br", ".br", brotli.compress))
+            for encoding, suffix, compress in variants:
+                data = _precompressed(path, suffix, body, compress)
+                if data is not None:
+                    static.encodings[encoding] = data
+        return static
+
+    def lookup(self, full_path: str) -> Optional[StaticFile]:
+        """
+        The file to answer `full_path` with: an asset, a root-level image, or
+        index.html for client-side routes. None for missing assets and API paths.
+        """
+        if full_path.startswith(API_PREFIXES):
+            return None
+        static = self.files.get(full_path)
+        if full_path.startswith("assets/"):
+            return static
+        if static is not None and static.path.suffix.lower() in IMAGE_EXTENSIONS:
+            return static
+        return self.index
+
+    def respond(self, request: Request, full_path: str) -> Response:
+        static = self.lookup(full_path)
+        if static is None:
+            return JSONResponse({"detail": "Not Found"}, status_code=404)
+        body, encoding = static.body, None
+        if static.encodings:
+            accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+            for name, data in static.encodings.items():
+                if name in accepted:
+                    body, encoding = data, name
+                    break
+        # Each representation gets its own strong ETag ("<md5>-br", "<md5>-gzip")
+        etag = f'{static.etag[:-1]}-{encoding}"' if encoding else static.etag
+        headers = {"Cache-Control": static.cache_control, "ETag": etag}
+        if static.encodings:
+            headers["Vary"] = "Accept-Encoding"
+        if etag in (tag.strip() for tag in request.headers.get("if-none-match", "").split(",")):
+            return Response(status_code=304, headers=headers)
+        if static.body is None:
+            return FileResponse(static.path, media_type=static.media_type, headers=headers, stat_result=static.stat)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type=static.media_type, headers=headers)
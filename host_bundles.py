@@ -0,0 +1,150 @@
+import hashlib
+import os
+import threading
+import time
+import zipfile
+from typing import Optional
+
+from vars import BUNDLES_DIR, BUNDLE_RETIRE_GRACE
+
+BUNDLE_FILES = ["config.yaml", "host.crt", "host.key", "ca.crt"]
+# Fixed timestamp so the same inputs always produce byte-identical zips
+_ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def _input_stamp(host_dir: str) -> tuple:
+    stamp = []
+    for fname in BUNDLE_FILES:
+        try:
+            st = os.stat(os.path.join(host_dir, fname))
+        except FileNotFoundError:
+            continue
+        stamp.append((fname, st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+
+class HostBundleStore:
+    """
+    Pre-built host config bundles (config.yaml, host.crt, host.key, ca.crt).
+
+    Each bundle is zipped once when its inputs change and stored on disk
+    under the SHA-256 of its contents, which doubles as the ETag. Requests
+    only stat the inputs to decide whether the cached bundle is current.
+    Superseded bundles are deleted `grace` seconds later by a background
+    sweep, so downloads (in any worker) that already picked one can finish.
+    """
+
+    def __init__(self, bundles_dir: str = BUNDLES_DIR, grace: float = BUNDLE_RETIRE_GRACE):
+        self.bundles_dir = bundles_dir
+        self.grace = grace
+        self._index: dict[str, tuple[tuple, str, str]] = {}
+        # Superseded bundle path -> when it may be deleted
+        self._retired: dict[str, float] = {}
+        self._sweep_timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def get(self, host_dir: str) -> tuple[str, str]:
+        """
+        Return (digest, path) of the current bundle for host_dir, building it if needed.
+        """
+        host_dir = os.path.abspath(host_dir)
+        stamp = _input_stamp(host_dir)
+        with self._lock:
+            entry = self._index.get(host_dir)
+        if entry is not None and entry[0] == stamp and os.path.exists(entry[2]):
+            return entry[1], entry[2]
+        return self.build(host_dir)
+
+    def build(self, host_dir: str) -> tuple[str, str]:
+        """
+        (Re)build the bundle for host_dir and return (digest, path).
+        """
+        host_dir = os.path.abspath(host_dir)
+        stamp = _input_stamp(host_dir)
+        contents = []
+        sha = hashlib.sha256()
+        for fname in BUNDLE_FILES:
+            fpath = os.path.join(host_dir, fname)
+            if not os.path.exists(fpath):
+                continue
+            with open(fpath, "rb") as f:
+                data = f.read()
+            contents.append((fname, data))
+            sha.update(f"{fname}:{len(data)}:".encode())
+            sha.update(data)
+        digest = sha.hexdigest()
+
+        # Bundles hold host private keys: owner-only directory and files
+        os.makedirs(self.bundles_dir, mode=0o700, exist_ok=True)
+        os.chmod(self.bundles_dir, 0o700)
+        path = os.path.join(self.bundles_dir, f"{digest}.zip")
+        if os.path.exists(path):
+            # Bundles written before they were created 0600
+            os.chmod(path, 0o600)
+        else:
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "wb") as f, zipfile.ZipFile(f, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+                for fname, data in contents:
+                    info = zipfile.ZipInfo(fname, date_time=_ZIP_DATE_TIME)
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    info.external_attr = 0o600 << 16
+                    zf.writestr(info, data)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            previous = self._index.get(host_dir)
+            self._index[host_dir] = (stamp, digest, path)
+            # Rebuilt with the same contents again: no longer due for deletion
+            self._retired.pop(path, None)
+            if previous is not None and previous[2] != path:
+                # The old bundle holds a superseded key and cert; don't leave it around
+                self._retire(previous[2])
+        return digest, path
+
+    def invalidate(self, host_dir: str) -> Optional[str]:
+        """
+        Forget the bundle for host_dir (e.g. when the host is deleted) and
+        schedule it for deletion.
+        """
+        with self._lock:
+            entry = self._index.pop(os.path.abspath(host_dir), None)
+            if entry is None:
+                return None
+            self._retire(entry[2])
+        return entry[2]
+
+    def _retire(self, path: str) -> None:
+        # Callers hold _lock
+        self._retired[path] = time.monotonic() + self.grace
+        if self._sweep_timer is None:
+            self._sweep_timer = threading.Timer(self.grace, self.sweep)
+            self._sweep_timer.daemon = True
+            self._sweep_timer.start()
+
+    def sweep(self, force: bool = False) -> None:
+        """
+        Delete the superseded bundles whose grace period is over (all of them
+        with force, e.g. on shutdown), and schedule the next sweep if any remain.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._sweep_timer is not None:
+                self._sweep_timer.cancel()
+                self._sweep_timer = None
+            due = [path for path, at in self._retired.items() if force or at <= now]
+            for path in due:
+                del self._retired[path]
+            if self._retired:
+                delay = max(0.0, min(self._retired.values()) - now)
+                self._sweep_timer = threading.Timer(delay, self.sweep)
+                self._sweep_timer.daemon = True
+                self._sweep_timer.start()
+        for path in due:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+host_bundles = HostBundleStore()
@@ -0,0 +1,147 @@
+import asyncio
+import threading
+from typing import Optional
+
+from drain import draining, on_drain
+from host_registry import HostRegistry, get_registry
+
+# How often (seconds) waiting clients check for changes made by other worker processes
+POLL_INTERVAL = 1.0
+
+
+class HostChangeFeed:
+    """
+    Per-host version counters plus long-poll waits on them.
+
+    A host's version is bumped whenever its config, certificate or CA copy
+    is rewritten. Clients wait with wait_for_change(); a waiter is just a
+    future in a dict, so idle clients cost no threads and no polling of
+    their own. Changes made in this process wake waiters immediately;
+    changes made by other workers are picked up by a single shared poller
+    that checks the registry's change sequence once per POLL_INTERVAL while
+    anyone is waiting.
+    """
+
+    def __init__(self, registry: HostRegistry):
+        self.registry = registry
+        self._waiters: dict[tuple[str, str], set[asyncio.Future]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._poller: Optional[asyncio.Task] = None
+        self._seen_seq: Optional[int] = None
+
+    def bump(self, org: str, name: str) -> Optional[int]:
+        """
+        Record that a host's bundle changed and wake anyone waiting on it.
+        Safe to call from worker threads.
+        """
+        version = self.registry.bump_host_version(org, name)
+        if version is not None:
+            self._notify(org, name, version)
+        return version
+
+    def version(self, org: str, name: str) -> Optional[int]:
+        return self.registry.host_version(org, name)
+
+    def _snapshot(self, org: str, name: str) -> tuple[Optional[int], int]:
+        return self.registry.host_version(org, name), self.registry.change_seq()
+
+    def _notify(self, org: str, name: str, version: int) -> None:
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._wake((org, name), version)
+        else:
+            loop.call_soon_threadsafe(self._wake, (org, name), version)
+
+    def _wake(self, key: tuple[str, str], version: int) -> None:
+        for future in self._waiters.pop(key, ()):
+            if not future.done():
+                future.set_result(version)
+
+    async def wait_for_change(self, org: str, name: str, since: int, timeout: float) -> Optional[int]:
+        """
+        Return the host's version as soon as it is above `since`, or None if
+        that doesn't happen within `timeout` seconds (or the host doesn't exist).
+        """
+        current, seq = await asyncio.to_thread(self._snapshot, org, name)
+        if current is None or current > since or draining():
+            return current
+
+        self._loop = asyncio.get_running_loop()
+        key = (org, name)
+        future = self._loop.create_future()
+        self._waiters.setdefault(key, set()).add(future)
+        # The poller must look at everything after what this waiter has seen
+        self._seen_seq = seq if self._seen_seq is None else min(self._seen_seq, seq)
+        self._ensure_poller()
+        try:
+            # Re-check: the version may have moved while we registered
+            current = await asyncio.to_thread(self.version, org, name)
+            if current is None or current > since:
+                return current
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self._waiters[key]
+
+    def release_waiters(self) -> None:
+        """
+        Answer every waiting client now (as a timeout), e.g. when the server is shutting down.
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+
+        def release():
+            for futures in self._waiters.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_result(None)
+            self._waiters.clear()
+
+        loop.call_soon_threadsafe(release)
+
+    def waiting(self) -> int:
+        return sum(len(futures) for futures in self._waiters.values())
+
+    def _ensure_poller(self) -> None:
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+
+    async def _poll(self) -> None:
+        while self._waiters:
+            await asyncio.sleep(POLL_INTERVAL)
+            seq = await asyncio.to_thread(self.registry.change_seq)
+            if seq == self._seen_seq:
+                continue
+            changed = await asyncio.to_thread(self.registry.hosts_changed_since, self._seen_seq)
+            self._seen_seq = seq
+            for org, name, version in changed:
+                self._wake((org, name), version)
+        self._seen_seq = None
+
+
+_feed: Optional[HostChangeFeed] = None
+_feed_lock = threading.Lock()
+
+
+def get_host_change_feed() -> HostChangeFeed:
+    """
+    Return the process-wide HostChangeFeed over the host registry.
+    """
+    global _feed
+    with _feed_lock:
+        if _feed is None:
+            _feed = HostChangeFeed(get_registry())
+            on_drain(_feed.release_waiters)
+        return _feed
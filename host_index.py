@@ -0,0 +1,207 @@
+import heapq
+import ipaddress
+import json
+import socket
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Optional
+
+from host_registry import HostRegistry, get_registry
+
+# (org, name)
+HostKey = tuple[str, str]
+
+
+def _ip_key(ip: str) -> tuple[int, int]:
+    # inet_pton is much cheaper than ipaddress.ip_address() when indexing the whole fleet
+    try:
+        return (6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big"))
+    except OSError:
+        addr = ipaddress.ip_address(ip)
+        return (addr.version, int(addr))
+
+
+def host_groups(org: str, tags: list[str]) -> list[str]:
+    """
+    Groups a host's certificate is signed with: the synthetic org group plus its tags.
+    """
+    return [f"org_{org}", *tags]
+
+
+class HostIndex:
+    """
+    In-memory secondary indexes over the host registry, for search.
+
+    - groups: inverted index of group -> hosts, including the synthetic
+      org_<org> group every host certificate carries
+    - IPs: sorted (version, int(ip)) array; a CIDR prefix is one contiguous
+      range of it, found with two binary searches
+    - names: sorted (name, org) array, so a name prefix is also one range
+
+    The index follows the registry's change feed for hosts added or removed
+    in this process, and rebuilds itself when hosts_version shows another
+    process changed the registry.
+    """
+
+    def __init__(self, registry: HostRegistry):
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._hosts: dict[HostKey, tuple[str, str]] = {}  # key -> (ip, tags JSON)
+        self._ip_of: dict[HostKey, tuple[int, int]] = {}
+        self._groups: dict[str, set[HostKey]] = {}
+        self._ips: list[tuple[int, int, str, str]] = []
+        self._names: list[tuple[str, str]] = []
+        registry.add_listener(self._on_change)
+
+    # --- maintenance ---
+
+    def _rebuild(self) -> None:
+        version = self.registry.hosts_version()
+        self._hosts.clear()
+        self._ip_of.clear()
+        self._groups.clear()
+        # Raw rows: tags stay JSON until a host is actually returned
+        for row in self.registry.execute("SELECT org, name, ip, tags FROM hosts").fetchall():
+            key = (row["org"], row["name"])
+            self._hosts[key] = (row["ip"], row["tags"])
+            self._ip_of[key] = _ip_key(row["ip"])
+            self._groups.setdefault(f"org_{key[0]}", set()).add(key)
+        for row in self.registry.execute("SELECT tag, org, name FROM host_tags").fetchall():
+            self._groups.setdefault(row["tag"], set()).add((row["org"], row["name"]))
+        self._ips = sorted((*ip, *key) for key, ip in self._ip_of.items())
+        self._names = sorted((name, org) for org, name in self._hosts)
+        self._version = version
+
+    def _add(self, org: str, host: dict) -> None:
+        key = (org, host["name"])
+        if key in self._hosts:
+            self._remove(org, host["name"])
+        self._hosts[key] = (host["ip"], json.dumps(host["tags"]))
+        self._ip_of[key] = _ip_key(host["ip"])
+        for group in host_groups(org, host["tags"]):
+            self._groups.setdefault(group, set()).add(key)
+        insort(self._ips, (*self._ip_of[key], *key))
+        insort(self._names, (host["name"], org))
+
+    def _remove(self, org: str, name: str) -> None:
+        key = (org, name)
+        entry = self._hosts.pop(key, None)
+        if entry is None:
+            return
+        ip_entry = (*self._ip_of.pop(key), *key)
+        del self._ips[bisect_left(self._ips, ip_entry)]
+        del self._names[bisect_left(self._names, (name, org))]
+        for group in host_groups(org, json.loads(entry[1])):
+            members = self._groups.get(group)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del self._groups[group]
+
+    def _host(self, key: HostKey) -> dict:
+        ip, tags = self._hosts[key]
+        return {"org": key[0], "name": key[1], "ip": ip, "tags": json.loads(tags)}
+
+    def _on_change(self, changes: list[tuple], version: int) -> None:
+        with self._lock:
+            if self._version is not None and version <= self._version:
+                # A rebuild already picked these up
+                return
+            if self._version is None or version != self._version + len(changes):
+                # Missed changes from another process; rebuild on next search
+                self._version = None
+                return
+            for action, org, host in changes:
+                if action == "add":
+                    self._add(org, host)
+                else:
+                    self._remove(org, host["name"])
+            self._version = version
+
+    def _sync(self) -> None:
+        if self._version != self.registry.hosts_version():
+            self._rebuild()
+
+    def warm(self) -> int:
+        """
+        Build the index now instead of on the first search. Returns the number of hosts.
+        """
+        with self._lock:
+            self._sync()
+            return len(self._hosts)
+
+    # --- queries ---
+
+    def search(self, org: Optional[str] = None, groups: Optional[list[str]] = None,
+               ip_prefix: Optional[str] = None, name_prefix: Optional[str] = None,
+               limit: Optional[int] = None) -> tuple[list[dict], int]:
+        """
+        Hosts matching every given filter, ordered by (org, name).
+        Returns (hosts, total) where total ignores limit.
+
+        Raises ValueError if ip_prefix is not an address or CIDR network.
+        """
+        groups = list(groups or [])
+        if org is not None:
+            groups.append(f"org_{org}")
+        network = ipaddress.ip_network(ip_prefix, strict=False) if ip_prefix else None
+
+        with self._lock:
+            self._sync()
+            # (size, candidate keys) for the range filters; only materialized if one drives the scan
+            ranges: list[tuple[int, object]] = []
+            ip_range = None
+            if network is not None:
+                first, last = int(network.network_address), int(network.broadcast_address)
+                ip_range = (network.version, first, last)
+                lo = bisect_left(self._ips, (network.version, first))
+                hi = bisect_right(self._ips, (network.version, last, "\uffff"))
+                ranges.append((hi - lo, lambda lo=lo, hi=hi: [(o, n) for _, _, o, n in self._ips[lo:hi]]))
+            if name_prefix:
+                lo = bisect_left(self._names, (name_prefix,))
+                hi = bisect_left(self._names, (name_prefix + "\uffff",))
+                ranges.append((hi - lo, lambda lo=lo, hi=hi: [(o, n) for n, o in self._names[lo:hi]]))
+            member_sets = sorted((self._groups.get(group, set()) for group in groups), key=len)
+            smallest_range = min(ranges, key=lambda r: r[0]) if ranges else None
+
+            if member_sets and (smallest_range is None or len(member_sets[0]) <= smallest_range[0]):
+                # Intersect the group sets (smallest first), then check the ranges per host
+                keys = member_sets[0].intersection(*member_sets[1:])
+                check_groups = []
+            elif smallest_range is not None:
+                keys = smallest_range[1]()
+                check_groups = member_sets
+            else:
+                keys = self._hosts.keys()
+                check_groups = []
+
+            matches = []
+            for key in keys:
+                if check_groups and any(key not in members for members in check_groups):
+                    continue
+                if ip_range is not None:
+                    version, ip = self._ip_of[key]
+                    if version != ip_range[0] or not ip_range[1] <= ip <= ip_range[2]:
+                        continue
+                if name_prefix and not key[1].startswith(name_prefix):
+                    continue
+                matches.append(key)
+            total = len(matches)
+            keys = heapq.nsmallest(limit, matches) if limit is not None else sorted(matches)
+            return [self._host(key) for key in keys], total
+
+
+_index: Optional[HostIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_host_index() -> HostIndex:
+    """
+    Return the process-wide HostIndex over the host registry.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = HostIndex(get_registry())
+        return _index
@@ -0,0 +1,501 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+import yaml
+
+from vars import ORGS_DIR, ORGS_FILE, REGISTRY_DB, REGISTRY_EXPORT_DELAY
+
+
+def keyset_sql(select: str, where: list[str], params: list, order: tuple[str, ...],
+               descending: bool = False, after: Optional[list] = None, limit: Optional[int] = None) -> tuple[str, list]:
+    """
+    Build a keyset-paginated query: rows ordered by `order` (which must be
+    unique), starting strictly after the key `after`, at most `limit` of them.
+    """
+    where, params = list(where), list(params)
+    if after is not None:
+        if len(after) != len(order):
+            raise ValueError("Cursor key does not match sort order")
+        where.append(f"({', '.join(order)}) {'<' if descending else '>'} ({', '.join('?' * len(order))})")
+        params.extend(after)
+    sql = select
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    direction = " DESC" if descending else ""
+    sql += " ORDER BY " + ", ".join(f"{col}{direction}" for col in order)
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+
+class HostRegistry:
+    """
+    Transactional registry of orgs and hosts backed by SQLite.
+
+    Hosts are indexed by (org, name), by IP and by tag, so inserts and lookups
+    are B-tree operations instead of full YAML rewrites. The orgs.yaml and
+    per-org hosts.yaml files are kept as a read-only export, written in the
+    background: commits only mark the orgs they touched, and their files are
+    rewritten together `export_delay` seconds later (and on flush_export()),
+    so writes don't pay for re-dumping a whole org.
+    """
+
+    def __init__(self, db_path: str = REGISTRY_DB, orgs_dir: str = ORGS_DIR, orgs_file: str = ORGS_FILE,
+                 export_delay: float = REGISTRY_EXPORT_DELAY):
+        self.db_path = db_path
+        self.orgs_dir = orgs_dir
+        self.orgs_file = orgs_file
+        self.export_delay = export_delay
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        # isolation_level=None: we issue BEGIN/COMMIT ourselves in transaction()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._dirty_orgs: set[str] = set()
+        self._orgs_dirty = False
+        # Committed changes waiting for the background YAML export
+        self._pending_orgs: set[str] = set()
+        self._pending_orgs_file = False
+        self._export_timer: Optional[threading.Timer] = None
+        # Held while writing the export, so an older snapshot never overwrites a newer one
+        self._export_lock = threading.Lock()
+        # Host changes of the open transaction, handed to listeners on commit
+        self._host_changes: list[tuple] = []
+        self._listeners: list = []
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._create_schema()
+
+    def _create_schema(self):
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS orgs (
+                name TEXT PRIMARY KEY,
+                subnet TEXT
+            );
+            CREATE TABLE IF NOT EXISTS hosts (
+                org TEXT NOT NULL REFERENCES orgs (name),
+                name TEXT NOT NULL,
+                ip TEXT NOT NULL UNIQUE,
+                tags TEXT NOT NULL DEFAULT '[]',
+                PRIMARY KEY (org, name)
+            );
+            CREATE TABLE IF NOT EXISTS host_tags (
+                org TEXT NOT NULL,
+                name TEXT NOT NULL,
+                tag TEXT NOT NULL,
+                PRIMARY KEY (org, name, tag),
+                FOREIGN KEY (org, name) REFERENCES hosts (org, name) ON DELETE CASCADE
+            );
+            CREATE INDEX IF NOT EXISTS host_tags_tag ON host_tags (tag);
+            CREATE TABLE IF NOT EXISTS host_retired_fingerprints (
+                org TEXT NOT NULL,
+                name TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                PRIMARY KEY (org, name, fingerprint),
+                FOREIGN KEY (org, name) REFERENCES hosts (org, name) ON DELETE CASCADE
+            );
+            CREATE TABLE IF NOT EXISTS registry_meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO registry_meta (key, value) VALUES ('hosts_version', 0);
+            INSERT OR IGNORE INTO registry_meta (key, value) VALUES ('change_seq', 0);
+            """
+        )
+        # Per-host config/cert version, added after the hosts table shipped
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(hosts)")}
+        if "version" not in columns:
+            self._conn.execute("ALTER TABLE hosts ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS hosts_version ON hosts (version)")
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run a block of registry operations atomically.
+
+        Transactions nest; only the outermost one commits, and the YAML export
+        of the touched orgs is scheduled after the commit succeeds.
+        """
+        with self._lock:
+            outer = self._depth == 0
+            if outer:
+                self._conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._depth -= 1
+                if outer:
+                    self._conn.execute("ROLLBACK")
+                    self._dirty_orgs.clear()
+                    self._orgs_dirty = False
+                    self._host_changes.clear()
+                raise
+            self._depth -= 1
+            if not outer:
+                return
+            self._conn.execute("COMMIT")
+            self._export_dirty()
+            changes, self._host_changes = self._host_changes, []
+            version = self.hosts_version() if changes else None
+        # Outside the lock, so listeners may query the registry from other threads
+        if changes:
+            for callback in list(self._listeners):
+                callback(changes, version)
+
+    def add_listener(self, callback) -> None:
+        """
+        Call callback(changes, hosts_version) after every commit that added or
+        removed hosts. Each change is ("add", org, host_entry) or
+        ("remove", org, host_entry), and each one bumped hosts_version by one.
+        """
+        with self._lock:
+            self._listeners.append(callback)
+
+    def hosts_version(self) -> int:
+        """
+        Counter bumped by every host added or removed, by any process.
+        """
+        return self._query("SELECT value FROM registry_meta WHERE key = 'hosts_version'")[0]["value"]
+
+    def _host_changed(self, action: str, org: str, host: dict) -> None:
+        self._conn.execute("UPDATE registry_meta SET value = value + 1 WHERE key = 'hosts_version'")
+        self._host_changes.append((action, org, host))
+
+    def _query(self, sql: str, params=()) -> list[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        """
+        Run a statement on the registry connection. Companion stores (such as
+        the address allocator) use this so their tables share our transactions.
+        """
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def executemany(self, sql: str, seq_of_params) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.executemany(sql, seq_of_params)
+
+    @staticmethod
+    def _row_to_host(row: sqlite3.Row) -> dict:
+        return {"name": row["name"], "ip": row["ip"], "tags": json.loads(row["tags"])}
+
+    # --- orgs ---
+
+    def ensure_org(self, org: str) -> None:
+        with self.transaction():
+            cur = self._conn.execute("INSERT OR IGNORE INTO orgs (name) VALUES (?)", (org,))
+            if cur.rowcount:
+                self._dirty_orgs.add(org)
+
+    def get_org_subnet(self, org: str) -> Optional[str]:
+        rows = self._query("SELECT subnet FROM orgs WHERE name = ?", (org,))
+        return rows[0]["subnet"] if rows else None
+
+    def set_org_subnet(self, org: str, subnet: str) -> None:
+        with self.transaction():
+            self._conn.execute(
+                "INSERT INTO orgs (name, subnet) VALUES (?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET subnet = excluded.subnet",
+                (org, subnet),
+            )
+            self._dirty_orgs.add(org)
+            self._orgs_dirty = True
+
+    def org_exists(self, org: str) -> bool:
+        return bool(self._query("SELECT 1 FROM orgs WHERE name = ?", (org,)))
+
+    def org_subnets(self) -> dict[str, str]:
+        rows = self._query("SELECT name, subnet FROM orgs WHERE subnet IS NOT NULL")
+        return {row["name"]: row["subnet"] for row in rows}
+
+    def list_orgs(self) -> list[dict]:
+        return self.page_orgs()
+
+    def page_orgs(self, descending: bool = False, after: Optional[list] = None, limit: Optional[int] = None) -> list[dict]:
+        """
+        Orgs ordered by name, keyset-paginated after the name in `after`.
+        """
+        sql, params = keyset_sql("SELECT name, subnet FROM orgs", [], [], ("name",), descending, after, limit)
+        return [{"name": row["name"], "subnet": row["subnet"]} for row in self._query(sql, params)]
+
+    # --- hosts ---
+
+    def get_host(self, org: str, name: str) -> Optional[dict]:
+        rows = self._query("SELECT name, ip, tags FROM hosts WHERE org = ? AND name = ?", (org, name))
+        return self._row_to_host(rows[0]) if rows else None
+
+    def host_version(self, org: str, name: str) -> Optional[int]:
+        rows = self._query("SELECT version FROM hosts WHERE org = ? AND name = ?", (org, name))
+        return rows[0]["version"] if rows else None
+
+    def bump_host_version(self, org: str, name: str) -> Optional[int]:
+        """
+        Mark a host's config/cert bundle as changed. Versions come from one
+        registry-wide sequence, so they are monotonic per host and comparable
+        across hosts. Returns the new version, or None if the host doesn't exist.
+        """
+        with self.transaction():
+            self._conn.execute("UPDATE registry_meta SET value = value + 1 WHERE key = 'change_seq'")
+            seq = self._conn.execute("SELECT value FROM registry_meta WHERE key = 'change_seq'").fetchone()["value"]
+            cur = self._conn.execute("UPDATE hosts SET version = ? WHERE org = ? AND name = ?", (seq, org, name))
+        return seq if cur.rowcount else None
+
+    def retire_fingerprint(self, org: str, name: str, fingerprint: str) -> None:
+        """
+        Remember the fingerprint of a host certificate that was just replaced,
+        so a host still holding it can authenticate and learn it must update.
+        """
+        with self.transaction():
+            self._conn.execute(
+                "INSERT OR IGNORE INTO host_retired_fingerprints (org, name, fingerprint) "
+                "SELECT org, name, ? FROM hosts WHERE org = ? AND name = ?",
+                (fingerprint, org, name),
+            )
+
+    def is_retired_fingerprint(self, org: str, name: str, fingerprint: str) -> bool:
+        return bool(self._query(
+            "SELECT 1 FROM host_retired_fingerprints WHERE org = ? AND name = ? AND fingerprint = ?",
+            (org, name, fingerprint),
+        ))
+
+    def change_seq(self) -> int:
+        return self._query("SELECT value FROM registry_meta WHERE key = 'change_seq'")[0]["value"]
+
+    def hosts_changed_since(self, seq: int) -> list[tuple[str, str, int]]:
+        """
+        (org, name, version) of every host whose version is above seq.
+        """
+        rows = self._query("SELECT org, name, version FROM hosts WHERE version > ?", (seq,))
+        return [(row["org"], row["name"], row["version"]) for row in rows]
+
+    def get_host_by_ip(self, ip: str) -> Optional[dict]:
+        rows = self._query("SELECT org, name, ip, tags FROM hosts WHERE ip = ?", (ip,))
+        if not rows:
+            return None
+        return {**self._row_to_host(rows[0]), "org": rows[0]["org"]}
+
+    def host_exists(self, org: str, name: str) -> bool:
+        return bool(self._query("SELECT 1 FROM hosts WHERE org = ? AND name = ?", (org, name)))
+
+    def ip_in_use(self, ip: str) -> bool:
+        return bool(self._query("SELECT 1 FROM hosts WHERE ip = ?", (ip,)))
+
+    def hosts_with_tag(self, tag: str) -> list[dict]:
+        rows = self._query(
+            "SELECT h.org, h.name, h.ip, h.tags FROM host_tags t "
+            "JOIN hosts h ON h.org = t.org AND h.name = t.name WHERE t.tag = ? ORDER BY h.org, h.name",
+            (tag,),
+        )
+        return [{**self._row_to_host(row), "org": row["org"]} for row in rows]
+
+    def list_hosts(self, org: Optional[str] = None) -> list[dict]:
+        """
+        List hosts ordered by (org, name). When no org is given every entry
+        also carries its 'org'.
+        """
+        return self.page_hosts(org)
+
+    def page_hosts(self, org: Optional[str] = None, descending: bool = False,
+                   after: Optional[list] = None, limit: Optional[int] = None) -> list[dict]:
+        """
+        Same rows as list_hosts(), keyset-paginated: `after` is the last
+        [name] (within an org) or [org, name] (across orgs) already returned.
+        """
+        if org is not None:
+            sql, params = keyset_sql(
+                "SELECT name, ip, tags FROM hosts", ["org = ?"], [org], ("name",), descending, after, limit
+            )
+            return [self._row_to_host(row) for row in self._query(sql, params)]
+        sql, params = keyset_sql("SELECT org, name, ip, tags FROM hosts", [], [], ("org", "name"), descending, after, limit)
+        return [{**self._row_to_host(row), "org": row["org"]} for row in self._query(sql, params)]
+
+    def used_ips(self, org: str) -> set[str]:
+        return {row["ip"] for row in self._query("SELECT ip FROM hosts WHERE org = ?", (org,))}
+
+    def unique_name(self, org: str, name: str) -> str:
+        """
+        Return name, or name suffixed with the first free number, so that it is unique within the org.
+        """
+        base_name = name
+        suffix = 1
+        while self.host_exists(org, name):
+            name = f"{base_name}{suffix}"
+            suffix += 1
+        return name
+
+    def add_host(self, org: str, name: str, ip: str, tags: list[str]) -> dict:
+        with self.transaction():
+            self._conn.execute("INSERT OR IGNORE INTO orgs (name) VALUES (?)", (org,))
+            try:
+                self._conn.execute(
+                    "INSERT INTO hosts (org, name, ip, tags) VALUES (?, ?, ?, ?)",
+                    (org, name, ip, json.dumps(tags)),
+                )
+            except sqlite3.IntegrityError as e:
+                raise ValueError(f"Host {org}/{name} or IP {ip} already exists") from e
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO host_tags (org, name, tag) VALUES (?, ?, ?)",
+                [(org, name, tag) for tag in tags],
+            )
+            self._dirty_orgs.add(org)
+            host = {"name": name, "ip": ip, "tags": list(tags)}
+            self._host_changed("add", org, host)
+        return host
+
+    def remove_host(self, org: str, name: str) -> Optional[dict]:
+        """
+        Remove a host and return its entry, or None if it did not exist.
+        """
+        with self.transaction():
+            host = self.get_host(org, name)
+            if host is None:
+                return None
+            self._conn.execute("DELETE FROM hosts WHERE org = ? AND name = ?", (org, name))
+            self._dirty_orgs.add(org)
+            self._host_changed("remove", org, host)
+        return host
+
+    # --- YAML import / export ---
+
+    def import_yaml_tree(self) -> None:
+        """
+        Import orgs.yaml and every org's hosts.yaml into the registry.
+
+        Orgs that are already in the registry are skipped, so this is cheap to
+        run on every startup; the database is the source of truth afterwards.
+        """
+        if not os.path.isdir(self.orgs_dir):
+            return
+        orgs_data = _load_yaml(self.orgs_file, default={})
+        if not isinstance(orgs_data, dict):
+            orgs_data = {}
+        org_names = set(orgs_data)
+        for entry in os.listdir(self.orgs_dir):
+            if os.path.isdir(os.path.join(self.orgs_dir, entry)):
+                org_names.add(entry)
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                imported = 0
+                for org in sorted(org_names):
+                    if self._conn.execute("SELECT 1 FROM orgs WHERE name = ?", (org,)).fetchone():
+                        continue
+                    self._conn.execute("INSERT INTO orgs (name, subnet) VALUES (?, ?)", (org, orgs_data.get(org)))
+                    hosts = _load_yaml(os.path.join(self.orgs_dir, org, "hosts.yaml"), default=[])
+                    if not isinstance(hosts, list):
+                        continue
+                    for host in hosts:
+                        if not isinstance(host, dict) or not host.get("name") or not host.get("ip"):
+                            continue
+                        tags = host.get("tags") or []
+                        self._conn.execute(
+                            "INSERT OR IGNORE INTO hosts (org, name, ip, tags) VALUES (?, ?, ?, ?)",
+                            (org, host["name"], host["ip"], json.dumps(tags)),
+                        )
+                        self._conn.executemany(
+                            "INSERT OR IGNORE INTO host_tags (org, name, tag) VALUES (?, ?, ?)",
+                            [(org, host["name"], tag) for tag in tags],
+                        )
+                        imported += 1
+                if imported:
+                    # Bypasses the change feed, so make every listener resync
+                    self._conn.execute("UPDATE registry_meta SET value = value + 1 WHERE key = 'hosts_version'")
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if imported:
+            print(f"Imported {imported} hosts from YAML into the host registry")
+
+    def export_yaml(self, orgs: Optional[set[str]] = None) -> None:
+        """
+        Write orgs.yaml and the hosts.yaml of the given orgs (all orgs if None).
+        """
+        with self._lock:
+            if orgs is None:
+                orgs = {row["name"] for row in self._query("SELECT name FROM orgs")}
+            os.makedirs(self.orgs_dir, exist_ok=True)
+            _save_yaml(self.orgs_file, self.org_subnets())
+            for org in orgs:
+                org_dir = os.path.join(self.orgs_dir, org)
+                os.makedirs(org_dir, exist_ok=True)
+                _save_yaml(os.path.join(org_dir, "hosts.yaml"), self.list_hosts(org))
+
+    def _export_dirty(self):
+        # Called with the lock held, right after a commit
+        if not self._dirty_orgs and not self._orgs_dirty:
+            return
+        self._pending_orgs |= self._dirty_orgs
+        self._pending_orgs_file = self._pending_orgs_file or self._orgs_dirty
+        self._dirty_orgs = set()
+        self._orgs_dirty = False
+        if self._export_timer is None:
+            self._export_timer = threading.Timer(self.export_delay, self.flush_export)
+            self._export_timer.daemon = True
+            self._export_timer.start()
+
+    def flush_export(self) -> None:
+        """
+        Write the YAML export of every org changed since the last export now
+        (e.g. at shutdown) instead of waiting for the background flush.
+        """
+        with self._export_lock:
+            with self._lock:
+                if self._export_timer is not None:
+                    self._export_timer.cancel()
+                    self._export_timer = None
+                orgs, write_orgs_file = self._pending_orgs, self._pending_orgs_file
+                self._pending_orgs, self._pending_orgs_file = set(), False
+                if not orgs and not write_orgs_file:
+                    return
+                subnets = self.org_subnets()
+                hosts = {org: self.list_hosts(org) for org in orgs}
+            # Only the snapshot is taken under the registry lock; writers don't wait for the files
+            os.makedirs(self.orgs_dir, exist_ok=True)
+            _save_yaml(self.orgs_file, subnets)
+            for org, org_hosts in hosts.items():
+                org_dir = os.path.join(self.orgs_dir, org)
+                os.makedirs(org_dir, exist_ok=True)
+                _save_yaml(os.path.join(org_dir, "hosts.yaml"), org_hosts)
+
+
+def _load_yaml(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r') as f:
+        return yaml.safe_load(f) or default
+
+
+def _save_yaml(path, data):
+    # Write to a temp file first so readers never see a half-written export
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        yaml.safe_dump(data, f)
+    os.replace(tmp_path, path)
+
+
+_registry: Optional[HostRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> HostRegistry:
+    """
+    Return the process-wide HostRegistry, opening it on first use.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = HostRegistry()
+        return _registry
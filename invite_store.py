@@ -0,0 +1,274 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import yaml
+
+from host_registry import HostRegistry, get_registry, keyset_sql
+from vars import INVITES_FILE
+
+_COLUMNS = "code, org, expires_at, active, available_uses, tags, name_prefix"
+# sort name -> columns of its unique keyset order
+SORT_KEYS = {"expires_at": ("expires_at", "code"), "code": ("code",)}
+
+
+class InviteError(Exception):
+    """Raised when an invite cannot be redeemed; the message is safe to show to clients."""
+
+
+def _to_timestamp(value) -> float:
+    # Invites store naive UTC datetimes (datetime.utcnow()), as they always have
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _to_iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).replace(tzinfo=None).isoformat()
+
+
+class InviteStore:
+    """
+    Invites indexed by code, stored next to the host registry.
+
+    Redemption is a single conditional UPDATE (compare-and-decrement of
+    available_uses) inside an IMMEDIATE transaction, so concurrent
+    redemptions of the same code can never over-spend it, even across
+    worker processes. Used up, expired and deactivated invites are moved
+    to invites_archive so the live table only holds redeemable codes.
+    """
+
+    def __init__(self, registry: HostRegistry):
+        self.registry = registry
+        for table in ("invites", "invites_archive"):
+            extra = ", archived_at REAL NOT NULL, reason TEXT NOT NULL" if table == "invites_archive" else ""
+            registry.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    code TEXT PRIMARY KEY,
+                    org TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    active INTEGER NOT NULL DEFAULT 1,
+                    available_uses INTEGER NOT NULL DEFAULT 1,
+                    tags TEXT NOT NULL DEFAULT '[]',
+                    name_prefix TEXT{extra}
+                )
+                """
+            )
+            # Tables created before invites carried tags / name prefixes
+            columns = {row["name"] for row in registry.execute(f"PRAGMA table_info({table})")}
+            if "tags" not in columns:
+                registry.execute(f"ALTER TABLE {table} ADD COLUMN tags TEXT NOT NULL DEFAULT '[]'")
+            if "name_prefix" not in columns:
+                registry.execute(f"ALTER TABLE {table} ADD COLUMN name_prefix TEXT")
+        registry.execute("CREATE INDEX IF NOT EXISTS invites_expires_at ON invites (expires_at)")
+        registry.execute("CREATE INDEX IF NOT EXISTS invites_org ON invites (org, expires_at)")
+        registry.execute("CREATE INDEX IF NOT EXISTS invites_archive_org ON invites_archive (org, expires_at)")
+
+    @staticmethod
+    def _row_to_invite(row) -> dict:
+        return {
+            "code": row["code"],
+            "org": row["org"],
+            "expires_at": _to_iso(row["expires_at"]),
+            "active": bool(row["active"]),
+            "available_uses": row["available_uses"],
+            "tags": json.loads(row["tags"]),
+            "name_prefix": row["name_prefix"],
+        }
+
+    def create(self, org: str, code: str, days_valid: int, uses: int,
+               tags: Optional[list[str]] = None, name_prefix: Optional[str] = None) -> dict:
+        return self.create_many(org, [code], days_valid, uses, tags, name_prefix)[0]
+
+    def create_many(self, org: str, codes: list[str], days_valid: int, uses: int,
+                    tags: Optional[list[str]] = None, name_prefix: Optional[str] = None) -> list[dict]:
+        """
+        Insert one invite per code, all in a single transaction (one write).
+        """
+        # Round-trip through the ISO form so pagination cursors (which carry
+        # the ISO string) compare equal to the stored value
+        expires_at = _to_timestamp(_to_iso(time.time() + timedelta(days=days_valid).total_seconds()))
+        tags = list(tags or [])
+        tags_json = json.dumps(tags)
+        with self.registry.transaction():
+            self.registry.executemany(
+                f"INSERT INTO invites ({_COLUMNS}) VALUES (?, ?, ?, 1, ?, ?, ?)",
+                [(code, org, expires_at, uses, tags_json, name_prefix) for code in codes],
+            )
+        return [
+            {"code": code, "org": org, "expires_at": _to_iso(expires_at), "active": True,
+             "available_uses": uses, "tags": tags, "name_prefix": name_prefix}
+            for code in codes
+        ]
+
+    def get(self, code: str) -> Optional[dict]:
+        row = self.registry.execute(f"SELECT {_COLUMNS} FROM invites WHERE code = ?", (code,)).fetchone()
+        if row is None:
+            row = self.registry.execute(f"SELECT {_COLUMNS} FROM invites_archive WHERE code = ?", (code,)).fetchone()
+        return self._row_to_invite(row) if row is not None else None
+
+    def redeem(self, code: str) -> dict:
+        """
+        Atomically take one use of an invite and return it (as it was before
+        the use). Raises InviteError if the code is unknown, used up or expired.
+        """
+        now = time.time()
+        # Errors are raised after the transaction, so archiving a spent invite still commits
+        error = None
+        with self.registry.transaction():
+            row = self.registry.execute(f"SELECT {_COLUMNS} FROM invites WHERE code = ?", (code,)).fetchone()
+            if row is None:
+                archived = self.registry.execute("SELECT reason FROM invites_archive WHERE code = ?", (code,)).fetchone()
+                if archived is None:
+                    error = "Invalid invite code"
+                elif archived["reason"] == "expired":
+                    error = "Invite code expired"
+                else:
+                    error = "Invite code already used"
+            else:
+                cur = self.registry.execute(
+                    "UPDATE invites SET available_uses = available_uses - 1 "
+                    "WHERE code = ? AND active = 1 AND available_uses > 0 AND expires_at > ?",
+                    (code, now),
+                )
+                if cur.rowcount == 0:
+                    if row["expires_at"] <= now:
+                        self._archive("code = ?", (code,), "expired", now)
+                        error = "Invite code expired"
+                    else:
+                        self._archive("code = ?", (code,), "used", now)
+                        error = "Invite code already used"
+                elif row["available_uses"] - 1 <= 0:
+                    self.registry.execute("UPDATE invites SET active = 0 WHERE code = ?", (code,))
+                    self._archive("code = ?", (code,), "used", now)
+        if error is not None:
+            raise InviteError(error)
+        return self._row_to_invite(row)
+
+    def refund(self, code: str) -> None:
+        """
+        Give back a use taken by redeem(), e.g. when creating the host failed.
+        """
+        with self.registry.transaction():
+            row = self.registry.execute(
+                f"SELECT {_COLUMNS}, reason FROM invites_archive WHERE code = ?", (code,)
+            ).fetchone()
+            if row is not None and row["reason"] == "used":
+                self.registry.execute(
+                    f"INSERT INTO invites ({_COLUMNS}) VALUES (?, ?, ?, 1, ?, ?, ?)",
+                    (row["code"], row["org"], row["expires_at"], row["available_uses"] + 1,
+                     row["tags"], row["name_prefix"]),
+                )
+                self.registry.execute("DELETE FROM invites_archive WHERE code = ?", (code,))
+            else:
+                self.registry.execute("UPDATE invites SET available_uses = available_uses + 1 WHERE code = ?", (code,))
+
+    def deactivate(self, code: str) -> bool:
+        with self.registry.transaction():
+            self.registry.execute("UPDATE invites SET active = 0 WHERE code = ?", (code,))
+            return self._archive("code = ?", (code,), "deactivated", time.time()) > 0
+
+    def archive_expired(self) -> int:
+        """
+        Move every expired invite to the archive. Cheap thanks to the expires_at index.
+        """
+        now = time.time()
+        with self.registry.transaction():
+            return self._archive("expires_at <= ?", (now,), "expired", now)
+
+    def list_invites(self, org: Optional[str] = None, active: Optional[bool] = None) -> list[dict]:
+        return self.page(org, active)
+
+    def page(self, org: Optional[str] = None, active: Optional[bool] = None, sort: str = "expires_at",
+             descending: bool = False, after: Optional[list] = None, limit: Optional[int] = None) -> list[dict]:
+        """
+        Invites filtered by org and active state, keyset-paginated in `sort`
+        order. `after` is the cursor key of the last invite already returned.
+        """
+        # Read-only: invites that expired since the last archive_expired() are shown as inactive
+        now = time.time()
+        live = ("SELECT code, org, expires_at, CASE WHEN expires_at > ? THEN active ELSE 0 END AS active, "
+                "available_uses, tags, name_prefix FROM invites")
+        archived = f"SELECT {_COLUMNS} FROM invites_archive"
+        where, params = ([], []) if not org else (["org = ?"], [org])
+        if active is None:
+            source, source_params = f"SELECT * FROM ({live} UNION ALL {archived})", [now]
+        elif active:
+            source, source_params = f"SELECT {_COLUMNS} FROM invites", []
+            where.append("expires_at > ?")
+            params.append(now)
+        else:
+            source, source_params = f"SELECT * FROM ({live} WHERE expires_at <= ? UNION ALL {archived})", [now, now]
+        params = source_params + params
+        if after is not None and sort == "expires_at":
+            try:
+                after = [_to_timestamp(after[0]), *after[1:]]
+            except (TypeError, ValueError, AttributeError):
+                raise ValueError("Invalid cursor")
+        sql, params = keyset_sql(source, where, params, SORT_KEYS[sort], descending, after, limit)
+        return [self._row_to_invite(row) for row in self.registry.execute(sql, params).fetchall()]
+
+    def _archive(self, where: str, params: tuple, reason: str, now: float) -> int:
+        self.registry.execute(
+            f"INSERT OR REPLACE INTO invites_archive ({_COLUMNS}, archived_at, reason) "
+            f"SELECT code, org, expires_at, 0, available_uses, tags, name_prefix, ?, ? FROM invites WHERE {where}",
+            (now, reason, *params),
+        )
+        return self.registry.execute(f"DELETE FROM invites WHERE {where}", params).rowcount
+
+    def import_yaml(self, path: str = INVITES_FILE) -> None:
+        """
+        One-time import of the legacy invites.yaml. The file is renamed
+        afterwards so archived invites are never resurrected by a re-import.
+        """
+        if not os.path.exists(path):
+            return
+        with open(path, 'r') as f:
+            invites = yaml.safe_load(f) or []
+        now = time.time()
+        imported = 0
+        with self.registry.transaction():
+            for invite in invites:
+                if not isinstance(invite, dict) or not invite.get("code") or not invite.get("org"):
+                    continue
+                if self.get(invite["code"]) is not None:
+                    continue
+                try:
+                    expires_at = _to_timestamp(invite.get("expires_at"))
+                except (TypeError, ValueError, AttributeError):
+                    continue
+                uses = invite.get("available_uses", 1)
+                active = invite.get("active", True) and uses > 0
+                values = (invite["code"], invite["org"], expires_at, 1 if active else 0, uses, "[]", None)
+                if active and expires_at > now:
+                    self.registry.execute(f"INSERT INTO invites ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", values)
+                else:
+                    reason = "expired" if active else "used"
+                    self.registry.execute(
+                        f"INSERT INTO invites_archive ({_COLUMNS}, archived_at, reason) VALUES (?, ?, ?, 0, ?, ?, ?, ?, ?)",
+                        (*values[:3], *values[4:], now, reason),
+                    )
+                imported += 1
+        os.replace(path, f"{path}.imported")
+        print(f"Imported {imported} invites from {path}")
+
+
+_store: Optional[InviteStore] = None
+_store_lock = threading.Lock()
+
+
+def get_invite_store() -> InviteStore:
+    """
+    Return the process-wide InviteStore bound to the host registry.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = InviteStore(get_registry())
+        return _store
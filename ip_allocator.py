@@ -0,0 +1,147 @@
+import threading
+from ipaddress import IPv6Address, IPv6Network
+from typing import Optional
+
+from host_registry import HostRegistry, get_registry
+
+# SQLite integers are signed 64-bit, which caps the host ids we can track per subnet
+MAX_HOST_ID = 2**63 - 1
+# Upper bound on holes recorded when a pool is first built from existing hosts
+MAX_IMPORTED_GAPS = 65536
+
+
+class HostAddressAllocator:
+    """
+    Persistent per-subnet host address allocator.
+
+    Each subnet keeps a high-water mark (the next never-used host id) and a
+    free-list of host ids released by deleted hosts. Allocation pops from the
+    free-list first and otherwise bumps the high-water mark, so handing out an
+    address never scans the subnet. The state lives in the host registry
+    database and shares its transactions.
+    """
+
+    def __init__(self, registry: HostRegistry):
+        self.registry = registry
+        registry.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ip_pools (
+                subnet TEXT PRIMARY KEY,
+                next_id INTEGER NOT NULL
+            )
+            """
+        )
+        registry.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ip_free (
+                subnet TEXT NOT NULL,
+                host_id INTEGER NOT NULL,
+                PRIMARY KEY (subnet, host_id)
+            )
+            """
+        )
+
+    def allocate(self, org: str, subnet: str, count: int = 1) -> list[str]:
+        """
+        Allocate count addresses from the org's subnet in one transaction.
+
+        Released addresses are reused first (lowest first), then fresh ones
+        are taken from the high-water mark.
+        """
+        if count < 1:
+            return []
+        net = IPv6Network(subnet)
+        base = int(net.network_address)
+        limit = min(net.num_addresses - 1, MAX_HOST_ID)
+        ips = []
+        with self.registry.transaction():
+            next_id = self._load_pool(org, subnet, net)
+
+            free_ids = [
+                row[0] for row in self.registry.execute(
+                    "SELECT host_id FROM ip_free WHERE subnet = ? ORDER BY host_id LIMIT ?",
+                    (subnet, count),
+                ).fetchall()
+            ]
+            if free_ids:
+                self.registry.executemany(
+                    "DELETE FROM ip_free WHERE subnet = ? AND host_id = ?",
+                    [(subnet, host_id) for host_id in free_ids],
+                )
+            for host_id in free_ids:
+                ip = str(IPv6Address(base + host_id))
+                # Guard against addresses that were assigned outside the allocator
+                if not self.registry.ip_in_use(ip):
+                    ips.append(ip)
+
+            while len(ips) < count:
+                if next_id > limit:
+                    raise ValueError("No available IPs in subnet")
+                ip = str(IPv6Address(base + next_id))
+                next_id += 1
+                if not self.registry.ip_in_use(ip):
+                    ips.append(ip)
+
+            self.registry.execute("UPDATE ip_pools SET next_id = ? WHERE subnet = ?", (next_id, subnet))
+        return ips
+
+    def release(self, subnet: str, ip: str) -> None:
+        """
+        Return an address to its subnet's free-list so it can be handed out again.
+        """
+        net = IPv6Network(subnet)
+        address = IPv6Address(ip)
+        if address not in net:
+            return
+        host_id = int(address) - int(net.network_address)
+        with self.registry.transaction():
+            row = self.registry.execute("SELECT next_id FROM ip_pools WHERE subnet = ?", (subnet,)).fetchone()
+            if row is None or host_id >= row[0]:
+                return
+            self.registry.execute(
+                "INSERT OR IGNORE INTO ip_free (subnet, host_id) VALUES (?, ?)",
+                (subnet, host_id),
+            )
+
+    def _load_pool(self, org: str, subnet: str, net: IPv6Network) -> int:
+        row = self.registry.execute("SELECT next_id FROM ip_pools WHERE subnet = ?", (subnet,)).fetchone()
+        if row is not None:
+            return row[0]
+
+        # First allocation in this subnet: seed the pool from the hosts already in the org
+        base = int(net.network_address)
+        used_ids = sorted(
+            int(IPv6Address(ip)) - base
+            for ip in self.registry.used_ips(org)
+            if IPv6Address(ip) in net
+        )
+        used_ids = [host_id for host_id in used_ids if 0 < host_id <= MAX_HOST_ID]
+        next_id = (used_ids[-1] + 1) if used_ids else 1
+
+        gaps = []
+        previous = 0
+        for host_id in used_ids:
+            for gap in range(previous + 1, host_id):
+                if len(gaps) >= MAX_IMPORTED_GAPS:
+                    break
+                gaps.append((subnet, gap))
+            previous = host_id
+        if gaps:
+            self.registry.executemany("INSERT OR IGNORE INTO ip_free (subnet, host_id) VALUES (?, ?)", gaps)
+        self.registry.execute("INSERT INTO ip_pools (subnet, next_id) VALUES (?, ?)", (subnet, next_id))
+        return next_id
+
+
+_allocator: Optional[HostAddressAllocator] = None
+_allocator_lock = threading.Lock()
+
+
+def get_address_allocator() -> HostAddressAllocator:
+    """
+    Return the process-wide HostAddressAllocator bound to the host registry.
+    """
+    global _allocator
+    with _allocator_lock:
+        if _allocator is None:
+            _allocator = HostAddressAllocator(get_registry())
+        return _allocator
@@ -0,0 +1,260 @@
+import asyncio
+import fcntl
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from typing import AsyncIterator, Optional
+
+from nebula_api import NebulaAPI, NebulaConfigError, get_nebula_api, read_pid_file
+from vars import NEBULA_CONTROL_LOCK, NEBULA_CONTROL_SOCKET, NEBULA_PID_FILE
+
+LIGHTHOUSE_CONFIG = "./data/lighthouse/config.yaml"
+# Seconds to wait for the owner to answer; stopping nebula can take up to 10s
+CONTROL_TIMEOUT = 15.0
+# How often a non-owner worker polls the owner for new log lines while streaming
+LOG_POLL_INTERVAL = 0.5
+
+
+class LighthouseUnavailable(Exception):
+    """
+    Raised when the worker that owns the lighthouse can't be reached.
+    """
+
+
+class LighthouseControl:
+    """
+    The lighthouse process, shared by every API worker process.
+
+    Exactly one worker owns the nebula process: the one holding an exclusive
+    lock on NEBULA_CONTROL_LOCK. It runs the process through its NebulaAPI
+    and answers the other workers on a Unix socket (NEBULA_CONTROL_SOCKET),
+    one JSON request and response per connection. Other workers forward
+    status/start/stop/reload/logs calls there, so every worker gives the same
+    answer. If the owner goes away, the next worker that fails to reach it
+    takes the lock over (and with it the lighthouse); the nebula pid file
+    covers status while no owner is reachable.
+    """
+
+    def __init__(
+        self,
+        nebula: NebulaAPI,
+        config_path: str = LIGHTHOUSE_CONFIG,
+        socket_path: str = NEBULA_CONTROL_SOCKET,
+        lock_path: str = NEBULA_CONTROL_LOCK,
+        pid_file: str = NEBULA_PID_FILE,
+    ):
+        self.nebula = nebula
+        self.config_path = config_path
+        self.socket_path = socket_path
+        self.lock_path = lock_path
+        self.pid_file = pid_file
+        self._lock_fd: Optional[int] = None
+        self._server: Optional[socketserver.ThreadingUnixStreamServer] = None
+        self._owner_lock = threading.Lock()
+
+    @property
+    def owner(self) -> bool:
+        return self._lock_fd is not None
+
+    def startup(self) -> None:
+        """
+        Try to become the owner; the owner starts the lighthouse if it was running before.
+        """
+        if self._try_become_owner():
+            self._autostart()
+
+    def _autostart(self) -> None:
+        try:
+            self.nebula.autostart_nebula_tracked()
+        except (OSError, RuntimeError) as e:
+            print(f"Failed to start nebula: {e}")
+
+    def shutdown(self) -> None:
+        """
+        Stop serving other workers and, if this worker owns it, stop the lighthouse
+        (it stays marked as running for the next start).
+        """
+        with self._owner_lock:
+            if not self.owner:
+                return
+            if self._server is not None:
+                self._server.shutdown()
+                self._server.server_close()
+                self._server = None
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            self.nebula.stop_nebula_tracked(remember=False)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def _try_become_owner(self) -> bool:
+        with self._owner_lock:
+            if self.owner:
+                return True
+            os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            os.ftruncate(fd, 0)
+            os.write(fd, f"{os.getpid()}\n".encode())
+            self._lock_fd = fd
+            self._serve()
+            print(f"Worker {os.getpid()} owns the lighthouse process")
+            return True
+
+    def _serve(self) -> None:
+        control = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    request = json.loads(self.rfile.readline())
+                    response = control._dispatch(request.get("op"), request.get("args") or {})
+                except ValueError as e:
+                    response = {"error": "request", "detail": str(e)}
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+
+        # Only the lock holder gets here, so an existing socket file is stale
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        self._server.daemon_threads = True
+        os.chmod(self.socket_path, 0o600)
+        threading.Thread(target=self._server.serve_forever, name="lighthouse-control", daemon=True).start()
+
+    def _dispatch(self, op: Optional[str], args: dict) -> dict:
+        """
+        Run one operation against the local NebulaAPI. Errors are returned, not raised.
+        """
+        nebula = self.nebula
+        try:
+            if op == "status":
+                result = {**nebula.supervisor_status(), "owner_pid": os.getpid()}
+            elif op == "start":
+                status = nebula.supervisor_status()
+                if status["status"] == "running":
+                    result = {"status": "already running", "pid": status["pid"]}
+                else:
+                    nebula.run_nebula_tracked(self.config_path)
+                    result = {"status": "started", "pid": nebula.supervisor_status()["pid"]}
+            elif op == "stop":
+                # A lighthouse waiting to be restarted (or given up on) still counts as started
+                if nebula.supervisor_status()["status"] == "stopped":
+                    result = {"status": "already stopped"}
+                else:
+                    nebula.stop_nebula_tracked()
+                    result = {"status": "stopped"}
+            elif op == "reload":
+                if nebula.reload_nebula_tracked(self.config_path):
+                    result = {"status": "reloaded", "pid": nebula.supervisor_status()["pid"]}
+                else:
+                    result = {"status": "validated"}
+            elif op == "logs":
+                entries = nebula.logs.tail(args.get("limit"), since=args.get("since"), level=args.get("level"))
+                result = {"entries": entries, **nebula.logs.stats()}
+            else:
+                return {"error": "request", "detail": f"Unknown operation: {op}"}
+        except NebulaConfigError as e:
+            return {"error": "config", "detail": str(e)}
+        except (OSError, RuntimeError) as e:
+            return {"error": "runtime", "detail": str(e)}
+        return {"result": result}
+
+    def _call(self, op: str, **args) -> dict:
+        if self.owner:
+            response = self._dispatch(op, args)
+        else:
+            try:
+                response = self._remote(op, args)
+            except OSError:
+                # The owner is gone; take over, or report it if another worker beat us to it
+                if not self._try_become_owner():
+                    raise LighthouseUnavailable("The worker running the lighthouse is not responding")
+                self._autostart()
+                response = self._dispatch(op, args)
+        error = response.get("error")
+        if error == "config":
+            raise NebulaConfigError(response["detail"])
+        if error is not None:
+            raise RuntimeError(response["detail"])
+        return response["result"]
+
+    def _remote(self, op: str, args: dict) -> dict:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONTROL_TIMEOUT)
+            sock.connect(self.socket_path)
+            sock.sendall(json.dumps({"op": op, "args": args}).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                line = f.readline()
+        if not line:
+            raise ConnectionResetError("Lighthouse owner closed the connection")
+        return json.loads(line)
+
+    def status(self) -> dict:
+        try:
+            return self._call("status")
+        except LighthouseUnavailable:
+            # Fall back to the pid file while ownership changes hands
+            pid = read_pid_file(self.pid_file)
+            return {"status": "running" if pid else "unknown", "pid": pid, "owner_pid": None}
+
+    def is_running(self) -> bool:
+        return self.status()["status"] == "running"
+
+    def start(self) -> dict:
+        return self._call("start")
+
+    def stop(self) -> dict:
+        return self._call("stop")
+
+    def reload(self) -> dict:
+        """
+        Validate the config and SIGHUP the lighthouse; raises NebulaConfigError
+        (after the config was rolled back) if validation fails.
+        """
+        return self._call("reload")
+
+    def logs(self, limit: Optional[int] = None, since: Optional[int] = None, level: Optional[str] = None) -> dict:
+        return self._call("logs", limit=limit, since=since, level=level)
+
+    async def follow_logs(self, since: int, level: Optional[str] = None, heartbeat: float = 15.0) -> AsyncIterator[list[dict]]:
+        """
+        Batches of new log entries after `since`, as LogBuffer.follow() yields them.
+        """
+        if self.owner:
+            async for batch in self.nebula.logs.follow(since, level=level, heartbeat=heartbeat):
+                yield batch
+            return
+        quiet_since = time.monotonic()
+        while True:
+            await asyncio.sleep(LOG_POLL_INTERVAL)
+            result = await asyncio.to_thread(self.logs, None, since, level)
+            # A new owner starts with an empty buffer, numbered from 1 again
+            since = result["last_seq"] if result["last_seq"] >= since else 0
+            if result["entries"]:
+                quiet_since = time.monotonic()
+                yield result["entries"]
+            elif time.monotonic() - quiet_since >= heartbeat:
+                quiet_since = time.monotonic()
+                yield []
+
+
+_control: Optional[LighthouseControl] = None
+_control_lock = threading.Lock()
+
+
+def get_lighthouse_control() -> LighthouseControl:
+    """
+    Return the process-wide LighthouseControl over get_nebula_api().
+    """
+    global _control
+    with _control_lock:
+        if _control is None:
+            _control = LighthouseControl(get_nebula_api())
+        return _control
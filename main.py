@@ -1,3 +1,5 @@
+import argparse
+import importlib.util
 import os
 from dotenv import load_dotenv
 import uvicorn
@@ -10,5 +12,45 @@ if not os.path.exists(env_path):
 # Load environment variables from .env file
 load_dotenv(env_path)
 
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Run the Nebula Tower API")
+    p.add_argument("--mode", choices=["dev", "production"], default=os.getenv("SERVER_MODE", "dev"),
+                   help="dev: one worker with auto-reload; production: several workers, no reloader")
+    p.add_argument("--host", default=os.getenv("SERVER_HOST", "0.0.0.0"))
+    p.add_argument("--port", type=int, default=int(os.getenv("SERVER_PORT", 8000)))
+    p.add_argument("--workers", type=int, default=int(os.getenv("SERVER_WORKERS", os.cpu_count() or 1)),
+                   help="Worker processes in production mode")
+    p.add_argument("--graceful-timeout", type=float, default=float(os.getenv("SERVER_GRACEFUL_TIMEOUT", 30)),
+                   help="Seconds to let in-flight requests finish on shutdown")
+    return p.parse_args()
+
+
+def serve_production(args: argparse.Namespace) -> None:
+    """
+    Multi-worker serving. Each worker warms its caches in the app's lifespan
+    before it takes traffic, and on SIGTERM stops accepting, releases
+    long-polls and log streams, and waits up to --graceful-timeout for the rest.
+    """
+    # Faster event loop and HTTP parser when installed (pip install uvloop httptools)
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    print(f"Serving on {args.host}:{args.port} with {args.workers} worker(s), {loop} event loop, {http} HTTP parser")
+    uvicorn.run(
+        "api:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=loop,
+        http=http,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        proxy_headers=True,
+    )
+
+
 if __name__ == "__main__":
-    uvicorn.run("api:app", host="0.0.0.0", port=8000, reload=True)
+    args = parse_args()
+    if args.mode == "production":
+        serve_production(args)
+    else:
+        uvicorn.run("api:app", host=args.host, port=args.port, reload=True)
@@ -1,15 +1,158 @@
+import asyncio
+import json
+import os
+import shutil
+import signal
 import subprocess
 import threading
+import time
+from collections import deque
 from typing import Optional
 
+from nebula_cert import signer, SigningError, UnsupportedSigningError
+from nebula_logs import LogBuffer, MAX_LINE_BYTES, config_log_format
+from vars import (
+    NEBULA_MAX_SUBPROCESSES, NEBULA_SIGNER,
+    NEBULA_RESTART_BACKOFF_MIN, NEBULA_RESTART_BACKOFF_MAX, NEBULA_CRASH_LOOP_RESTARTS, NEBULA_CRASH_LOOP_WINDOW,
+    NEBULA_PROCESS_STATE, NEBULA_PID_FILE,
+)
+
+
+def build_sign_cert_cmd(
+    cert_path: str,
+    name: str,
+    networks: str,
+    out_crt: str,
+    out_key: str,
+    ca_crt: str = "ca.crt",
+    ca_key: str = "ca.key",
+    groups: str | None = None,
+    duration: str | None = None,
+    in_pub: str | None = None,
+    out_qr: str | None = None,
+    subnets: str | None = None,
+) -> list:
+    """
+    Build the nebula-cert sign command line shared by NebulaAPI and AsyncNebulaAPI.
+    """
+    cmd = [
+        cert_path, "sign",
+        "-name", name,
+        "-networks", networks,
+        "-out-crt", out_crt,
+        "-out-key", out_key,
+        "-ca-crt", ca_crt,
+        "-ca-key", ca_key,
+        "-version", "2",
+    ]
+    if groups:
+        cmd += ["-groups", groups]
+    if duration:
+        cmd += ["-duration", duration]
+    if in_pub:
+        cmd += ["-in-pub", in_pub]
+    if out_qr:
+        cmd += ["-out-qr", out_qr]
+    if subnets:
+        cmd += ["-subnets", subnets]
+    return cmd
+
+
+def sign_cert_in_process(**sign_args) -> Optional[str]:
+    """
+    Sign with the in-process v2 signer. Returns the nebula-cert style output,
+    or None if the request needs the nebula-cert subprocess instead.
+    """
+    if NEBULA_SIGNER != "python":
+        return None
+    try:
+        signer.sign(**sign_args)
+    except UnsupportedSigningError as e:
+        print(f"In-process signing unavailable ({e}), falling back to nebula-cert")
+        return None
+    except SigningError as e:
+        return f"Error: {e}"
+    # nebula-cert prints nothing on success
+    return ""
+
+
+class NebulaConfigError(Exception):
+    """
+    Raised when a nebula config fails `nebula -test`.
+    """
+
+
+def last_good_path(config_path: str) -> str:
+    """
+    Where the last config that passed validation is kept for rollback.
+    """
+    return f"{config_path}.last-good"
+
+
+def read_pid_file(path: str) -> Optional[int]:
+    """
+    The pid recorded in a pid file, if that process is still alive.
+    """
+    try:
+        with open(path) as f:
+            pid = int(f.read().strip())
+        os.kill(pid, 0)
+    except (OSError, ValueError):
+        return None
+    return pid
+
+
 class NebulaAPI:
-    def __init__(self, nebula_path: str = './bin/nebula', cert_path: str = './bin/nebula-cert'):
+    """
+    Wrappers around the nebula and nebula-cert binaries, plus one tracked
+    nebula process (the lighthouse).
+
+    With supervise=True the tracked process is restarted when it exits
+    without stop_nebula_tracked() being called. Restarts back off
+    exponentially (NEBULA_RESTART_BACKOFF_MIN doubling up to _MAX), and after
+    NEBULA_CRASH_LOOP_RESTARTS crashes within NEBULA_CRASH_LOOP_WINDOW seconds
+    the supervisor gives up until the process is started again by hand. If
+    state_file is set, whether the process should be running is saved there
+    so autostart_nebula_tracked() can bring it back after an API restart, and
+    if pid_file is set the running process's pid is kept there for other
+    processes to see.
+
+    The tracked process's stdout/stderr are drained by reader threads into
+    the `logs` ring buffer.
+    """
+
+    def __init__(
+        self,
+        nebula_path: str = './bin/nebula',
+        cert_path: str = './bin/nebula-cert',
+        supervise: bool = False,
+        state_file: Optional[str] = None,
+        pid_file: Optional[str] = None,
+    ):
         self.nebula_path = nebula_path
         self.cert_path = cert_path
+        self.supervise = supervise
+        self.state_file = state_file
+        self.pid_file = pid_file
         self._nebula_proc: Optional[subprocess.Popen] = None
         self._nebula_proc_lock = threading.Lock()
         self._nebula_proc_monitor: Optional[threading.Thread] = None
         self._nebula_proc_status: Optional[int] = None  # None=running, int=exit code
+        # Supervisor state; _generation changes on every manual start/stop so
+        # monitors of an older process know to stand down
+        self._config_path: Optional[str] = None
+        self._generation = 0
+        self._want_running = False
+        self._stop_event = threading.Event()
+        self._started_at: Optional[float] = None
+        self._restart_at: Optional[float] = None
+        self._restarts = 0
+        self._crashes = 0
+        self._recent_crashes: deque = deque()
+        self._circuit_open = False
+        self._last_exit_code: Optional[int] = None
+        self._last_exit_at: Optional[float] = None
+        self.logs = LogBuffer()
 
     def nebula_version(self) -> str:
         return self._run([self.nebula_path, '-version'])
@@ -20,6 +163,18 @@ class NebulaAPI:
     def nebula_test(self, config_path: str) -> str:
         return self._run([self.nebula_path, '-test', '-config', config_path])
 
+    def nebula_validate(self, config_path: str) -> tuple[bool, str]:
+        """
+        Run `nebula -test` on a config. Returns (ok, output).
+        """
+        cmd = [self.nebula_path, '-test', '-config', config_path]
+        print("Running command:", ' '.join(cmd))
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True)
+        except OSError as e:
+            return False, str(e)
+        return result.returncode == 0, (result.stdout.strip() + '\n' + result.stderr.strip()).strip()
+
     def nebula_run(self, config_path: str) -> str:
         return self._run([self.nebula_path, '-config', config_path])
 
@@ -67,55 +222,130 @@ class NebulaAPI:
 
         Returns:
             Output from nebula-cert command
+
+        The certificate is signed in-process when possible (see nebula_cert.py);
+        nebula-cert is used as the fallback.
         """
-        cmd = [
-            self.cert_path, "sign",
-            "-name", name,
-            "-networks", networks,
-            "-out-crt", out_crt,
-            "-out-key", out_key,
-            "-ca-crt", ca_crt,
-            "-ca-key", ca_key,
-            "-version", "2",
-        ]
-        if groups:
-            cmd += ["-groups", groups]
-        if duration:
-            cmd += ["-duration", duration]
-        if in_pub:
-            cmd += ["-in-pub", in_pub]
-        if out_qr:
-            cmd += ["-out-qr", out_qr]
-        if subnets:
-            cmd += ["-subnets", subnets]
+        result = sign_cert_in_process(
+            name=name, networks=networks, out_crt=out_crt, out_key=out_key, ca_crt=ca_crt, ca_key=ca_key,
+            groups=groups, duration=duration, in_pub=in_pub, out_qr=out_qr, subnets=subnets,
+        )
+        if result is not None:
+            return result
+        cmd = build_sign_cert_cmd(
+            self.cert_path, name, networks, out_crt, out_key, ca_crt, ca_key,
+            groups=groups, duration=duration, in_pub=in_pub, out_qr=out_qr, subnets=subnets,
+        )
         return self._run(cmd)
 
     def run_nebula_tracked(self, config_path: str) -> None:
         """
         Run nebula as a tracked background process.
+
+        If the config passes `nebula -test` it becomes the rollback point for
+        reloads; supervisor restarts never touch the saved copy.
         """
+        # Validated before taking the lock, so status/stop/logs calls don't wait on `nebula -test`
+        valid = self.nebula_validate(config_path)[0]
         with self._nebula_proc_lock:
             if self._nebula_proc and self._nebula_proc.poll() is None:
                 raise RuntimeError("Nebula process already running")
-            cmd = [self.nebula_path, '-config', config_path]
-            self._nebula_proc = subprocess.Popen(cmd)
-            self._nebula_proc_status = None
-            self._nebula_proc_monitor = threading.Thread(target=self._monitor_nebula_proc, daemon=True)
+            if valid:
+                self._save_last_good(config_path)
+            proc = self._spawn(config_path)
+            self._generation += 1
+            self._config_path = config_path
+            self._want_running = True
+            self._stop_event.clear()
+            # A manual start closes the crash-loop circuit
+            self._circuit_open = False
+            self._recent_crashes.clear()
+            self._restart_at = None
+            self._save_state()
+            self._nebula_proc_monitor = threading.Thread(
+                target=self._monitor_nebula_proc, args=(proc, self._generation), daemon=True
+            )
             self._nebula_proc_monitor.start()
 
-    def stop_nebula_tracked(self) -> None:
+    def stop_nebula_tracked(self, remember: bool = True) -> None:
         """
         Stop the tracked nebula process if running.
+        With remember=False the saved state still says "running", e.g. when the API is shutting down.
         """
         with self._nebula_proc_lock:
+            self._generation += 1
+            self._want_running = False
+            self._stop_event.set()
+            self._restart_at = None
             if self._nebula_proc and self._nebula_proc.poll() is None:
                 self._nebula_proc.terminate()
                 try:
                     self._nebula_proc.wait(timeout=10)
                 except subprocess.TimeoutExpired:
                     self._nebula_proc.kill()
+                self.logs.append("Stopped nebula", "supervisor")
+                self._write_pid_file(None)
             self._nebula_proc = None
             self._nebula_proc_status = None
+            self._started_at = None
+            if remember:
+                self._save_state()
+
+    def autostart_nebula_tracked(self) -> bool:
+        """
+        Start the tracked process if the saved state says it was running. Returns True if started.
+        """
+        state = self._load_state()
+        config_path = state.get("config_path")
+        if not state.get("running") or not config_path or not os.path.exists(config_path):
+            return False
+        with self._nebula_proc_lock:
+            if self._nebula_proc and self._nebula_proc.poll() is None:
+                return False
+        self._stop_orphan()
+        print(f"Nebula was running before, starting it with {config_path}")
+        self.run_nebula_tracked(config_path)
+        return True
+
+    def reload_nebula_tracked(self, config_path: str) -> bool:
+        """
+        Apply a changed config to the tracked nebula process without restarting it.
+
+        The config is checked with `nebula -test` first. If it passes, the
+        process gets SIGHUP and reloads config and certificates in place, so
+        existing tunnels and handshakes keep working. If it fails, the last
+        config that passed is restored and NebulaConfigError is raised; the
+        running process is left untouched.
+
+        Returns True if a running process was signalled, False if nebula isn't
+        running (the config was only validated).
+        """
+        ok, output = self.nebula_validate(config_path)
+        with self._nebula_proc_lock:
+            if not ok:
+                rolled_back = self._restore_last_good(config_path)
+                detail = "previous config restored" if rolled_back else "no previous config to restore"
+                raise NebulaConfigError(f"Config validation failed ({detail}): {output}")
+            self._save_last_good(config_path)
+            if self._nebula_proc is None or self._nebula_proc.poll() is not None:
+                return False
+            self._nebula_proc.send_signal(signal.SIGHUP)
+            return True
+
+    def _save_last_good(self, config_path: str) -> None:
+        if os.path.exists(config_path):
+            tmp = last_good_path(config_path) + ".tmp"
+            shutil.copyfile(config_path, tmp)
+            os.replace(tmp, last_good_path(config_path))
+
+    def _restore_last_good(self, config_path: str) -> bool:
+        backup = last_good_path(config_path)
+        if not os.path.exists(backup):
+            return False
+        tmp = config_path + ".tmp"
+        shutil.copyfile(backup, tmp)
+        os.replace(tmp, config_path)
+        return True
 
     def nebula_tracked_status(self) -> Optional[int]:
         """
@@ -129,21 +359,171 @@ class NebulaAPI:
                 self._nebula_proc_status = ret
             return self._nebula_proc_status
 
-    def _monitor_nebula_proc(self):
+    def supervisor_status(self) -> dict:
         """
-        Monitor the nebula process and clean up if it exits.
+        State of the tracked process with uptime and restart/crash counters.
         """
-        proc = self._nebula_proc
-        if proc is None:
-            return
-        ret = proc.wait()
         with self._nebula_proc_lock:
-            self._nebula_proc_status = ret
-            self._nebula_proc = None
+            now = time.monotonic()
+            running = self._nebula_proc is not None and self._nebula_proc.poll() is None
+            if running:
+                status = "running"
+            elif self._circuit_open:
+                status = "crash_loop"
+            elif self._restart_at is not None:
+                status = "restarting"
+            else:
+                status = "stopped"
+            return {
+                "status": status,
+                "pid": self._nebula_proc.pid if running else None,
+                "supervised": self.supervise,
+                "uptime_seconds": now - self._started_at if running and self._started_at else 0.0,
+                "restarts": self._restarts,
+                "crashes": self._crashes,
+                "recent_crashes": len(self._recent_crashes),
+                "circuit_open": self._circuit_open,
+                "next_restart_in": max(0.0, self._restart_at - now) if self._restart_at is not None else None,
+                "last_exit_code": self._last_exit_code,
+                "last_exit_at": self._last_exit_at,
+            }
+
+    def _spawn(self, config_path: str) -> subprocess.Popen:
+        # Callers hold _nebula_proc_lock
+        cmd = [self.nebula_path, '-config', config_path]
+        self.logs.format = config_log_format(config_path)
+        self._nebula_proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._nebula_proc_status = None
+        self._started_at = time.monotonic()
+        self.logs.append(f"Started nebula (pid {self._nebula_proc.pid}) with {config_path}", "supervisor")
+        self._write_pid_file(self._nebula_proc.pid)
+        for pipe, stream in ((self._nebula_proc.stdout, "stdout"), (self._nebula_proc.stderr, "stderr")):
+            threading.Thread(target=self._pump_output, args=(pipe, stream), daemon=True).start()
+        return self._nebula_proc
+
+    def _pump_output(self, pipe, stream: str) -> None:
+        # Runs until the process closes its end of the pipe
+        with pipe:
+            for raw in iter(lambda: pipe.readline(MAX_LINE_BYTES), b""):
+                self.logs.append(raw.decode("utf-8", "replace"), stream)
+
+    def _monitor_nebula_proc(self, proc: Optional[subprocess.Popen], generation: int):
+        """
+        Wait for the tracked process to exit; clean up, and restart it if it
+        crashed while supervised.
+        """
+        while True:
+            # proc is None when a restart failed to spawn; that counts as a crash too
+            ret = proc.wait() if proc is not None else None
+            with self._nebula_proc_lock:
+                if generation != self._generation or self._nebula_proc is not proc:
+                    # Stopped or restarted by hand in the meantime
+                    return
+                self._nebula_proc = None
+                self._nebula_proc_status = ret
+                self._started_at = None
+                self._last_exit_code = ret
+                self._last_exit_at = time.time()
+                self.logs.append(f"Nebula exited with code {ret}", "supervisor")
+                self._write_pid_file(None)
+                if not (self.supervise and self._want_running):
+                    return
+                delay = self._record_crash()
+                if delay is None:
+                    print(f"Nebula exited with code {ret}; {len(self._recent_crashes)} crashes in "
+                          f"{NEBULA_CRASH_LOOP_WINDOW:.0f}s, not restarting until started again")
+                    return
+                self._restart_at = time.monotonic() + delay
+            print(f"Nebula exited with code {ret}, restarting in {delay:.1f}s")
+            if self._stop_event.wait(delay):
+                return
+            with self._nebula_proc_lock:
+                if generation != self._generation or not self._want_running:
+                    return
+                self._restart_at = None
+                self._restarts += 1
+                try:
+                    proc = self._spawn(self._config_path)
+                except OSError as e:
+                    print(f"Failed to restart nebula: {e}")
+                    proc = None
+
+    def _record_crash(self) -> Optional[float]:
+        """
+        Count a crash and return the delay before the next restart, or None if
+        the crash-loop limit was hit. Callers hold _nebula_proc_lock.
+        """
+        now = time.monotonic()
+        self._crashes += 1
+        self._recent_crashes.append(now)
+        while self._recent_crashes and now - self._recent_crashes[0] > NEBULA_CRASH_LOOP_WINDOW:
+            self._recent_crashes.popleft()
+        if len(self._recent_crashes) >= NEBULA_CRASH_LOOP_RESTARTS:
+            self._circuit_open = True
+            return None
+        return min(NEBULA_RESTART_BACKOFF_MAX, NEBULA_RESTART_BACKOFF_MIN * 2 ** (len(self._recent_crashes) - 1))
+
+    def _stop_orphan(self) -> None:
+        """
+        Terminate a nebula left running by a previous owner that died without
+        stopping it; it still holds the lighthouse port and can't be adopted.
+        """
+        if not self.pid_file:
+            return
+        pid = read_pid_file(self.pid_file)
+        if pid is None:
+            return
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                if os.path.basename(self.nebula_path).encode() not in f.read():
+                    # The pid was reused by something else
+                    return
+        except OSError:
+            pass
+        print(f"Stopping orphaned nebula process {pid}")
+        try:
+            os.kill(pid, signal.SIGTERM)
+            for _ in range(100):
+                os.kill(pid, 0)
+                time.sleep(0.1)
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    def _write_pid_file(self, pid: Optional[int]) -> None:
+        if not self.pid_file:
+            return
+        if pid is None:
+            if os.path.exists(self.pid_file):
+                os.remove(self.pid_file)
+            return
+        os.makedirs(os.path.dirname(self.pid_file), exist_ok=True)
+        tmp = self.pid_file + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(f"{pid}\n")
+        os.replace(tmp, self.pid_file)
+
+    def _save_state(self) -> None:
+        if not self.state_file:
+            return
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        tmp = self.state_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"running": self._want_running, "config_path": self._config_path}, f)
+        os.replace(tmp, self.state_file)
+
+    def _load_state(self) -> dict:
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
 
     def __del__(self):
         # Ensure nebula process is stopped on object deletion
-        self.stop_nebula_tracked()
+        self.stop_nebula_tracked(remember=False)
 
     def _run(self, cmd: list) -> str:
         try:
@@ -165,3 +545,73 @@ class NebulaAPI:
         """
         cmd = [self.cert_path, "print", "-path", cert_path, "-json"]
         return self._run(cmd)
+
+
+_nebula_api: Optional[NebulaAPI] = None
+_nebula_api_lock = threading.Lock()
+
+
+def get_nebula_api() -> NebulaAPI:
+    """
+    Return the process-wide NebulaAPI. It runs the command wrappers for every
+    router and tracks (and supervises) the lighthouse process.
+    """
+    global _nebula_api
+    with _nebula_api_lock:
+        if _nebula_api is None:
+            _nebula_api = NebulaAPI(supervise=True, state_file=NEBULA_PROCESS_STATE, pid_file=NEBULA_PID_FILE)
+        return _nebula_api
+
+
+class AsyncNebulaAPI:
+    """
+    asyncio flavour of the NebulaAPI command wrappers for use in request handlers.
+
+    Commands run through asyncio.create_subprocess_exec, so a slow
+    nebula-cert call only suspends the handler that awaits it instead of
+    blocking the event loop. At most max_concurrency commands run at once;
+    the rest wait on a semaphore.
+    """
+
+    def __init__(self, nebula_path: str = './bin/nebula', cert_path: str = './bin/nebula-cert', max_concurrency: int = NEBULA_MAX_SUBPROCESSES):
+        self.nebula_path = nebula_path
+        self.cert_path = cert_path
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def nebula_test(self, config_path: str) -> str:
+        return await self._run([self.nebula_path, '-test', '-config', config_path])
+
+    async def cert_mode(self, mode: str, flags: Optional[list] = None) -> str:
+        cmd = [self.cert_path, mode]
+        if flags:
+            cmd.extend(flags)
+        return await self._run(cmd)
+
+    async def sign_cert(self, name: str, networks: str, out_crt: str, out_key: str, **kwargs) -> str:
+        """
+        Sign and create a Nebula certificate for a host. Takes the same arguments as NebulaAPI.sign_cert.
+        """
+        result = await asyncio.to_thread(
+            sign_cert_in_process, name=name, networks=networks, out_crt=out_crt, out_key=out_key, **kwargs
+        )
+        if result is not None:
+            return result
+        cmd = build_sign_cert_cmd(self.cert_path, name, networks, out_crt, out_key, **kwargs)
+        return await self._run(cmd)
+
+    async def print_cert(self, cert_path: str) -> str:
+        cmd = [self.cert_path, "print", "-path", cert_path, "-json"]
+        return await self._run(cmd)
+
+    async def _run(self, cmd: list) -> str:
+        async with self._semaphore:
+            print("Running command:", ' '.join(cmd))
+            proc = await asyncio.create_subprocess_exec(
+                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            stdout, stderr = await proc.communicate()
+        stdout = stdout.decode().strip()
+        stderr = stderr.decode().strip()
+        if proc.returncode != 0:
+            return stdout + '\n' + stderr
+        return stdout or stderr
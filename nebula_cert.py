@@ -0,0 +1,478 @@
+"""
+In-process signing of Nebula v2 host certificates.
+
+This mirrors what `nebula-cert sign -version 2` does for Curve25519 CAs:
+an X25519 host keypair, a DER-encoded details structure and an Ed25519
+signature by the CA, written out in the same PEM formats. Keeping the CA
+loaded in memory avoids a fork and two file reads per host. Anything this
+module does not handle (P256 or encrypted CAs, v1-only CAs, QR output)
+raises UnsupportedSigningError so callers can fall back to nebula-cert.
+"""
+import base64
+import hashlib
+import ipaddress
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+try:
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+except ImportError:  # pragma: no cover - cryptography ships with python-jose[cryptography]
+    Ed25519PrivateKey = None
+    X25519PrivateKey = None
+
+CERTIFICATE_V2_BANNER = "NEBULA CERTIFICATE V2"
+X25519_PRIVATE_KEY_BANNER = "NEBULA X25519 PRIVATE KEY"
+X25519_PUBLIC_KEY_BANNER = "NEBULA X25519 PUBLIC KEY"
+ED25519_PRIVATE_KEY_BANNER = "NEBULA ED25519 PRIVATE KEY"
+
+CURVE_CURVE25519 = 0
+
+# ASN.1 tags used by the v2 certificate format (see nebula cert/cert_v2.asn1)
+_CLASS_CONSTRUCTED = 0x20
+_CLASS_CONTEXT_SPECIFIC = 0x80
+TAG_SEQUENCE = 0x30
+TAG_OCTET_STRING = 0x04
+TAG_UTF8_STRING = 0x0c
+TAG_CERT_DETAILS = 0 | _CLASS_CONSTRUCTED | _CLASS_CONTEXT_SPECIFIC
+TAG_CERT_CURVE = 1 | _CLASS_CONTEXT_SPECIFIC
+TAG_CERT_PUBLIC_KEY = 2 | _CLASS_CONTEXT_SPECIFIC
+TAG_CERT_SIGNATURE = 3 | _CLASS_CONTEXT_SPECIFIC
+TAG_DETAILS_NAME = 0 | _CLASS_CONTEXT_SPECIFIC
+TAG_DETAILS_NETWORKS = 1 | _CLASS_CONSTRUCTED | _CLASS_CONTEXT_SPECIFIC
+TAG_DETAILS_UNSAFE_NETWORKS = 2 | _CLASS_CONSTRUCTED | _CLASS_CONTEXT_SPECIFIC
+TAG_DETAILS_GROUPS = 3 | _CLASS_CONSTRUCTED | _CLASS_CONTEXT_SPECIFIC
+TAG_DETAILS_IS_CA = 4 | _CLASS_CONTEXT_SPECIFIC
+TAG_DETAILS_NOT_BEFORE = 5 | _CLASS_CONTEXT_SPECIFIC
+TAG_DETAILS_NOT_AFTER = 6 | _CLASS_CONTEXT_SPECIFIC
+TAG_DETAILS_ISSUER = 7 | _CLASS_CONTEXT_SPECIFIC
+
+
+class UnsupportedSigningError(Exception):
+    """The request needs a feature only nebula-cert provides; fall back to the subprocess."""
+
+
+class SigningError(Exception):
+    """The request is invalid, e.g. it violates the CA's constraints."""
+
+
+# --- PEM ---
+
+def pem_encode(banner: str, data: bytes) -> bytes:
+    """
+    Encode like Go's pem.EncodeToMemory: 64 character base64 lines.
+    """
+    b64 = base64.b64encode(data).decode()
+    lines = [b64[i:i + 64] for i in range(0, len(b64), 64)]
+    return (f"-----BEGIN {banner}-----\n" + "".join(line + "\n" for line in lines) + f"-----END {banner}-----\n").encode()
+
+
+_PEM_RE = re.compile(rb"-----BEGIN ([A-Z0-9 ]+)-----\r?\n(.*?)-----END \1-----", re.S)
+
+
+def pem_blocks(data: bytes) -> list[tuple[str, bytes]]:
+    return [(m.group(1).decode(), base64.b64decode(b"".join(m.group(2).split()))) for m in _PEM_RE.finditer(data)]
+
+
+def pem_decode(data: bytes, banner: str) -> bytes:
+    for block_banner, block in pem_blocks(data):
+        if block_banner == banner:
+            return block
+    found = ", ".join(b for b, _ in pem_blocks(data)) or "none"
+    raise UnsupportedSigningError(f"no {banner} block found (found: {found})")
+
+
+# --- DER ---
+
+def _der_length(n: int) -> bytes:
+    if n < 0x80:
+        return bytes([n])
+    body = n.to_bytes((n.bit_length() + 7) // 8, "big")
+    return bytes([0x80 | len(body)]) + body
+
+
+def der(tag: int, content: bytes) -> bytes:
+    return bytes([tag]) + _der_length(len(content)) + content
+
+
+def der_int(tag: int, value: int) -> bytes:
+    # Minimal two's complement, as cryptobyte's AddASN1Int64WithTag writes it
+    return der(tag, value.to_bytes((value.bit_length() + 8) // 8, "big", signed=True))
+
+
+def der_read(data: bytes, offset: int = 0) -> tuple[int, bytes, int]:
+    """
+    Read one TLV at offset, returning (tag, content, next_offset).
+    """
+    if offset + 2 > len(data):
+        raise ValueError("truncated DER")
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        num = length & 0x7f
+        if num == 0 or num > 4 or offset + num > len(data):
+            raise ValueError("invalid DER length")
+        length = int.from_bytes(data[offset:offset + num], "big")
+        offset += num
+    if offset + length > len(data):
+        raise ValueError("truncated DER")
+    return tag, data[offset:offset + length], offset + length
+
+
+def der_children(data: bytes) -> list[tuple[int, bytes]]:
+    children = []
+    offset = 0
+    while offset < len(data):
+        tag, content, offset = der_read(data, offset)
+        children.append((tag, content))
+    return children
+
+
+# --- Networks ---
+
+def network_bytes(network) -> bytes:
+    # netip.Prefix.MarshalBinary: the (unmasked) address followed by the prefix length
+    return network.ip.packed + bytes([network.network.prefixlen])
+
+
+def parse_network(data: bytes):
+    if len(data) not in (5, 17):
+        raise ValueError("invalid network encoding")
+    address = ipaddress.ip_address(data[:-1])
+    return ipaddress.ip_interface(f"{address}/{data[-1]}")
+
+
+def _compare_key(network):
+    # nebula sorts networks by address (v4 before v6) and then by prefix length
+    return (network.ip.version, int(network.ip), network.network.prefixlen)
+
+
+def parse_networks(value: Optional[str]) -> list:
+    if not value:
+        return []
+    networks = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            networks.append(ipaddress.ip_interface(item))
+        except ValueError as e:
+            raise SigningError(f"invalid network definition: {item}") from e
+    return networks
+
+
+# --- Durations ---
+
+_DURATION_UNITS = {"ns": 1e-9, "us": 1e-6, "µs": 1e-6, "ms": 1e-3, "s": 1, "m": 60, "h": 3600}
+_DURATION_RE = re.compile(r"(\d+(?:\.\d*)?|\.\d+)(ns|us|µs|ms|s|m|h)")
+
+
+def parse_duration(value: str) -> float:
+    """
+    Parse a Go duration string such as '8760h' or '1h30m' into seconds.
+    """
+    text = value.strip()
+    sign = 1
+    if text[:1] in "+-":
+        sign = -1 if text[0] == "-" else 1
+        text = text[1:]
+    if text == "0":
+        return 0.0
+    pos = 0
+    total = 0.0
+    for m in _DURATION_RE.finditer(text):
+        if m.start() != pos:
+            break
+        total += float(m.group(1)) * _DURATION_UNITS[m.group(2)]
+        pos = m.end()
+    if pos != len(text) or not text:
+        raise SigningError(f"invalid duration: {value}")
+    return sign * total
+
+
+# --- Certificates ---
+
+@dataclass
+class CertificateV2:
+    name: str
+    networks: list = field(default_factory=list)
+    unsafe_networks: list = field(default_factory=list)
+    groups: list = field(default_factory=list)
+    is_ca: bool = False
+    not_before: int = 0
+    not_after: int = 0
+    issuer: str = ""
+    curve: int = CURVE_CURVE25519
+    public_key: bytes = b""
+    signature: bytes = b""
+    raw: bytes = b""
+    # The details element exactly as it was read, so parsed certs hash and verify as issued
+    raw_details: bytes = b""
+
+    def marshal_details(self) -> bytes:
+        if self.raw_details:
+            return self.raw_details
+        content = der(TAG_DETAILS_NAME, self.name.encode())
+        if self.networks:
+            content += der(TAG_DETAILS_NETWORKS, b"".join(der(TAG_OCTET_STRING, network_bytes(n)) for n in self.networks))
+        if self.unsafe_networks:
+            content += der(TAG_DETAILS_UNSAFE_NETWORKS, b"".join(der(TAG_OCTET_STRING, network_bytes(n)) for n in self.unsafe_networks))
+        if self.groups:
+            content += der(TAG_DETAILS_GROUPS, b"".join(der(TAG_UTF8_STRING, g.encode()) for g in self.groups))
+        if self.is_ca:
+            content += der(TAG_DETAILS_IS_CA, b"\xff")
+        content += der_int(TAG_DETAILS_NOT_BEFORE, self.not_before)
+        content += der_int(TAG_DETAILS_NOT_AFTER, self.not_after)
+        if self.issuer:
+            content += der(TAG_DETAILS_ISSUER, bytes.fromhex(self.issuer))
+        return der(TAG_CERT_DETAILS, content)
+
+    def marshal_for_signing(self) -> bytes:
+        return self.marshal_details() + bytes([self.curve]) + self.public_key
+
+    def marshal(self) -> bytes:
+        content = self.marshal_details()
+        if self.curve != CURVE_CURVE25519:
+            content += der(TAG_CERT_CURVE, bytes([self.curve]))
+        if self.public_key:
+            content += der(TAG_CERT_PUBLIC_KEY, self.public_key)
+        content += der(TAG_CERT_SIGNATURE, self.signature)
+        return der(TAG_SEQUENCE, content)
+
+    def marshal_pem(self) -> bytes:
+        return pem_encode(CERTIFICATE_V2_BANNER, self.marshal())
+
+    def fingerprint(self) -> str:
+        # As nebula's certificateV2.Fingerprint: sha256(details || curve || public key || signature)
+        return hashlib.sha256(self.marshal_for_signing() + self.signature).hexdigest()
+
+    def to_json(self) -> dict:
+        """
+        Same shape as one entry of `nebula-cert print -json` for a v2 cert.
+        """
+        return {
+            "curve": "CURVE25519" if self.curve == CURVE_CURVE25519 else "P256",
+            "details": {
+                "groups": list(self.groups),
+                "isCa": self.is_ca,
+                "issuer": self.issuer,
+                "name": self.name,
+                "networks": [str(n) for n in self.networks],
+                "notAfter": _rfc3339(self.not_after),
+                "notBefore": _rfc3339(self.not_before),
+                "unsafeNetworks": [str(n) for n in self.unsafe_networks],
+            },
+            "fingerprint": self.fingerprint(),
+            "publicKey": self.public_key.hex(),
+            "signature": self.signature.hex(),
+            "version": 2,
+        }
+
+    @classmethod
+    def unmarshal(cls, raw: bytes) -> "CertificateV2":
+        tag, body, end = der_read(raw)
+        if tag != TAG_SEQUENCE or end != len(raw):
+            raise ValueError("not a v2 certificate")
+        cert = cls(name="", raw=raw)
+        offset = 0
+        while offset < len(body):
+            start = offset
+            child_tag, content, offset = der_read(body, offset)
+            if child_tag == TAG_CERT_DETAILS:
+                cert._unmarshal_details(content)
+                cert.raw_details = body[start:offset]
+            elif child_tag == TAG_CERT_CURVE:
+                cert.curve = content[0]
+            elif child_tag == TAG_CERT_PUBLIC_KEY:
+                cert.public_key = content
+            elif child_tag == TAG_CERT_SIGNATURE:
+                cert.signature = content
+        return cert
+
+    def _unmarshal_details(self, content: bytes) -> None:
+        for tag, value in der_children(content):
+            if tag == TAG_DETAILS_NAME:
+                self.name = value.decode()
+            elif tag == TAG_DETAILS_NETWORKS:
+                self.networks = [parse_network(v) for _, v in der_children(value)]
+            elif tag == TAG_DETAILS_UNSAFE_NETWORKS:
+                self.unsafe_networks = [parse_network(v) for _, v in der_children(value)]
+            elif tag == TAG_DETAILS_GROUPS:
+                self.groups = [v.decode() for _, v in der_children(value)]
+            elif tag == TAG_DETAILS_IS_CA:
+                self.is_ca = value == b"\xff"
+            elif tag == TAG_DETAILS_NOT_BEFORE:
+                self.not_before = int.from_bytes(value, "big", signed=True)
+            elif tag == TAG_DETAILS_NOT_AFTER:
+                self.not_after = int.from_bytes(value, "big", signed=True)
+            elif tag == TAG_DETAILS_ISSUER:
+                self.issuer = value.hex()
+
+
+def _rfc3339(ts: int) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts))
+
+
+def load_certificate_v2(pem_data: bytes) -> CertificateV2:
+    return CertificateV2.unmarshal(pem_decode(pem_data, CERTIFICATE_V2_BANNER))
+
+
+# --- Signing ---
+
+@dataclass
+class _LoadedCA:
+    cert: CertificateV2
+    key: object
+    stamp: tuple
+
+
+class NebulaSigner:
+    """
+    Signs v2 host certificates with a CA that is loaded once and kept in memory.
+
+    The CA is re-read only when its cert or key file changes on disk.
+    """
+
+    def __init__(self):
+        self._cas: dict[tuple[str, str], _LoadedCA] = {}
+        self._lock = threading.Lock()
+
+    def load_ca(self, ca_crt: str, ca_key: str) -> _LoadedCA:
+        if Ed25519PrivateKey is None:
+            raise UnsupportedSigningError("the cryptography package is not installed")
+        try:
+            stamp = (os.stat(ca_crt).st_mtime_ns, os.stat(ca_key).st_mtime_ns)
+        except FileNotFoundError as e:
+            raise SigningError(f"error while reading ca: {e}") from e
+        with self._lock:
+            loaded = self._cas.get((ca_crt, ca_key))
+            if loaded is not None and loaded.stamp == stamp:
+                return loaded
+
+            with open(ca_crt, "rb") as f:
+                ca_cert_pem = f.read()
+            with open(ca_key, "rb") as f:
+                ca_key_pem = f.read()
+
+            try:
+                cert = load_certificate_v2(ca_cert_pem)
+            except ValueError as e:
+                raise SigningError(f"error while parsing ca-crt: {e}") from e
+            if cert.curve != CURVE_CURVE25519:
+                raise UnsupportedSigningError("only Curve25519 CAs are signed in-process")
+            if not cert.is_ca:
+                raise SigningError("ca-crt is not a CA certificate")
+
+            raw_key = pem_decode(ca_key_pem, ED25519_PRIVATE_KEY_BANNER)
+            if len(raw_key) != 64:
+                raise SigningError("invalid Ed25519 private key length")
+            if raw_key[32:] != cert.public_key:
+                raise SigningError("refusing to sign, root certificate does not match private key")
+            key = Ed25519PrivateKey.from_private_bytes(raw_key[:32])
+
+            loaded = _LoadedCA(cert=cert, key=key, stamp=stamp)
+            self._cas[(ca_crt, ca_key)] = loaded
+            return loaded
+
+    def sign(
+        self,
+        name: str,
+        networks: str,
+        out_crt: str,
+        out_key: str,
+        ca_crt: str = "ca.crt",
+        ca_key: str = "ca.key",
+        groups: Optional[str] = None,
+        duration: Optional[str] = None,
+        in_pub: Optional[str] = None,
+        out_qr: Optional[str] = None,
+        subnets: Optional[str] = None,
+    ) -> CertificateV2:
+        """
+        Sign a host certificate and write it (and the new private key, unless
+        in_pub is given) to disk. Takes the same arguments as NebulaAPI.sign_cert.
+        """
+        if out_qr:
+            raise UnsupportedSigningError("QR code output is only supported by nebula-cert")
+
+        ca = self.load_ca(ca_crt, ca_key)
+        now = time.time()
+        if now > ca.cert.not_after:
+            raise SigningError("ca certificate is expired")
+
+        if duration:
+            seconds = parse_duration(duration)
+        else:
+            seconds = 0
+        if seconds <= 0:
+            # Default to one second before the CA expires, like nebula-cert
+            seconds = ca.cert.not_after - now - 1
+
+        host_networks = sorted(parse_networks(networks), key=_compare_key)
+        if not host_networks:
+            raise SigningError("no networks provided")
+        unsafe_networks = sorted(parse_networks(subnets), key=_compare_key)
+        group_list = [g.strip() for g in (groups or "").split(",") if g.strip()]
+
+        if in_pub:
+            with open(in_pub, "rb") as f:
+                public_key = pem_decode(f.read(), X25519_PUBLIC_KEY_BANNER)
+            private_key = None
+        else:
+            if os.path.exists(out_key):
+                raise SigningError(f"refusing to overwrite existing key: {out_key}")
+            private_key = os.urandom(32)
+            public_key = X25519PrivateKey.from_private_bytes(private_key).public_key().public_bytes_raw()
+        if os.path.exists(out_crt):
+            raise SigningError(f"refusing to overwrite existing cert: {out_crt}")
+
+        cert = CertificateV2(
+            name=name,
+            networks=host_networks,
+            unsafe_networks=unsafe_networks,
+            groups=group_list,
+            not_before=int(now),
+            not_after=int(now + seconds),
+            issuer=ca.cert.fingerprint(),
+            public_key=public_key,
+        )
+        _check_ca_constraints(ca.cert, cert)
+        cert.signature = ca.key.sign(cert.marshal_for_signing())
+
+        if private_key is not None:
+            _write_private(out_key, pem_encode(X25519_PRIVATE_KEY_BANNER, private_key))
+        _write_private(out_crt, cert.marshal_pem())
+        return cert
+
+
+def _check_ca_constraints(ca: CertificateV2, cert: CertificateV2) -> None:
+    if cert.not_before < ca.not_before:
+        raise SigningError("certificate is valid before the signing certificate")
+    if cert.not_after > ca.not_after:
+        raise SigningError("certificate expires after signing certificate")
+    if ca.groups:
+        for group in cert.groups:
+            if group not in ca.groups:
+                raise SigningError(f"certificate contained a group not present on the signing ca: {group}")
+    for networks, ca_networks in ((cert.networks, ca.networks), (cert.unsafe_networks, ca.unsafe_networks)):
+        if not ca_networks:
+            continue
+        for network in networks:
+            if not any(network.ip.version == c.ip.version and network.network.subnet_of(c.network) for c in ca_networks):
+                raise SigningError(f"certificate contained a network assignment outside the limitations of the signing ca: {network}")
+
+
+def _write_private(path: str, data: bytes) -> None:
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+
+
+# The CA stays loaded for the life of the process
+signer = NebulaSigner()
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from collections import deque
+from itertools import islice
+from typing import AsyncIterator, Optional
+
+import yaml
+
+from vars import NEBULA_LOG_MAX_LINES, NEBULA_LOG_MAX_BYTES
+
+# Longer lines are split; nebula's own lines are far shorter
+MAX_LINE_BYTES = 16 * 1024
+
+# logrus text format: time="..." level=info msg="Handshake message sent" ...
+_TEXT_LEVEL_RE = re.compile(r'\blevel=(\w+)')
+_TEXT_MSG_RE = re.compile(r'\bmsg="((?:[^"\\]|\\.)*)"')
+
+
+def config_log_format(config_path: str) -> str:
+    """
+    The logging.format ("text" or "json") a nebula config asks for.
+    """
+    try:
+        with open(config_path, 'r') as f:
+            config = yaml.safe_load(f) or {}
+        return str((config.get('logging') or {}).get('format') or 'text')
+    except (OSError, yaml.YAMLError, AttributeError):
+        return 'text'
+
+
+class LogBuffer:
+    """
+    Ring buffer of the tracked nebula process's output, bounded by both
+    line count and total bytes; the oldest lines are dropped first.
+
+    Lines are appended by the threads draining the process's stdout/stderr
+    and numbered with an increasing seq, so readers can ask for "everything
+    after seq N" and resume streams. With format "json" each line is parsed
+    into its fields; text lines get their level and msg pulled out.
+    """
+
+    def __init__(self, max_lines: int = NEBULA_LOG_MAX_LINES, max_bytes: int = NEBULA_LOG_MAX_BYTES):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.format = 'text'
+        self._entries: deque = deque()
+        self._bytes = 0
+        self._seq = 0
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._followers: set[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+
+    def append(self, line: str, stream: str = 'stdout') -> dict:
+        line = line.rstrip('\r\n')
+        entry = self._parse(line)
+        entry['stream'] = stream
+        entry['time'] = time.time()
+        size = len(line.encode('utf-8', 'replace'))
+        with self._lock:
+            self._seq += 1
+            entry['seq'] = self._seq
+            self._entries.append((entry, size))
+            self._bytes += size
+            while len(self._entries) > self.max_lines or (self._bytes > self.max_bytes and len(self._entries) > 1):
+                _, dropped_size = self._entries.popleft()
+                self._bytes -= dropped_size
+                self._dropped += 1
+            followers = list(self._followers)
+        for loop, event in followers:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The follower's event loop is gone
+                pass
+        return entry
+
+    def _parse(self, line: str) -> dict:
+        if self.format == 'json' and line.startswith('{'):
+            try:
+                fields = json.loads(line)
+            except ValueError:
+                fields = None
+            if isinstance(fields, dict):
+                return {'level': fields.get('level'), 'message': fields.get('msg', line), 'line': line, 'fields': fields}
+        level = _TEXT_LEVEL_RE.search(line)
+        msg = _TEXT_MSG_RE.search(line)
+        return {
+            'level': level.group(1) if level else None,
+            'message': msg.group(1) if msg else line,
+            'line': line,
+        }
+
+    def tail(self, limit: Optional[int] = None, since: Optional[int] = None, level: Optional[str] = None) -> list[dict]:
+        """
+        The last `limit` entries (all if None) with seq above `since`, optionally only one level, oldest first.
+        """
+        with self._lock:
+            entries = self._entries
+            if since is not None and entries:
+                # seqs are contiguous, so the first entry after `since` is found by offset
+                first = entries[0][0]['seq']
+                entries = islice(entries, max(0, since - first + 1), None)
+            selected = [entry for entry, _ in entries if level is None or entry['level'] == level]
+        if limit is not None:
+            selected = selected[-limit:] if limit else []
+        return selected
+
+    def last_seq(self) -> int:
+        with self._lock:
+            return self._seq
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'format': self.format,
+                'lines': len(self._entries),
+                'bytes': self._bytes,
+                'dropped': self._dropped,
+                'last_seq': self._seq,
+                'max_lines': self.max_lines,
+                'max_bytes': self.max_bytes,
+            }
+
+    async def follow(self, since: int, level: Optional[str] = None, heartbeat: float = 15.0) -> AsyncIterator[list[dict]]:
+        """
+        Yield batches of new entries after `since` as they arrive; an empty
+        batch every `heartbeat` seconds when nothing was logged.
+        """
+        event = asyncio.Event()
+        follower = (asyncio.get_running_loop(), event)
+        with self._lock:
+            self._followers.add(follower)
+        try:
+            while True:
+                event.clear()
+                entries = self.tail(since=since)
+                if entries:
+                    since = entries[-1]['seq']
+                    if level is not None:
+                        entries = [entry for entry in entries if entry['level'] == level]
+                if entries:
+                    yield entries
+                    continue
+                try:
+                    await asyncio.wait_for(event.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield []
+        finally:
+            with self._lock:
+                self._followers.discard(follower)
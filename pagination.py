@@ -0,0 +1,131 @@
+import base64
+import binascii
+import json
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+MAX_PAGE_SIZE = 1000
+# Rows fetched from the backing store per query while streaming
+STREAM_BATCH_SIZE = 500
+
+# fetch(sort, descending, after, limit) -> rows
+FetchPage = Callable[[str, bool, Optional[list], Optional[int]], Awaitable[list[dict]]]
+
+
+def encode_cursor(sort: str, key: list) -> str:
+    raw = json.dumps({"s": sort, "k": key}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> list:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        key = data["k"]
+        cursor_sort = data["s"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_sort != sort or not isinstance(key, list):
+        raise HTTPException(status_code=400, detail="Cursor does not match sort order")
+    return key
+
+
+class Pagination:
+    """
+    Query parameters shared by the paginated listings: limit, cursor and sort
+    (a sort key, prefixed with '-' for descending order). An
+    `Accept: application/x-ndjson` header switches to streaming mode.
+
+    Cursors are keyset cursors: they carry the sort key of the last row
+    returned, so every page is a bounded indexed range query no matter how
+    deep into the listing it is.
+    """
+
+    def __init__(self, sort_keys: dict[str, tuple[str, ...]], default_sort: str):
+        # sort name -> row fields that make up its (unique) cursor key
+        self.sort_keys = sort_keys
+        self.default_sort = default_sort
+
+    def __call__(
+        self,
+        request: Request,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        sort: Optional[str] = None,
+    ) -> "PageRequest":
+        sort = sort or self.default_sort
+        name = sort.lstrip("-")
+        if name not in self.sort_keys:
+            raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(self.sort_keys)}")
+        after = decode_cursor(cursor, sort) if cursor else None
+        if after is not None and len(after) != len(self.sort_keys[name]):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        stream = NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+        return PageRequest(name, sort.startswith("-"), self.sort_keys[name], after, limit, stream)
+
+
+class PageRequest:
+    def __init__(self, sort: str, descending: bool, key_fields: tuple[str, ...],
+                 after: Optional[list], limit: Optional[int], stream: bool):
+        self.sort = sort
+        self.descending = descending
+        self.key_fields = key_fields
+        self.after = after
+        self.limit = limit
+        self.stream = stream
+
+    @property
+    def paginated(self) -> bool:
+        return self.limit is not None or self.after is not None
+
+    def cursor_for(self, row: dict) -> str:
+        return encode_cursor(f"{'-' if self.descending else ''}{self.sort}", [row[f] for f in self.key_fields])
+
+    async def respond(self, key: str, fetch: FetchPage, serialize: Callable[[Any], dict] = dict):
+        """
+        Answer a listing request in one of three shapes:
+
+        - NDJSON stream: one row per line, fetched from the store in batches
+        - a page: {key: [...], "next_cursor": ...} when limit or cursor is given
+        - the full list: {key: [...]}, as the listing always returned
+        """
+        if self.stream:
+            # Fetch the first batch up front so a bad cursor is still a 400, not a broken stream
+            batch = self._batch_size(self.limit)
+            first = await self._fetch(fetch, self.after, batch)
+            return StreamingResponse(self._ndjson(fetch, serialize, first, batch), media_type=NDJSON_MEDIA_TYPE)
+        if not self.paginated:
+            rows = await self._fetch(fetch, None, None)
+            return {key: [serialize(row) for row in rows]}
+        limit = self.limit or MAX_PAGE_SIZE
+        rows = [serialize(row) for row in await self._fetch(fetch, self.after, limit + 1)]
+        next_cursor = self.cursor_for(rows[limit - 1]) if len(rows) > limit else None
+        return {key: rows[:limit], "next_cursor": next_cursor}
+
+    @staticmethod
+    def _batch_size(remaining: Optional[int]) -> int:
+        return STREAM_BATCH_SIZE if remaining is None else min(STREAM_BATCH_SIZE, remaining)
+
+    async def _fetch(self, fetch: FetchPage, after: Optional[list], limit: Optional[int]) -> list:
+        try:
+            return await fetch(self.sort, self.descending, after, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e) or "Invalid cursor")
+
+    async def _ndjson(self, fetch: FetchPage, serialize: Callable[[Any], dict], rows: list, batch: int):
+        remaining = self.limit
+        while True:
+            for row in rows:
+                row = serialize(row)
+                yield json.dumps(row) + "\n"
+            if len(rows) < batch:
+                return
+            if remaining is not None:
+                remaining -= len(rows)
+                if remaining <= 0:
+                    return
+            after = [row[f] for f in self.key_fields]
+            batch = self._batch_size(remaining)
+            rows = await fetch(self.sort, self.descending, after, batch)
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Optional
+
+from fastapi_users.password import PasswordHelper
+from pwdlib import PasswordHash
+from pwdlib.hashers.argon2 import Argon2Hasher
+from pwdlib.hashers.bcrypt import BcryptHasher
+
+from vars import PASSWORD_ARGON2_MEMORY_COST, PASSWORD_ARGON2_TIME_COST, PASSWORD_HASH_WORKERS
+
+# Results computed by AsyncPasswordHelper.prepared(), keyed by the call they answer
+_prepared: ContextVar[Optional[dict]] = ContextVar("prepared_password_results", default=None)
+
+
+class AsyncPasswordHelper(PasswordHelper):
+    """
+    fastapi-users PasswordHelper with async hash/verify that run on a
+    dedicated, bounded thread pool instead of the event loop.
+
+    New hashes are Argon2 (the fastapi-users default) with the given cost;
+    hashes of a different cost are rehashed on the next login. bcrypt
+    hashes still verify and are rehashed to Argon2 too. Both libraries
+    release the GIL while hashing, so up to `workers` hashes run in
+    parallel; more wait in the pool's queue rather than piling onto the CPU.
+
+    fastapi-users' BaseUserManager calls the sync hash/verify_and_update;
+    wrapping its methods in prepared() runs those on the pool instead, so
+    the base class logic stays in use.
+    """
+
+    def __init__(
+        self,
+        time_cost: int = PASSWORD_ARGON2_TIME_COST,
+        memory_cost: int = PASSWORD_ARGON2_MEMORY_COST,
+        workers: int = PASSWORD_HASH_WORKERS,
+    ):
+        super().__init__(PasswordHash((Argon2Hasher(time_cost=time_cost, memory_cost=memory_cost), BcryptHasher())))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+
+    def hash(self, password: str) -> str:
+        prepared = _prepared.get()
+        if prepared is not None and ("hash", password) in prepared:
+            return prepared.pop(("hash", password))
+        return super().hash(password)
+
+    def verify_and_update(self, plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        prepared = _prepared.get()
+        if prepared is not None and ("verify", plain_password, hashed_password) in prepared:
+            return prepared.pop(("verify", plain_password, hashed_password))
+        try:
+            return super().verify_and_update(plain_password, hashed_password)
+        except ValueError:
+            # bcrypt refuses passwords over 72 bytes; none can match a bcrypt hash
+            return False, None
+
+    @asynccontextmanager
+    async def prepared(self, password: str, hashed_password: Optional[str] = None) -> AsyncIterator[None]:
+        """
+        Compute hash(password), or verify_and_update(password, hashed_password),
+        on the pool; the same call made inside the block returns that result
+        without hashing on the event loop. Other calls hash as usual.
+        """
+        if hashed_password is None:
+            results = {("hash", password): await self.hash_async(password)}
+        else:
+            results = {("verify", password, hashed_password): await self.verify_and_update_async(password, hashed_password)}
+        token = _prepared.set(results)
+        try:
+            yield
+        finally:
+            _prepared.reset(token)
+
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.hash, password)
+
+    async def verify_and_update_async(self, plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self.verify_and_update, plain_password, hashed_password
+        )
+
+
+_password_helper: Optional[AsyncPasswordHelper] = None
+_password_helper_lock = threading.Lock()
+
+
+def get_password_helper() -> AsyncPasswordHelper:
+    """
+    Return the process-wide AsyncPasswordHelper.
+    """
+    global _password_helper
+    with _password_helper_lock:
+        if _password_helper is None:
+            _password_helper = AsyncPasswordHelper()
+        return _password_helper
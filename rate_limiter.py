@@ -0,0 +1,116 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Optional
+
+from vars import RATE_LIMIT_DB
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 60 * 60, "day": 24 * 60 * 60}
+_RATE_RE = re.compile(r'^\s*(\d+)\s*(?:/|per)\s*(\d+)?\s*(second|minute|hour|day)s?\s*$')
+
+# Delete buckets that have been full (idle) for a while, every this many hits
+PRUNE_EVERY = 1000
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate: str) -> tuple[int, float]:
+    """
+    Parse a slowapi-style limit such as "5/minute" or "100 per 1 hour" into (count, period seconds).
+    """
+    match = _RATE_RE.match(rate.lower())
+    if not match:
+        raise ValueError(f"Invalid rate limit: {rate!r}")
+    count, multiplier, period = match.groups()
+    return int(count), int(multiplier or 1) * _PERIODS[period]
+
+
+class SQLiteRateLimiter:
+    """
+    Token-bucket rate limiter whose buckets live in a small SQLite database,
+    so every worker process on the host shares the same limits.
+
+    A bucket holds up to `count` tokens and refills at count/period per
+    second; each hit takes a token. The check-and-take is one BEGIN
+    IMMEDIATE transaction on a WAL database, a few tens of microseconds, so it
+    is cheap enough to run before any real request work.
+    """
+
+    def __init__(self, db_path: str = RATE_LIMIT_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        # isolation_level=None: we issue BEGIN/COMMIT ourselves
+        self._conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._hits = 0
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # Losing the last few hits in a power cut is fine for rate limiting
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    full_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS buckets_full_at ON buckets (full_at)")
+
+    def hit(self, key: str, rate: str) -> tuple[bool, float]:
+        """
+        Take a token from the bucket for `key` under limit `rate`.
+        Returns (allowed, seconds until a token is available).
+        """
+        count, period = parse_rate(rate)
+        refill = count / period
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = count if row is None else min(count, row[0] + (now - row[1]) * refill)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                self._conn.execute(
+                    "INSERT INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated, "
+                    "full_at = excluded.full_at",
+                    (key, tokens, now, now + (count - tokens) / refill),
+                )
+                self._hits += 1
+                if self._hits % PRUNE_EVERY == 0:
+                    # A full bucket is the same as no bucket
+                    self._conn.execute("DELETE FROM buckets WHERE full_at < ?", (now,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return allowed, 0.0 if allowed else (1 - tokens) / refill
+
+    def reset(self, key: Optional[str] = None) -> None:
+        with self._lock:
+            if key is None:
+                self._conn.execute("DELETE FROM buckets")
+            else:
+                self._conn.execute("DELETE FROM buckets WHERE key = ?", (key,))
+
+
+_rate_limiter: Optional[SQLiteRateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> SQLiteRateLimiter:
+    """
+    Return the process-wide SQLiteRateLimiter.
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = SQLiteRateLimiter()
+        return _rate_limiter
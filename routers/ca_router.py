@@ -1,12 +1,13 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 import os
-from nebula_api import NebulaAPI
+from nebula_api import get_nebula_api
+from cert_cache import cert_info_cache
 
 
 router = APIRouter()
 
-nebula = NebulaAPI()
+nebula = get_nebula_api()
 
 
 CA_CERT_PATH = "ca.crt"  # Adjust as needed
@@ -56,6 +57,7 @@ def create_ca_cert(req: CreateCARequest):
     
     # Run nebula-cert ca -name <name> -out-crt <cert_path> -out-key <key_path>
     result = nebula.cert_mode("ca", ["-name", req.name, "-out-crt", cert_path, "-out-key", key_path])
+    cert_info_cache.invalidate(cert_path)
     
     if os.path.exists(cert_path):
         with open(cert_path, "r") as f:
@@ -69,6 +71,6 @@ def get_ca_cert_info():
     if not os.path.exists(cert_path):
         raise HTTPException(status_code=404, detail="CA certificate not found.")
     
-    info = nebula.cert_mode("print", ["-json", "-path", cert_path])
+    info = cert_info_cache.get(cert_path)
     return {"info": info}
 
@@ -0,0 +1,110 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+
+from cert_expiry import cert_expiry_index
+from cert_renewal import RenewalManager
+from lighthouse_control import get_lighthouse_control
+from routers.hosts_router import renew_host_certs
+from routers.lighthouse_router import renew_lighthouse_certs
+from vars import CERT_RENEW_INTERVAL, CERT_RENEW_WINDOW_DAYS
+
+router = APIRouter()
+
+DAY = 24 * 60 * 60
+
+
+def renew_target(target: dict) -> None:
+    if target["kind"] == "lighthouse":
+        renew_lighthouse_certs()
+    else:
+        renew_host_certs(target["org"], target["name"])
+
+
+renewals = RenewalManager(renew_target)
+
+
+class RenewRequest(BaseModel):
+    days: Optional[float] = None  # Renewal window, defaults to NEBULA_CERT_RENEW_WINDOW_DAYS
+    include_lighthouse: bool = True
+
+
+def start_renewal(window_days: float, include_lighthouse: bool = True, trigger: str = "manual"):
+    """
+    Start a renewal job for every certificate expiring within window_days.
+    Returns the job, or None if nothing needs renewing.
+    """
+    targets = cert_expiry_index.expiring(window_days * DAY)
+    if not include_lighthouse:
+        targets = [t for t in targets if t["kind"] != "lighthouse"]
+    if not targets:
+        return None
+    return renewals.start(targets, window_days, trigger)
+
+
+@router.get("/api/certs/expiry")
+async def get_cert_expiry(days: float = Query(CERT_RENEW_WINDOW_DAYS, ge=0), limit: int = Query(1000, ge=1, le=10000)):
+    """
+    Certificates expiring within `days` (expired ones included), soonest first.
+    """
+    summary = await asyncio.to_thread(cert_expiry_index.summary)
+    certs = await asyncio.to_thread(cert_expiry_index.expiring, days * DAY, limit)
+    return {"summary": summary, "days": days, "certs": certs}
+
+
+@router.post("/api/certs/renew", status_code=202)
+async def renew_certs(req: RenewRequest):
+    window_days = req.days if req.days is not None else CERT_RENEW_WINDOW_DAYS
+    if window_days < 0:
+        raise HTTPException(status_code=400, detail="days must not be negative")
+    try:
+        job = await asyncio.to_thread(start_renewal, window_days, req.include_lighthouse)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if job is None:
+        return {"job": None, "detail": "No certificates expire within the renewal window"}
+    return {"job": job.to_dict()}
+
+
+@router.get("/api/certs/renew/jobs")
+async def list_renewal_jobs():
+    return {"jobs": [job.to_dict() for job in renewals.jobs()]}
+
+
+@router.get("/api/certs/renew/jobs/{job_id}")
+async def get_renewal_job(job_id: str):
+    job = renewals.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Renewal job not found")
+    return {"job": job.to_dict()}
+
+
+@router.delete("/api/certs/renew/jobs/{job_id}")
+async def cancel_renewal_job(job_id: str):
+    job = renewals.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Renewal job not found")
+    job.cancel()
+    return {"job": job.to_dict()}
+
+
+async def renewal_scheduler(interval: float = CERT_RENEW_INTERVAL, window_days: float = CERT_RENEW_WINDOW_DAYS):
+    """
+    Background task: every `interval` seconds, renew whatever expires within the window.
+    """
+    while True:
+        try:
+            # With several workers only the one that owns the lighthouse runs scheduled renewals
+            if not get_lighthouse_control().owner:
+                await asyncio.sleep(interval)
+                continue
+            job = await asyncio.to_thread(start_renewal, window_days, True, "scheduled")
+            if job is not None:
+                print(f"Scheduled certificate renewal job {job.id} started for {len(job.targets)} certificates")
+        except RuntimeError as e:
+            print(f"Skipping scheduled certificate renewal: {e}")
+        except Exception as e:
+            print(f"Scheduled certificate renewal check failed: {e}")
+        await asyncio.sleep(interval)
@@ -1,14 +1,18 @@
-import json
-from fastapi import APIRouter, HTTPException, Request
+import asyncio
+import hmac
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
 from pydantic import BaseModel
 import os
-from datetime import datetime
-from routers.ca_router import get_ca_cert_info
-from routers.hosts_router import HostRequest, create_host as hosts_create_host, load_yaml, save_yaml, download_org_host_config
-from vars import DATA_DIR
-from dependencies import limiter
-from vars import LIGHTHOUSE_IP
-from nebula_api import NebulaAPI  # Add this import
+from routers.ca_router import cert_path as ca_cert_path
+from cert_cache import cert_info_cache
+from routers.hosts_router import HostRequest, create_host as hosts_create_host, download_org_host_config, host_cert_fingerprint, is_safe_string
+from invite_store import get_invite_store, InviteError
+from host_changes import get_host_change_feed
+from host_registry import get_registry
+from dependencies import rate_limit
+from slowapi.util import get_remote_address
+from vars import LIGHTHOUSE_IP, INVITE_RATE_LIMIT_PER_IP, INVITE_RATE_LIMIT_PER_CODE, HOST_CHANGES_RATE_LIMIT_PER_IP
+from lighthouse_control import get_lighthouse_control
 
 router = APIRouter()
 
@@ -17,25 +21,27 @@ class ClientHostRequest(BaseModel):
     name: str
     tags: list[str]
 
-nebula = NebulaAPI()  # Instantiate NebulaAPI
+# Long-poll limits (seconds) for /api/hosts/{host_id}/changes
+DEFAULT_CHANGES_TIMEOUT = 30
+MAX_CHANGES_TIMEOUT = 120
 
 @router.get("/api/")
 async def get_client_info(request: Request):
     # Implement your logic to retrieve client information
     return {"message": "Hello, this is the client API"}
 
-#@TODO: cache the response
 @router.get("/api/info")
 async def get_client_info_details(request: Request):
     # Publish my external IP is LIGHTHOUSE_PUBLIC_IP
     public_ip = os.environ.get("LIGHTHOUSE_PUBLIC_IP", "unknown")
     nebula_ip = LIGHTHOUSE_IP
-    server_is_running = nebula._nebula_proc is not None and nebula._nebula_proc.poll() is None
-    cert_info = get_ca_cert_info()
-    cert_info = cert_info.get("info", "{}")
-    cert_info = json.loads(cert_info)
-    print(cert_info)
-    cert_info = cert_info[0].get("details", {})
+    # Asks whichever worker runs the lighthouse, not this process
+    server_is_running = await asyncio.to_thread(get_lighthouse_control().is_running)
+    # Served from the certificate cache, so this doesn't fork nebula-cert per request
+    if not os.path.exists(ca_cert_path):
+        raise HTTPException(status_code=404, detail="CA certificate not found.")
+    cert_info = await asyncio.to_thread(cert_info_cache.get_json, ca_cert_path)
+    cert_info = (cert_info or [{}])[0].get("details", {})
     company_name = cert_info.get("name", "unknown")
 
     return {
@@ -46,44 +52,85 @@ async def get_client_info_details(request: Request):
         "lighthouse_is_running": server_is_running,
     }
 
-@router.get("/api/redeem_invite")
-@limiter.limit("5/minute")
+# Checked in this order, before the invite is even looked up
+invite_ip_limit = rate_limit("invite_ip", INVITE_RATE_LIMIT_PER_IP, get_remote_address)
+invite_code_limit = rate_limit("invite_code", INVITE_RATE_LIMIT_PER_CODE, lambda request: request.query_params.get("invite_code"))
+
+@router.get("/api/redeem_invite", dependencies=[Depends(invite_ip_limit), Depends(invite_code_limit)])
 async def create_host_using_invite(request: Request):
     invite_code = request.query_params.get("invite_code")
-    name = request.query_params.get("name", "host")  # Set default name to "host"
+    name = request.query_params.get("name")
     tags = request.query_params.getlist("tags")
 
-    invites_file = os.path.join(DATA_DIR, "invites.yaml")
-    if not os.path.exists(invites_file):
-        raise HTTPException(status_code=400, detail="Invites file not found")
-    invites = load_yaml(invites_file, default=[])
-    invite = next((i for i in invites if i.get("code") == invite_code), None)
-    if not invite:
-        raise HTTPException(status_code=400, detail="Invalid invite code")
-    if not invite.get("active", True):
-        raise HTTPException(status_code=400, detail="Invite code already used")
-    if "expires_at" in invite:
-        expires_at = invite["expires_at"]
-        if isinstance(expires_at, str):
-            expires_at = datetime.fromisoformat(expires_at)
-        if expires_at < datetime.utcnow():
-            raise HTTPException(status_code=400, detail="Invite code expired")
+    if name == "":
+        raise HTTPException(status_code=400, detail="Name is required")
+
+    # Takes one use atomically; concurrent redemptions can't over-spend the invite
+    store = get_invite_store()
+    try:
+        invite = await asyncio.to_thread(store.redeem, invite_code)
+    except InviteError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     org = invite.get("org")
     if not org:
         raise HTTPException(status_code=400, detail="Invite code missing org")
+    # Bulk invites can carry a default name and tags for the hosts they create
     if not name:
-        raise HTTPException(status_code=400, detail="Name is required")
-    host_req = HostRequest(name=name, org=org, tags=tags)
-    result = await hosts_create_host(host_req)
+        name = invite.get("name_prefix") or "host"
+    tags = list(dict.fromkeys(tags + invite.get("tags", [])))
 
-    # Mark invite as inactive
-    for i in invites:
-        if i.get("code") == invite_code:
-            i["available_uses"] = i.get("available_uses", 1) - 1
-            if i["available_uses"] <= 0:
-                i["active"] = False
-    save_yaml(invites_file, invites)
+    host_req = HostRequest(name=name, org=org, tags=tags)
+    try:
+        result = await hosts_create_host(host_req)
+    except Exception:
+        # Host wasn't created, so give the use back
+        await asyncio.to_thread(store.refund, invite_code)
+        raise
 
     returned_name = result["name"]
 
-    return await download_org_host_config(org_name=org, host_name=returned_name)
+    return await download_org_host_config(org_name=org, host_name=returned_name, if_none_match=None)
+
+host_changes_ip_limit = rate_limit("host_changes_ip", HOST_CHANGES_RATE_LIMIT_PER_IP, get_remote_address)
+
+def host_fingerprint_valid(org, name, fingerprint) -> bool:
+    if not fingerprint:
+        return False
+    current = host_cert_fingerprint(org, name)
+    if current and hmac.compare_digest(current, fingerprint):
+        return True
+    return get_registry().is_retired_fingerprint(org, name, fingerprint)
+
+@router.get("/api/hosts/{host_id}/changes", dependencies=[Depends(host_changes_ip_limit)])
+async def wait_for_host_changes(
+    host_id: str,
+    since: int = Query(0, ge=0),
+    timeout: float = Query(DEFAULT_CHANGES_TIMEOUT, ge=0, le=MAX_CHANGES_TIMEOUT),
+    x_nebula_fingerprint: str = Header(default=""),
+):
+    """
+    Long-poll: does this host's config need reloading?
+
+    host_id is "<org>.<name>", and the X-Nebula-Fingerprint header must be
+    the fingerprint of the host's certificate (from its bundle), current or
+    replaced by a renewal, so a host that missed a renewal can still find out.
+    Returns as soon as the host's version is above `since` (`changed` true,
+    re-download the bundle), or after `timeout` seconds with `changed` false
+    and the current version. Unknown hosts and wrong fingerprints get the
+    same 404, so the endpoint doesn't tell which hosts exist.
+    """
+    org, sep, name = host_id.partition(".")
+    if not sep or not is_safe_string(org) or not is_safe_string(name):
+        raise HTTPException(status_code=400, detail="host_id must be <org>.<name>")
+
+    if not await asyncio.to_thread(host_fingerprint_valid, org, name, x_nebula_fingerprint.strip().lower()):
+        raise HTTPException(status_code=404, detail="Host not found")
+
+    feed = get_host_change_feed()
+    version = await feed.wait_for_change(org, name, since, timeout)
+    if version is None:
+        # Timed out, or the host was deleted meanwhile
+        version = await asyncio.to_thread(feed.version, org, name)
+        if version is None:
+            raise HTTPException(status_code=404, detail="Host not found")
+    return {"changed": version > since, "version": version}
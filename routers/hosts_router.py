@@ -1,82 +1,102 @@
 import os
 import yaml
 import re
-from fastapi import APIRouter, HTTPException
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Response
 from pydantic import BaseModel
-from ipaddress import IPv6Network
-from nebula_api import NebulaAPI
+from nebula_api import AsyncNebulaAPI, get_nebula_api
+from host_registry import get_registry
+from host_index import get_host_index
+from host_changes import get_host_change_feed
+from ip_allocator import get_address_allocator
+from subnet_allocator import get_subnet_allocator
+from config_template import config_template
+from cert_cache import cert_info_cache
+from cert_expiry import cert_expiry_index
+from host_bundles import host_bundles
+from pagination import Pagination, PageRequest
 import shutil
-from vars import DATA_DIR, ORGS_DIR, ORGS_FILE, ROOT_DIR, SAFE_STRING_RE, IPV6_PREFIX, LIGHTHOUSE_IP, EXTERNAL_IP
+from vars import DATA_DIR, ORGS_DIR, SAFE_STRING_RE, LIGHTHOUSE_IP, EXTERNAL_IP, SIGN_WORKERS
 from fastapi.responses import FileResponse, StreamingResponse
-import io
-import zipfile
 
  
 router = APIRouter()
 
+# Bounded pool for nebula-cert signing during bulk provisioning
+sign_executor = ThreadPoolExecutor(max_workers=SIGN_WORKERS, thread_name_prefix="nebula-sign")
+# Bulk signing tasks still running (the event loop only keeps weak references)
+bulk_sign_tasks = set()
 
+# Tags, plus the synthetic org_<org> groups
+SAFE_GROUP_RE = re.compile(r'^[a-z0-9_]+$')
+
+# Shared by the async handlers so they never block the event loop on nebula-cert
+async_nebula = AsyncNebulaAPI()
+
+def host_config_overrides(org):
+    """
+    Per-host sections that replace the matching sections of config.yml.example.
+    """
+    return {
+        # Set static_host_map
+        'static_host_map': {
+            LIGHTHOUSE_IP: [f"{EXTERNAL_IP}:4242"]
+        },
+        # Set lighthouse
+        'lighthouse': {
+            'am_lighthouse': False,
+            'interval': 60,
+            'hosts': [LIGHTHOUSE_IP]
+        },
+        # Set firewall section as specified
+        'firewall': {
+            "conntrack": {
+                "default_timeout": "10m",
+                "tcp_timeout": "12m",
+                "udp_timeout": "3m"
+            },
+            "inbound": [
+                {
+                    "groups": ["org_" + org],
+                    "port": "any",
+                    "proto": "any"
+                }
+            ],
+            "inbound_action": "drop",
+            "outbound": [
+                {
+                    "host": "any",
+                    "port": "any",
+                    "proto": "any"
+                }
+            ],
+            "outbound_action": "drop"
+        },
+        # Tell the config that the keys and certs are in the same location
+        'pki': {
+            "ca": "./ca.crt",
+            "cert": "./host.crt",
+            "key": "./host.key"
+        },
+    }
 
 def create_host_config(org, name):
     print(f"Creating host config for org: {org}, host: {name}")
     host_dir = os.path.join(ORGS_DIR, org, 'hosts', name)
     os.makedirs(host_dir, exist_ok=True)
 
-    # Copy the config.yml.sample from the root dir to the hosts dir:
-    sample_config_file = os.path.join(ROOT_DIR, 'config.yml.example')
+    # Render the cached config.yml.example with this host's sections straight to disk
     config_file = os.path.join(host_dir, 'config.yaml')
-    shutil.copy(sample_config_file, config_file)
-
-    # Now edit that file to set the following settings: 
-    config = load_yaml(config_file, default={})
-
-    # Set static_host_map
-    config['static_host_map'] = {
-        LIGHTHOUSE_IP: [f"{EXTERNAL_IP}:4242"]
-    }
-
-    # Set lighthouse
-    config['lighthouse'] = {
-        'am_lighthouse': False,
-        'interval': 60,
-        'hosts': [LIGHTHOUSE_IP]
-    }
-
-    # Set firewall section as specified
-    config['firewall'] = {
-        "conntrack": {
-            "default_timeout": "10m",
-            "tcp_timeout": "12m",
-            "udp_timeout": "3m"
-        },
-        "inbound": [
-            {
-                "groups": ["org_" + org],
-                "port": "any",
-                "proto": "any"
-            }
-        ],
-        "inbound_action": "drop",
-        "outbound": [
-            {
-                "host": "any",
-                "port": "any",
-                "proto": "any"
-            }
-        ],
-        "outbound_action": "drop"
-    }
-
-    # Tell the config that the keys and certs are in the same location
-    config['pki'] = {
-        "ca": "./ca.crt",
-        "cert": "./host.crt",
-        "key": "./host.key"
-    }
-
-    save_yaml(config_file, config)
+    config_template.write(config_file, host_config_overrides(org))
     print(f"Host config saved to: {config_file}")
 
-def create_certs(org, name):
+def prepare_cert_request(org, name):
+    """
+    Create the host directory and work out the sign_cert arguments for a host.
+    """
     print(f"Creating certificates for org: {org}, host: {name}")
     
     # Create necessary directories and files for host certificates
@@ -85,10 +105,7 @@ def create_certs(org, name):
     print(f"Host directory created or exists: {host_dir}")
 
     # Load host info to get tags and IP
-    hosts_file = os.path.join(ORGS_DIR, org, 'hosts.yaml')
-    print(f"Loading hosts file: {hosts_file}")
-    hosts = load_yaml(hosts_file, default=[])
-    host_entry = next((h for h in hosts if h['name'] == name), None)
+    host_entry = get_registry().get_host(org, name)
     if not host_entry:
         raise Exception("Host entry not found for cert creation")
     print(f"Host entry found: {host_entry}")
@@ -113,28 +130,111 @@ def create_certs(org, name):
     # Use the required format for networks: "<ip>/48"
     networks = f"{ip}/48"
 
-    nebula = NebulaAPI()
-    print("Signing certificate with NebulaAPI...")
-    result = nebula.sign_cert(
-        name=name,
-        networks=networks,
-        groups=groups,
-        out_crt=out_crt,
-        out_key=out_key,
-        ca_crt=ca_crt,
-        ca_key=ca_key,
-    )
+    return {
+        "name": name,
+        "networks": networks,
+        "groups": groups,
+        "out_crt": out_crt,
+        "out_key": out_key,
+        "ca_crt": ca_crt,
+        "ca_key": ca_key,
+    }
 
-    # Also copy ca.crt to host directory:
+def finish_host_dir(org, name, ca_crt):
+    """
+    Copy the CA cert next to the freshly signed host cert and write the host config.
+    """
+    host_dir = os.path.join(ORGS_DIR, org, 'hosts', name)
     ca_crt_dest = os.path.join(host_dir, "ca.crt")
     if not os.path.exists(ca_crt_dest):
         shutil.copy(ca_crt, ca_crt_dest)
 
     create_host_config(org, name)
 
+    # Pre-build the download bundle now that all of its inputs exist
+    host_bundles.build(host_dir)
+    get_host_change_feed().bump(org, name)
+
+def create_certs(org, name):
+    sign_args = prepare_cert_request(org, name)
+
+    print("Signing certificate with NebulaAPI...")
+    result = get_nebula_api().sign_cert(**sign_args)
+    cert_info_cache.invalidate(sign_args["out_crt"])
+    cert_expiry_index.update(sign_args["out_crt"])
+
+    finish_host_dir(org, name, sign_args["ca_crt"])
+
     print(f"Certificate signing result: {result}")
     # Optionally, you could log or handle 'result' if needed
 
+async def create_certs_async(org, name):
+    """
+    Same as create_certs, but signs through AsyncNebulaAPI and keeps file I/O off the event loop.
+    """
+    sign_args = await asyncio.to_thread(prepare_cert_request, org, name)
+
+    print("Signing certificate with AsyncNebulaAPI...")
+    result = await async_nebula.sign_cert(**sign_args)
+    cert_info_cache.invalidate(sign_args["out_crt"])
+    await asyncio.to_thread(cert_expiry_index.update, sign_args["out_crt"])
+
+    await asyncio.to_thread(finish_host_dir, org, name, sign_args["ca_crt"])
+
+    print(f"Certificate signing result: {result}")
+
+def sign_replacing(nebula, **sign_args):
+    """
+    Sign a new key pair next to out_crt/out_key and move it into place only
+    once signing succeeded, so a failed renewal leaves the old pair intact.
+    """
+    out_crt, out_key = sign_args["out_crt"], sign_args["out_key"]
+    tmp_crt, tmp_key = f"{out_crt}.renew", f"{out_key}.renew"
+    for path in (tmp_crt, tmp_key):
+        if os.path.exists(path):
+            os.remove(path)
+    result = nebula.sign_cert(**{**sign_args, "out_crt": tmp_crt, "out_key": tmp_key})
+    if not (os.path.exists(tmp_crt) and os.path.exists(tmp_key)):
+        for path in (tmp_crt, tmp_key):
+            if os.path.exists(path):
+                os.remove(path)
+        raise RuntimeError(f"Failed to sign certificate: {result}")
+    os.replace(tmp_key, out_key)
+    os.replace(tmp_crt, out_crt)
+    cert_info_cache.invalidate(out_crt)
+    cert_expiry_index.update(out_crt)
+    return result
+
+def host_cert_fingerprint(org, name) -> Optional[str]:
+    """
+    Fingerprint of the host's current certificate, or None if it has none.
+    """
+    crt_path = os.path.join(ORGS_DIR, org, 'hosts', name, 'host.crt')
+    if not os.path.exists(crt_path):
+        return None
+    info = cert_info_cache.get_json(crt_path)
+    if isinstance(info, list):
+        info = info[0] if info else None
+    return info.get("fingerprint") if isinstance(info, dict) else None
+
+def renew_host_certs(org, name):
+    """
+    Re-sign a host's certificate (with a new key pair) and rebuild its download bundle.
+    The old certificate's fingerprint stays valid for polling /changes.
+    """
+    old_fingerprint = host_cert_fingerprint(org, name)
+    sign_args = prepare_cert_request(org, name)
+    sign_replacing(get_nebula_api(), **sign_args)
+    if old_fingerprint:
+        get_registry().retire_fingerprint(org, name, old_fingerprint)
+
+    # Pick up a replaced CA as well
+    host_dir = os.path.join(ORGS_DIR, org, 'hosts', name)
+    shutil.copy(sign_args["ca_crt"], os.path.join(host_dir, "ca.crt"))
+    create_host_config(org, name)
+    host_bundles.build(host_dir)
+    get_host_change_feed().bump(org, name)
+
 # Helper to validate safe strings
 def is_safe_string(s):
     return isinstance(s, str) and SAFE_STRING_RE.match(s)
@@ -145,18 +245,6 @@ def sanitize_string(s):
     sanitized = re.sub(r'[^a-zA-Z0-9]', '', s.lower())
     return sanitized
 
-# Helper to load YAML
-def load_yaml(path, default=None):
-    if not os.path.exists(path):
-        return default if default is not None else {}
-    with open(path, 'r') as f:
-        return yaml.safe_load(f) or (default if default is not None else {})
-
-# Helper to save YAML
-def save_yaml(path, data):
-    with open(path, 'w') as f:
-        yaml.safe_dump(data, f)
-
 # Helper to load a file's content
 def load_file(path, default=None):
     if not os.path.exists(path):
@@ -164,39 +252,20 @@ def load_file(path, default=None):
     with open(path, 'r') as f:
         return f.read()
 
-# Helper to allocate a new IPv6 subnet (very simple, not production safe)
-def allocate_subnet(orgs):
-    """
-    Allocate a new /64 subnet for an org using the ULA formula:
-    IPV6_PREFIX (fdc8:d559:029d) + subnet_id (4 hex digits) + ::/64,
-    formatted as fdc8:d559:029d:xxxx::/64
-
-    Always assign the lowest available subnet_id, regardless of org name or order.
-    Reserve 0000 for the router/lighthouse.
-    """
-    used_ids = set()
-    # Extract used subnet_ids from existing subnets
-    for subnet in orgs.values():
-        try:
-            parts = subnet.split(":")
-            if len(parts) >= 4:
-                used_ids.add(int(parts[3], 16))
-        except Exception:
-            continue
-    # Always assign the lowest unused subnet_id, skipping 0x0000
-    for subnet_id in sorted(set(range(1, 0x10000)) - used_ids):  # start from 1, not 0
-        subnet_id_hex = f"{subnet_id:04x}"
-        subnet = f"{IPV6_PREFIX}:{subnet_id_hex}::/64"
-        return subnet
-    raise Exception('No available subnets')
-
 class HostRequest(BaseModel):
     name: str
     org: str
     tags: list[str]
 
-@router.post('/api/hosts/new')
-async def create_host(req: HostRequest):
+class BulkHostRequest(BaseModel):
+    hosts: list[HostRequest]
+
+MAX_BULK_HOSTS = 1000
+
+def validate_host_request(req: HostRequest):
+    """
+    Sanitize and validate a host request, returning (name, org, tags).
+    """
     name = sanitize_string(req.name)
     org = sanitize_string(req.org)
     tags = [sanitize_string(t) for t in req.tags]
@@ -208,76 +277,170 @@ async def create_host(req: HostRequest):
         raise HTTPException(status_code=400, detail='Invalid tags')
     if any(t.startswith("org") for t in tags):
         raise HTTPException(status_code=400, detail='Tags cannot start with "org"')
+    return name, org, tags
 
-    # Ensure hosts dir exists
-    os.makedirs(ORGS_DIR, exist_ok=True)
-
-    # Load or create orgs.yaml
-    orgs = load_yaml(ORGS_FILE, default={})
-    if org not in orgs:
-        subnet = allocate_subnet(orgs)
-        orgs[org] = subnet
-        save_yaml(ORGS_FILE, orgs)
-    else:
-        subnet = orgs[org]
-
-    # Ensure org dir exists
-    org_dir = os.path.join(ORGS_DIR, org)
-    os.makedirs(org_dir, exist_ok=True)
-    hosts_file = os.path.join(org_dir, 'hosts.yaml')
-
-    hosts = load_yaml(hosts_file, default=[])
-    if not isinstance(hosts, list):
-        hosts = []
-
-    # Ensure host name is unique within the org
-    base_name = name
-    suffix = 1
-    existing_names = {h.get('name') for h in hosts}
-    while name in existing_names:
-        name = f"{base_name}{suffix}"
-        suffix += 1
-
-    # Assign next IP in subnet using ULA formula
-    used_ips = {h['ip'] for h in hosts if 'ip' in h}
-    net = IPv6Network(subnet)
-    for host_id in range(1, 2**64):
-        ip_int = int(net.network_address) + host_id
-        ip_str = str(IPv6Network((ip_int, 128)).network_address)
-        if ip_str not in used_ips and IPv6Network(ip_str + '/128').subnet_of(net):
-            break
-    else:
-        raise HTTPException(status_code=500, detail='No available IPs in subnet')
-
-    # Add host
-    host_entry = {'name': name, 'ip': ip_str, 'tags': tags}
-    hosts.append(host_entry)
-    save_yaml(hosts_file, hosts)
-
-    # Now create a unique directory just for this host:
-    host_dir = os.path.join(org_dir, 'hosts', name)
-    os.makedirs(host_dir, exist_ok=True)
+def get_or_allocate_org_subnet(registry, org):
+    # Allocate a subnet the first time we see this org
+    subnet = registry.get_org_subnet(org)
+    if subnet is None:
+        try:
+            subnet = get_subnet_allocator().allocate()
+        except ValueError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        registry.set_org_subnet(org, subnet)
+    return subnet
 
-    create_certs(org, name)
+def register_host(name, org, tags):
+    """
+    Reserve a unique name and an IP for a new host in one registry transaction.
+    Returns (host_entry, subnet).
+    """
+    registry = get_registry()
+    with registry.transaction():
+        subnet = get_or_allocate_org_subnet(registry, org)
+
+        # Ensure host name is unique within the org
+        name = registry.unique_name(org, name)
+
+        # Assign next free IP in the org's subnet
+        try:
+            ip_str = get_address_allocator().allocate(org, subnet)[0]
+        except ValueError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        # Add host
+        host_entry = registry.add_host(org, name, ip_str, tags)
+    return host_entry, subnet
+
+def discard_host(org, subnet, host_entry):
+    """
+    Undo register_host for a host whose certificate could not be made: drop
+    it from the registry, hand its IP back and remove whatever was written
+    to its directory.
+    """
+    registry = get_registry()
+    with registry.transaction():
+        if registry.remove_host(org, host_entry['name']) is not None:
+            get_address_allocator().release(subnet, host_entry['ip'])
+
+    host_dir = os.path.join(ORGS_DIR, org, 'hosts', host_entry['name'])
+    host_bundles.invalidate(host_dir)
+    cert_expiry_index.remove_host_dir(host_dir)
+    if os.path.isdir(host_dir):
+        shutil.rmtree(host_dir)
+
+@router.post('/api/hosts/new')
+async def create_host(req: HostRequest):
+    name, org, tags = validate_host_request(req)
+
+    host_entry, subnet = await asyncio.to_thread(register_host, name, org, tags)
+    name = host_entry['name']
+
+    await create_certs_async(org, name)
 
     return {"success": True, "host": host_entry, "org": org, "subnet": subnet, "name": name}
 
+@router.post('/api/hosts/bulk')
+async def create_hosts_bulk(req: BulkHostRequest):
+    """
+    Create many hosts at once. Names, subnets and IPs for the whole batch are
+    allocated in a single registry transaction, then the certificates are
+    signed on a bounded worker pool, whether or not the client reads the
+    response. Results are streamed back as NDJSON, one line per host, in
+    completion order. Hosts whose signing fails are removed
+    again and reported with success false.
+    """
+    if not req.hosts:
+        raise HTTPException(status_code=400, detail='No hosts given')
+    if len(req.hosts) > MAX_BULK_HOSTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_HOSTS} hosts per request")
+    validated = [validate_host_request(h) for h in req.hosts]
+
+    by_org = {}
+    for name, org, tags in validated:
+        by_org.setdefault(org, []).append((name, tags))
+
+    def register_batch():
+        registry = get_registry()
+        created = []
+        with registry.transaction():
+            for org, items in by_org.items():
+                subnet = get_or_allocate_org_subnet(registry, org)
+                try:
+                    ips = get_address_allocator().allocate(org, subnet, len(items))
+                except ValueError as e:
+                    raise HTTPException(status_code=500, detail=str(e))
+                for (name, tags), ip_str in zip(items, ips):
+                    name = registry.unique_name(org, name)
+                    created.append((org, subnet, registry.add_host(org, name, ip_str, tags)))
+        return created
+
+    created = await asyncio.to_thread(register_batch)
+
+    loop = asyncio.get_running_loop()
+
+    async def sign(org, subnet, host_entry):
+        try:
+            await loop.run_in_executor(sign_executor, create_certs, org, host_entry['name'])
+        except Exception as e:
+            await asyncio.to_thread(discard_host, org, subnet, host_entry)
+            return {"success": False, "host": host_entry, "org": org, "name": host_entry['name'], "error": str(e)}
+        return {"success": True, "host": host_entry, "org": org, "subnet": subnet, "name": host_entry['name']}
+
+    # Signing starts now and is owned by these tasks, not by the response stream:
+    # if the client goes away mid-stream, every host is still signed or discarded
+    tasks = [asyncio.create_task(sign(*c)) for c in created]
+    for task in tasks:
+        bulk_sign_tasks.add(task)
+        task.add_done_callback(bulk_sign_tasks.discard)
+
+    async def results():
+        for next_result in asyncio.as_completed(tasks):
+            yield json.dumps(await next_result) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+host_pagination = Pagination({"name": ("org", "name")}, default_sort="name")
+org_host_pagination = Pagination({"name": ("name",)}, default_sort="name")
+org_pagination = Pagination({"name": ("name",)}, default_sort="name")
+
 @router.get('/api/hosts')
-async def list_hosts():
-    if not os.path.exists(ORGS_DIR) or not os.path.isdir(ORGS_DIR):
-        return {"hosts": []}
-    
-    hosts = []
-    for org in os.listdir(ORGS_DIR):
-        org_sanitized = sanitize_string(org)
-        org_dir = os.path.join(ORGS_DIR, org)
-        if not os.path.isdir(org_dir):
-            continue
-        hosts_file = os.path.join(org_dir, 'hosts.yaml')
-        org_hosts = load_yaml(hosts_file, default=[])
-        for host in org_hosts:
-            hosts.append({**host, 'org': org_sanitized})
-    return {"hosts": hosts}
+async def list_hosts(page: PageRequest = Depends(host_pagination)):
+    registry = get_registry()
+
+    async def fetch(sort, descending, after, limit):
+        return await asyncio.to_thread(registry.page_hosts, None, descending, after, limit)
+    return await page.respond("hosts", fetch)
+
+@router.get('/api/hosts/search')
+async def search_hosts(
+    org: Optional[str] = None,
+    tag: list[str] = Query(default=[]),
+    group: list[str] = Query(default=[]),
+    ip: Optional[str] = None,
+    name: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    Find hosts matching all of the given filters: org, tags / groups (every
+    host is also in the org_<org> group), an IP address or CIDR prefix, and a
+    name prefix.
+    """
+    groups = [sanitize_string(t) for t in tag] + [g for g in group if SAFE_GROUP_RE.match(g)]
+    if len(groups) != len(tag) + len(group):
+        raise HTTPException(status_code=400, detail='Invalid group')
+    try:
+        hosts, total = await asyncio.to_thread(
+            get_host_index().search,
+            org=sanitize_string(org) if org else None,
+            groups=groups,
+            ip_prefix=ip,
+            name_prefix=sanitize_string(name) if name else None,
+            limit=limit,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Invalid IP prefix')
+    return {"hosts": hosts, "total": total}
 
 class OrgRequest(BaseModel):
     name: str
@@ -290,46 +453,53 @@ async def create_org(req: OrgRequest):
     if not is_safe_string(name):
         raise HTTPException(status_code=400, detail='Invalid org name')
 
-    # Ensure org dir exists
-    org_dir = os.path.join(ORGS_DIR, name)
-    os.makedirs(org_dir, exist_ok=True)
-
-    # Create initial hosts.yaml
-    hosts_file = os.path.join(org_dir, 'hosts.yaml')
-    save_yaml(hosts_file, [])
+    # Registering the org also schedules its (empty) hosts.yaml export
+    await asyncio.to_thread(get_registry().ensure_org, name)
 
     return {"success": True, "org": name}
 
 @router.get("/api/orgs")
-async def list_orgs():
-    if not os.path.exists(ORGS_DIR) or not os.path.isdir(ORGS_DIR):
-        return {"orgs": []}
-
-    orgs = []
-    orgs_data = load_yaml(ORGS_FILE, default={})
-    for org in os.listdir(ORGS_DIR):
-        org_sanitized = sanitize_string(org)
-        org_dir = os.path.join(ORGS_DIR, org)
-        if not os.path.isdir(org_dir):
-            continue
-        orgs.append({"name": org_sanitized, "subnet": orgs_data.get(org_sanitized)})
-
-    return {"orgs": orgs}
+async def list_orgs(page: PageRequest = Depends(org_pagination)):
+    registry = get_registry()
+
+    async def fetch(sort, descending, after, limit):
+        return await asyncio.to_thread(registry.page_orgs, descending, after, limit)
+    return await page.respond("orgs", fetch)
+
+class SubnetRangeRequest(BaseModel):
+    start: int
+    end: int
+
+@router.get("/api/subnets/utilization")
+async def get_subnet_utilization():
+    return get_subnet_allocator().utilization()
+
+@router.post("/api/subnets/reserved")
+async def reserve_subnets(req: SubnetRangeRequest):
+    allocator = get_subnet_allocator()
+    try:
+        reserved = allocator.reserve_range(req.start, req.end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "reserved": reserved, "utilization": allocator.utilization()}
+
+@router.delete("/api/subnets/reserved")
+async def unreserve_subnets(req: SubnetRangeRequest):
+    allocator = get_subnet_allocator()
+    try:
+        released = allocator.unreserve_range(req.start, req.end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "released": released, "utilization": allocator.utilization()}
 
 @router.get("/api/orgs/{org_name}/hosts")
-async def list_org_hosts(org_name: str):
+async def list_org_hosts(org_name: str, page: PageRequest = Depends(org_host_pagination)):
     org_name = sanitize_string(org_name)
+    registry = get_registry()
 
-    if not os.path.exists(ORGS_DIR) or not os.path.isdir(ORGS_DIR):
-        return {"hosts": []}
-
-    org_dir = os.path.join(ORGS_DIR, org_name)
-    if not os.path.isdir(org_dir):
-        return {"hosts": []}
-
-    hosts_file = os.path.join(org_dir, 'hosts.yaml')
-    org_hosts = load_yaml(hosts_file, default=[])
-    return {"hosts": org_hosts}
+    async def fetch(sort, descending, after, limit):
+        return await asyncio.to_thread(registry.page_hosts, org_name, descending, after, limit)
+    return await page.respond("hosts", fetch)
 
 
 @router.get("/api/orgs/{org_name}/hosts/{host_name}")
@@ -337,12 +507,10 @@ async def get_org_host(org_name: str, host_name: str):
     org_name = sanitize_string(org_name)
     host_name = sanitize_string(host_name)
 
-    if not os.path.exists(ORGS_DIR) or not os.path.isdir(ORGS_DIR):
+    if not await asyncio.to_thread(get_registry().org_exists, org_name):
         return {"host": None}
 
     org_dir = os.path.join(ORGS_DIR, org_name)
-    if not os.path.isdir(org_dir):
-        return {"host": None}
 
     # now go to the directory in that host and look for a config.yaml, cert.key and cert.crt and return
     # the contents of all of these in json. The key should only return a part for security reasons
@@ -354,13 +522,17 @@ async def get_org_host(org_name: str, host_name: str):
     cert_key_file = os.path.join(host_dir, 'host.key')
     cert_crt_file = os.path.join(host_dir, 'host.crt')
 
-    config = load_yaml(config_file, default={})
-    cert_key = load_file(cert_key_file, default="")
-    cert_crt = load_file(cert_crt_file, default="")
+    def read_host_files():
+        return (
+            yaml.safe_load(load_file(config_file, default="")) or {},
+            load_file(cert_key_file, default=""),
+            load_file(cert_crt_file, default=""),
+        )
+
+    config, cert_key, cert_crt = await asyncio.to_thread(read_host_files)
 
     # cert_details_json = ./nebula-cert print -path data/orgs/a/hosts/e/host.crt -json
-    nebula = NebulaAPI()
-    cert_details_json = nebula.print_cert(cert_crt_file)
+    cert_details_json = await cert_info_cache.get_async(cert_crt_file)
 
     return {
         "host": {
@@ -372,46 +544,75 @@ async def get_org_host(org_name: str, host_name: str):
         }
     }
 
+@router.delete("/api/orgs/{org_name}/hosts/{host_name}")
+async def delete_org_host(org_name: str, host_name: str):
+    org_name = sanitize_string(org_name)
+    host_name = sanitize_string(host_name)
+
+    def remove_host():
+        registry = get_registry()
+        with registry.transaction():
+            host = registry.remove_host(org_name, host_name)
+            if host is None:
+                raise HTTPException(status_code=404, detail="Host not found")
+            # Hand the address back so the next host in this org can reuse it
+            subnet = registry.get_org_subnet(org_name)
+            if subnet:
+                get_address_allocator().release(subnet, host['ip'])
+
+        host_dir = os.path.join(ORGS_DIR, org_name, 'hosts', host_name)
+        host_bundles.invalidate(host_dir)
+        cert_expiry_index.remove_host_dir(host_dir)
+        if os.path.isdir(host_dir):
+            shutil.rmtree(host_dir)
+        return host
+
+    host = await asyncio.to_thread(remove_host)
+
+    return {"success": True, "host": host}
+
 @router.get("/api/orgs/{org_name}/hosts/{host_name}/download")
-async def download_org_host_config(org_name: str, host_name: str):
+async def download_org_host_config(org_name: str, host_name: str, if_none_match: Optional[str] = Header(default=None)):
     org_name = sanitize_string(org_name)
     host_name = sanitize_string(host_name)
 
-    if not os.path.exists(ORGS_DIR) or not os.path.isdir(ORGS_DIR):
+    if not await asyncio.to_thread(get_registry().org_exists, org_name):
         raise HTTPException(status_code=404, detail="Org not found")
 
     org_dir = os.path.join(ORGS_DIR, org_name)
-    if not os.path.isdir(org_dir):
-        raise HTTPException(status_code=404, detail="Org not found")
 
     host_dir = os.path.join(org_dir, 'hosts', host_name)
     if not os.path.isdir(host_dir):
         raise HTTPException(status_code=404, detail="Host not found")
 
-    mem_zip = io.BytesIO()
-    with zipfile.ZipFile(mem_zip, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for fname in ["config.yaml", "host.crt", "host.key", "ca.crt"]:
-            fpath = os.path.join(host_dir, fname)
-            if os.path.exists(fpath):
-                arcname = f"{fname}"
-                with open(fpath, "rb") as f:
-                    zf.writestr(arcname, f.read())
-    mem_zip.seek(0)
-    return StreamingResponse(mem_zip, media_type="application/zip", headers={
-        "Content-Disposition": f"attachment; filename={org_name}_{host_name}_config.zip"
-    })
+    # The bundle is only rebuilt when config.yaml, host.crt, host.key or ca.crt changed
+    digest, bundle_path = await asyncio.to_thread(host_bundles.get, host_dir)
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    version = await asyncio.to_thread(get_host_change_feed().version, org_name, host_name)
+    if version is not None:
+        # Lets clients long-poll /client/api/hosts/{org}.{name}/changes?since=<version>
+        headers["X-Host-Version"] = str(version)
+
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(
+        bundle_path,
+        media_type="application/zip",
+        filename=f"{org_name}_{host_name}_config.zip",
+        headers=headers,
+    )
 
 @router.get("/api/orgs/{org_name}/hosts/{host_name}/download_config")
 async def download_org_host_config_plain(org_name: str, host_name: str):
     org_name = sanitize_string(org_name)
     host_name = sanitize_string(host_name)
 
-    if not os.path.exists(ORGS_DIR) or not os.path.isdir(ORGS_DIR):
+    if not await asyncio.to_thread(get_registry().org_exists, org_name):
         raise HTTPException(status_code=404, detail="Org not found")
 
     org_dir = os.path.join(ORGS_DIR, org_name)
-    if not os.path.isdir(org_dir):
-        raise HTTPException(status_code=404, detail="Org not found")
 
     host_dir = os.path.join(org_dir, 'hosts', host_name)
     if not os.path.isdir(host_dir):
@@ -1,100 +1,149 @@
-import os
-import yaml
+import asyncio
 from fastapi import HTTPException
 from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List
-from fastapi import APIRouter
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends
+import csv
+import io
+import json
 import re
 
 
-from vars import DATA_DIR, ORGS_DIR
+from vars import INVITE_ARCHIVE_INTERVAL
+from invite_store import get_invite_store, SORT_KEYS
+from host_registry import get_registry
+from lighthouse_control import get_lighthouse_control
+from pagination import Pagination, PageRequest
 import secrets
 import string
-from datetime import datetime, timedelta
-
-INVITES_FILE = os.path.join(DATA_DIR, 'invites.yaml')
 
 router = APIRouter()
 
 
+async def invite_archiver(interval: float = INVITE_ARCHIVE_INTERVAL):
+    """
+    Background task: every `interval` seconds, move expired invites to the archive.
+    Listings treat expired invites as inactive in between, so they never write.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        # With several workers only the one that owns the lighthouse does this
+        if not get_lighthouse_control().owner:
+            continue
+        try:
+            archived = await asyncio.to_thread(get_invite_store().archive_expired)
+            if archived:
+                print(f"Archived {archived} expired invites")
+        except Exception as e:
+            print(f"Archiving expired invites failed: {e}")
+
+
 class Invite(BaseModel):
     active: bool
     org: str
     expires_at: str
     code: str
     available_uses: int = 1  # Default to 1 if not specified
+    tags: List[str] = []
+    name_prefix: Optional[str] = None
 
 class InvitesResponse(BaseModel):
     invites: List[Invite]
+    next_cursor: Optional[str] = None
+
+class BulkInviteRequest(BaseModel):
+    org: str
+    count: int
+    days_valid: int = 7
+    uses: int = 1
+    tags: List[str] = []  # Added to every host created from these invites
+    name_prefix: Optional[str] = None  # Default host name when redeeming
+    format: Literal["ndjson", "csv"] = "ndjson"
+
+MAX_BULK_INVITES = 10000
+CSV_FIELDS = ["code", "org", "expires_at", "available_uses", "tags", "name_prefix"]
+
+invite_pagination = Pagination(SORT_KEYS, default_sort="expires_at")
 
 @router.get("/api/invites", response_model=InvitesResponse)
-def get_invites(org: str = None, active: bool = None):
-    if not os.path.exists(INVITES_FILE):
-        return InvitesResponse(invites=[])
+async def get_invites(org: str = None, active: bool = None, page: PageRequest = Depends(invite_pagination)):
+    store = get_invite_store()
+
+    async def fetch(sort, descending, after, limit):
+        return await asyncio.to_thread(store.page, org, active, sort, descending, after, limit)
     try:
-        with open(INVITES_FILE, 'r') as f:
-            data = yaml.safe_load(f)
-            if isinstance(data, list):
-                filtered_invites = []
-                for item in data:
-                    if org and item.get('org') != org:
-                        continue
-                    if active is not None and item.get('active') != active:
-                        continue
-                    expires_at = item.get('expires_at')
-                    # Ensure date is a string
-                    if isinstance(expires_at, datetime):
-                        date_str = expires_at.isoformat()
-                    else:
-                        date_str = str(expires_at) if expires_at is not None else ""
-                    filtered_invites.append(
-                        Invite(
-                            org=item.get('org'),
-                            expires_at=date_str,
-                            active=item.get('active'),
-                            code=item.get('code'),
-                            available_uses=item.get('available_uses', 1)
-                        )
-                    )
-                return InvitesResponse(invites=filtered_invites)
-            else:
-                return InvitesResponse(invites=[])
+        return await page.respond("invites", fetch)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
-# Generate Invite Code adds to a file called invites.yaml in the root of the DATA_DIR
-# (it creates the file if missing). And in each invite, you have a randomized code
-# with high entropy, an org, and a date when it expires
+# Generate Invite Code adds an invite to the invite store. Each invite has a
+# randomized code with high entropy, an org, and a date when it expires
 @router.post("/api/invites/generate")
 async def generate_invite(org: str, days_valid: int = 7, uses: int = 1):
-    org = sanitize_string(org)
+    org = validate_invite_request(org, days_valid, uses)
 
-    if not os.path.exists(ORGS_DIR):
-        raise HTTPException(status_code=404, detail="Org directory does not exist")
+    invite_code = generate_random_code()
+    invite = await asyncio.to_thread(get_invite_store().create, org, invite_code, days_valid, uses)
+
+    return {"invite": invite}
+
+@router.post("/api/invites/bulk")
+async def generate_invites_bulk(req: BulkInviteRequest):
+    """
+    Generate many invites at once. They are persisted in a single write and
+    streamed back as NDJSON (one invite per line) or CSV.
+    """
+    org = validate_invite_request(req.org, req.days_valid, req.uses)
+    if req.count < 1 or req.count > MAX_BULK_INVITES:
+        raise HTTPException(status_code=400, detail=f"count must be between 1 and {MAX_BULK_INVITES}")
+    tags = [sanitize_string(t) for t in req.tags]
+    if not all(tags) or any(t.startswith("org") for t in tags):
+        raise HTTPException(status_code=400, detail='Invalid tags')
+    name_prefix = sanitize_string(req.name_prefix) if req.name_prefix else None
+
+    codes = [generate_random_code() for _ in range(req.count)]
+    invites = await asyncio.to_thread(
+        get_invite_store().create_many, org, codes, req.days_valid, req.uses, tags, name_prefix
+    )
+
+    if req.format == "csv":
+        def rows():
+            buf = io.StringIO()
+            writer = csv.DictWriter(buf, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            for invite in invites:
+                writer.writerow({**invite, "tags": " ".join(invite["tags"])})
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        return StreamingResponse(
+            rows(), media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{org}_invites.csv"'},
+        )
+
+    def lines():
+        for invite in invites:
+            yield json.dumps(invite) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
-    org_dir = os.path.join(ORGS_DIR, org)
-    if not os.path.isdir(org_dir):
+def validate_invite_request(org, days_valid, uses):
+    """
+    Sanitize the org and validate invite parameters, returning the org.
+    """
+    org = sanitize_string(org)
+
+    if not get_registry().org_exists(org):
         raise HTTPException(status_code=404, detail=f"Org '{org}' not found")
-    
+
     if (days_valid <= 0):
         raise HTTPException(status_code=400, detail="days_valid must be a positive integer")
     if (uses < 1):
         raise HTTPException(status_code=400, detail="uses must be a positive integer")
-
-    invite_code = generate_random_code()
-    invite = {
-        "code": invite_code,
-        "org": org,
-        "expires_at": datetime.utcnow() + timedelta(days=days_valid),
-        "active": True,  # Set active True by default
-        "available_uses": uses
-    }
-
-    invites_file = os.path.join(DATA_DIR, "invites.yaml")
-    save_invite(invites_file, invite)
-
-    return {"invite": invite}
+    return org
 
 def generate_random_code(length=32):
     """
@@ -103,20 +152,6 @@ def generate_random_code(length=32):
     alphabet = string.ascii_letters + string.digits
     return ''.join(secrets.choice(alphabet) for _ in range(length))
 
-def save_invite(invites_file, invite):
-    """
-    Save an invite to the invites.yaml file. Appends to the list if file exists, otherwise creates a new list.
-    """
-    if os.path.exists(invites_file):
-        with open(invites_file, "r") as f:
-            invites = yaml.safe_load(f) or []
-    else:
-        invites = []
-    invites.append(invite)
-    with open(invites_file, "w") as f:
-        yaml.safe_dump(invites, f)
-
-
 def sanitize_string(s):
     if not isinstance(s, str):
         return ""
@@ -124,24 +159,9 @@ def sanitize_string(s):
     return sanitized
 
 
-# Mark Invite as Inactive
+# Mark Invite as Inactive (moves it to the archive)
 @router.delete("/api/invites/{code}")
 async def deactivate_invite(code: str):
-    if not os.path.exists(INVITES_FILE):
-        raise HTTPException(status_code=404, detail="Invites file does not exist")
-    try:
-        with open(INVITES_FILE, 'r') as f:
-            invites = yaml.safe_load(f) or []
-        invite_found = False
-        for invite in invites:
-            if invite.get('code') == code:
-                invite['active'] = False
-                invite_found = True
-                break
-        if not invite_found:
-            raise HTTPException(status_code=404, detail="Invite code not found")
-        with open(INVITES_FILE, 'w') as f:
-            yaml.safe_dump(invites, f)
-        return {"detail": "Invite marked as inactive successfully"}
-    except Exception as e:
-        raise HTTPException(status_code=HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
\ No newline at end of file
+    if not await asyncio.to_thread(get_invite_store().deactivate, code):
+        raise HTTPException(status_code=404, detail="Invite code not found")
+    return {"detail": "Invite marked as inactive successfully"}
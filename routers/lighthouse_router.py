@@ -1,8 +1,12 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 import os
 import yaml
 import shutil
-from nebula_api import NebulaAPI
+from nebula_api import NebulaConfigError, get_nebula_api
+from config_template import config_template
+from cert_expiry import cert_expiry_index
+from routers.hosts_router import sign_replacing
+from routers.nebula_process_router import control, reload_lighthouse
 from vars import DATA_DIR, LIGHTHOUSE_IP, EXTERNAL_IP
 
 router = APIRouter()
@@ -48,13 +52,18 @@ def get_all_configs():
 def create_lighthouse_config():
     config_init_lighthouse()
     create_lighthouse_certs()
-    return {"status": "success"}
+    # A running lighthouse picks up the new config and certs without dropping tunnels
+    # control() turns an unreachable lighthouse worker into a 503, as for the process endpoints
+    try:
+        reloaded = control(reload_lighthouse)
+    except NebulaConfigError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "reloaded": reloaded}
 
 def config_init_lighthouse():
     data_dir = 'data'
     lighthouse_dir = os.path.join(data_dir, "lighthouse")
     config_path = os.path.join(lighthouse_dir, "config.yaml")
-    example_path = 'config.yml.example'
     if not os.path.exists(data_dir):
         print("Creating data directory")
         os.makedirs(data_dir)
@@ -70,10 +79,11 @@ def config_init_lighthouse():
             print("Error: LIGHTHOUSE_PUBLIC_IP is not a valid IP address. Please set it in .env")
             exit(1)
     print("LIGHTHOUSE_PUBLIC_IP is valid:", lighthouse_public_ip)
-    if not os.path.exists(config_path):
-        shutil.copy(example_path, config_path)
-    with open(config_path, 'r') as f:
-        config = yaml.safe_load(f)
+    if os.path.exists(config_path):
+        with open(config_path, 'r') as f:
+            config = yaml.safe_load(f)
+    else:
+        config = dict(config_template.tree())
     config['lighthouse'] = {'am_lighthouse': True}
     config['static_host_map'] = {}
     config['firewall'] = {
@@ -107,8 +117,7 @@ def config_init_lighthouse():
     with open(config_path, 'w') as f:
         yaml.dump(config, f, default_flow_style=False)
 
-def create_lighthouse_certs():
-    print("Creating certificates for lighthouse")
+def lighthouse_sign_args():
     lighthouse_dir = "data/lighthouse"
     os.makedirs(lighthouse_dir, exist_ok=True)
     print(f"Lighthouse directory created or exists: {lighthouse_dir}")
@@ -119,16 +128,32 @@ def create_lighthouse_certs():
     ca_key = os.path.join(DATA_DIR, "certs", "ca.key")
     print(f"CA certificate path: {ca_crt}, CA key path: {ca_key}")
     networks = f"{LIGHTHOUSE_IP}/48"
-    nebula = NebulaAPI()
+    return {
+        "name": "lighthouse1",
+        "networks": networks,
+        "out_crt": out_crt,
+        "out_key": out_key,
+        "ca_crt": ca_crt,
+        "ca_key": ca_key,
+    }
+
+def create_lighthouse_certs():
+    print("Creating certificates for lighthouse")
+    sign_args = lighthouse_sign_args()
     print("Signing certificate with NebulaAPI...")
-    result = nebula.sign_cert(
-        name="lighthouse1",
-        networks=networks,
-        out_crt=out_crt,
-        out_key=out_key,
-        ca_crt=ca_crt,
-        ca_key=ca_key,
-    )
-    ca_crt_dest = os.path.join(lighthouse_dir, "ca.crt")
+    result = get_nebula_api().sign_cert(**sign_args)
+    cert_expiry_index.update(sign_args["out_crt"])
+    ca_crt_dest = os.path.join(os.path.dirname(sign_args["out_crt"]), "ca.crt")
     if not os.path.exists(ca_crt_dest):
-        shutil.copy(ca_crt, ca_crt_dest)
+        shutil.copy(sign_args["ca_crt"], ca_crt_dest)
+
+def renew_lighthouse_certs():
+    """
+    Re-sign the lighthouse certificate, replacing the old one only once signing
+    succeeded, then reload the running lighthouse so it serves the new one.
+    """
+    print("Renewing certificates for lighthouse")
+    sign_args = lighthouse_sign_args()
+    sign_replacing(get_nebula_api(), **sign_args)
+    shutil.copy(sign_args["ca_crt"], os.path.join(os.path.dirname(sign_args["out_crt"]), "ca.crt"))
+    reload_lighthouse()
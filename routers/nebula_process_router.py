@@ -1,31 +1,137 @@
-from fastapi import APIRouter
-from nebula_api import NebulaAPI
+import asyncio
+import json
+import time
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from nebula_api import NebulaConfigError
+from lighthouse_control import get_lighthouse_control, LighthouseUnavailable
+from drain import draining
+
+# Seconds between keepalive comments on an idle log stream
+SSE_KEEPALIVE_INTERVAL = 15
+
+# The lighthouse, shared by all workers: restarted if it crashes, and started
+# with the API if it was running before
+lighthouse = get_lighthouse_control()
+
+
+def reload_lighthouse() -> bool:
+    """
+    Validate the lighthouse config and SIGHUP the running lighthouse.
+    Raises NebulaConfigError (after rolling the config back) if validation fails.
+    """
+    return lighthouse.reload()["status"] == "reloaded"
+
+
+def autostart_lighthouse() -> None:
+    """
+    Take ownership of the lighthouse if no other worker has it, and start it if it was running before.
+    """
+    lighthouse.startup()
+
+
+def shutdown_lighthouse() -> None:
+    """
+    Stop the lighthouse with the API, keeping it marked as running for the next start.
+    """
+    lighthouse.shutdown()
+
+
+def control(op, *args):
+    try:
+        return op(*args)
+    except LighthouseUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-# Import or define the NebulaAPI instance
-nebula = NebulaAPI()
- 
 router = APIRouter()
 
 # Use nebula_api to check on the status of the nebula process:
 @router.get('/api/nebula_process/status')
 def get_nebula_process_status():
-    if nebula._nebula_proc:
-        return {"status": "running", "pid": nebula._nebula_proc.pid}
-    return {"status": "stopped"}
+    # status is running, restarting, crash_loop or stopped, plus uptime and restart/crash counters
+    return lighthouse.status()
 
 @router.post('/api/nebula_process/start')
 def start_nebula_process():
-    if nebula._nebula_proc and nebula._nebula_proc.poll() is None:
-        return {"status": "already running", "pid": nebula._nebula_proc.pid}
-    nebula.run_nebula_tracked("./data/lighthouse/config.yaml")  # Assumes NebulaAPI has a start() method
-    if nebula._nebula_proc:
-        return {"status": "started", "pid": nebula._nebula_proc.pid}
-    return {"status": "failed to start"}
+    return control(lighthouse.start)
 
 @router.post('/api/nebula_process/stop')
 def stop_nebula_process():
-    if not nebula._nebula_proc or nebula._nebula_proc.poll() is not None:
-        return {"status": "already stopped"}
-    nebula.stop_nebula_tracked()  # Assumes NebulaAPI has a stop() method
-    return {"status": "stopped"}
+    return control(lighthouse.stop)
+
+
+@router.post('/api/nebula_process/reload')
+def reload_nebula_process():
+    """
+    Reload the lighthouse config in place (SIGHUP) without dropping tunnels.
+    """
+    try:
+        result = control(lighthouse.reload)
+    except NebulaConfigError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result["status"] == "validated":
+        return {"status": "validated", "detail": "Nebula is not running; config will be used on next start"}
+    return result
+
+
+@router.get('/api/nebula_process/logs')
+def get_nebula_process_logs(
+    lines: int = Query(200, ge=0, le=10000),
+    since: Optional[int] = Query(None, ge=0),
+    level: Optional[str] = None,
+):
+    """
+    Tail of the lighthouse's captured output, oldest first. Pass the returned
+    last_seq as `since` to get only what was logged after this call.
+    """
+    return control(lighthouse.logs, lines, since, level)
+
+@router.get('/api/nebula_process/logs/stream')
+async def stream_nebula_process_logs(
+    request: Request,
+    lines: int = Query(100, ge=0, le=10000),
+    since: Optional[int] = Query(None, ge=0),
+    level: Optional[str] = None,
+    last_event_id: Optional[str] = Header(default=None),
+):
+    """
+    Server-Sent Events stream of the lighthouse's output: the last `lines`
+    entries, then new ones as they are logged. Each event's id is its seq,
+    so a reconnecting EventSource resumes where it left off.
+    """
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    backlog = []
+    if since is None:
+        recent = await asyncio.to_thread(control, lighthouse.logs, lines, None, level)
+        backlog = recent["entries"]
+        since = recent["last_seq"]
+
+    def event(entry: dict) -> str:
+        return f"id: {entry['seq']}\nevent: log\ndata: {json.dumps(entry)}\n\n"
+
+    async def events():
+        yield "retry: 3000\n\n"
+        for entry in backlog:
+            yield event(entry)
+        last_sent = time.monotonic()
+        # Wake up every second even when idle, so disconnects and shutdown end the stream promptly
+        async for batch in lighthouse.follow_logs(since, level=level, heartbeat=1.0):
+            if draining() or await request.is_disconnected():
+                break
+            if batch:
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= SSE_KEEPALIVE_INTERVAL:
+                last_sent = time.monotonic()
+                yield ": keepalive\n\n"
+            for entry in batch:
+                yield event(entry)
 
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,187 @@
+import re
+import threading
+from ipaddress import IPv6Network
+from typing import Optional
+
+from host_registry import HostRegistry, get_registry
+from vars import IPV6_PREFIX
+
+SUBNET_COUNT = 0x10000  # one /64 per 16-bit subnet id under the /48 prefix
+BITMAP_BYTES = SUBNET_COUNT // 8
+LIGHTHOUSE_SUBNET_ID = 0x0000
+
+_NOT_FULL_BYTE_RE = re.compile(b'[^\xff]')
+
+
+def subnet_for_id(subnet_id: int) -> str:
+    return f"{IPV6_PREFIX}:{subnet_id:04x}::/64"
+
+
+def subnet_id_for(subnet: str) -> int:
+    return (int(IPv6Network(subnet).network_address) >> 64) & 0xffff
+
+
+class SubnetAllocator:
+    """
+    Allocates the /64 subnet of each org from a persistent bitmap.
+
+    Two 8 KB bitmaps are kept in the registry database: one for subnet ids
+    handed to orgs and one for ids reserved for infrastructure (id 0000 is
+    always reserved for the lighthouse). A cursor tracks the lowest id that
+    may be free, so allocation and release are constant time and never
+    materialize the 65k id space.
+    """
+
+    def __init__(self, registry: HostRegistry):
+        self.registry = registry
+        registry.execute(
+            """
+            CREATE TABLE IF NOT EXISTS subnet_bitmap (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                used BLOB NOT NULL,
+                reserved BLOB NOT NULL,
+                hint INTEGER NOT NULL
+            )
+            """
+        )
+        registry.execute("CREATE INDEX IF NOT EXISTS orgs_subnet ON orgs (subnet)")
+
+    def allocate(self) -> str:
+        """
+        Mark the lowest free subnet id as used and return its subnet.
+        """
+        with self.registry.transaction():
+            used, reserved, hint = self._load()
+            taken = _union(used, reserved)
+            while True:
+                match = _NOT_FULL_BYTE_RE.search(taken, hint // 8)
+                if match is None:
+                    raise ValueError('No available subnets')
+                byte_index = match.start()
+                byte = taken[byte_index]
+                bit = next(b for b in range(8) if not byte & (0x80 >> b))
+                subnet_id = byte_index * 8 + bit
+                _set_bit(used, subnet_id)
+                hint = subnet_id + 1
+                subnet = subnet_for_id(subnet_id)
+                # Skip ids an org already holds, e.g. one imported from orgs.yaml
+                if not self.registry.execute("SELECT 1 FROM orgs WHERE subnet = ?", (subnet,)).fetchone():
+                    break
+                taken = _union(used, reserved)
+            self._store(used, reserved, hint)
+        return subnet
+
+    def release(self, subnet: str) -> None:
+        """
+        Return an org's subnet id to the pool.
+        """
+        subnet_id = subnet_id_for(subnet)
+        with self.registry.transaction():
+            used, reserved, hint = self._load()
+            _clear_bit(used, subnet_id)
+            self._store(used, reserved, min(hint, subnet_id))
+
+    def reserve_range(self, start: int, end: int) -> int:
+        """
+        Reserve subnet ids start..end (inclusive) so they are never handed to
+        an org. Returns how many ids were newly reserved.
+        """
+        _check_range(start, end)
+        with self.registry.transaction():
+            used, reserved, hint = self._load()
+            count = 0
+            for subnet_id in range(start, end + 1):
+                if not _get_bit(reserved, subnet_id):
+                    _set_bit(reserved, subnet_id)
+                    count += 1
+            self._store(used, reserved, hint)
+        return count
+
+    def unreserve_range(self, start: int, end: int) -> int:
+        """
+        Release a reservation made with reserve_range. The lighthouse id stays reserved.
+        """
+        _check_range(start, end)
+        with self.registry.transaction():
+            used, reserved, hint = self._load()
+            count = 0
+            for subnet_id in range(max(start, LIGHTHOUSE_SUBNET_ID + 1), end + 1):
+                if _get_bit(reserved, subnet_id):
+                    _clear_bit(reserved, subnet_id)
+                    count += 1
+            self._store(used, reserved, min(hint, start))
+        return count
+
+    def utilization(self) -> dict:
+        used, reserved, _ = self._load()
+        used_count = int.from_bytes(used, 'big').bit_count()
+        reserved_count = int.from_bytes(reserved, 'big').bit_count()
+        taken_count = int.from_bytes(_union(used, reserved), 'big').bit_count()
+        return {
+            "total": SUBNET_COUNT,
+            "used": used_count,
+            "reserved": reserved_count,
+            "free": SUBNET_COUNT - taken_count,
+            "utilization": round(taken_count / SUBNET_COUNT, 6),
+        }
+
+    def _load(self) -> tuple[bytearray, bytearray, int]:
+        row = self.registry.execute("SELECT used, reserved, hint FROM subnet_bitmap WHERE id = 0").fetchone()
+        if row is not None:
+            return bytearray(row[0]), bytearray(row[1]), row[2]
+
+        # First use: build the bitmap from the subnets orgs already hold
+        used = bytearray(BITMAP_BYTES)
+        reserved = bytearray(BITMAP_BYTES)
+        _set_bit(reserved, LIGHTHOUSE_SUBNET_ID)
+        for subnet in self.registry.org_subnets().values():
+            try:
+                _set_bit(used, subnet_id_for(subnet))
+            except ValueError:
+                continue
+        with self.registry.transaction():
+            self._store(used, reserved, 0)
+        return used, reserved, 0
+
+    def _store(self, used: bytearray, reserved: bytearray, hint: int) -> None:
+        self.registry.execute(
+            "INSERT INTO subnet_bitmap (id, used, reserved, hint) VALUES (0, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET used = excluded.used, reserved = excluded.reserved, hint = excluded.hint",
+            (bytes(used), bytes(reserved), hint),
+        )
+
+
+def _union(a: bytearray, b: bytearray) -> bytes:
+    return (int.from_bytes(a, 'big') | int.from_bytes(b, 'big')).to_bytes(BITMAP_BYTES, 'big')
+
+
+def _get_bit(bitmap: bytearray, index: int) -> bool:
+    return bool(bitmap[index // 8] & (0x80 >> (index % 8)))
+
+
+def _set_bit(bitmap: bytearray, index: int) -> None:
+    bitmap[index // 8] |= 0x80 >> (index % 8)
+
+
+def _clear_bit(bitmap: bytearray, index: int) -> None:
+    bitmap[index // 8] &= ~(0x80 >> (index % 8)) & 0xff
+
+
+def _check_range(start: int, end: int) -> None:
+    if not (0 <= start <= end < SUBNET_COUNT):
+        raise ValueError(f"Subnet id range must be within 0..{SUBNET_COUNT - 1} and start <= end")
+
+
+_allocator: Optional[SubnetAllocator] = None
+_allocator_lock = threading.Lock()
+
+
+def get_subnet_allocator() -> SubnetAllocator:
+    """
+    Return the process-wide SubnetAllocator bound to the host registry.
+    """
+    global _allocator
+    with _allocator_lock:
+        if _allocator is None:
+            _allocator = SubnetAllocator(get_registry())
+        return _allocator
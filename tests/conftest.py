@@ -0,0 +1,91 @@
+import os
+import shutil
+import subprocess
+import time
+
+import pytest
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+from host_registry import HostRegistry
+from nebula_cert import (
+    CERTIFICATE_V2_BANNER,
+    ED25519_PRIVATE_KEY_BANNER,
+    CertificateV2,
+    parse_networks,
+    pem_encode,
+)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _find_nebula_cert():
+    path = os.getenv("NEBULA_CERT_BIN") or os.path.join(ROOT_DIR, "bin", "nebula-cert")
+    if os.access(path, os.X_OK):
+        return path
+    return shutil.which("nebula-cert")
+
+
+@pytest.fixture
+def nebula_cert():
+    """
+    Path of a real nebula-cert binary (NEBULA_CERT_BIN, ./bin/nebula-cert or
+    on PATH); tests using it are skipped when there is none.
+    """
+    path = _find_nebula_cert()
+    if path is None:
+        pytest.skip("nebula-cert binary not found")
+    return path
+
+
+def run_nebula_cert(nebula_cert: str, *args: str) -> str:
+    result = subprocess.run([nebula_cert, *args], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr or result.stdout
+    return result.stdout
+
+
+@pytest.fixture
+def python_ca(tmp_path):
+    """
+    A v2 Curve25519 CA made without nebula-cert: (ca.crt path, ca.key path, CertificateV2).
+    """
+    key = Ed25519PrivateKey.generate()
+    public_key = key.public_key().public_bytes_raw()
+    now = int(time.time())
+    ca = CertificateV2(
+        name="test-ca",
+        networks=parse_networks("10.1.0.0/16,fd00:1::/48"),
+        is_ca=True,
+        not_before=now - 60,
+        not_after=now + 24 * 3600,
+        public_key=public_key,
+    )
+    ca.signature = key.sign(ca.marshal_for_signing())
+    ca_crt, ca_key = tmp_path / "ca.crt", tmp_path / "ca.key"
+    ca_crt.write_bytes(pem_encode(CERTIFICATE_V2_BANNER, ca.marshal()))
+    ca_key.write_bytes(pem_encode(ED25519_PRIVATE_KEY_BANNER, key.private_bytes_raw() + public_key))
+    return str(ca_crt), str(ca_key), ca
+
+
+@pytest.fixture
+def nebula_ca(tmp_path, nebula_cert):
+    """
+    A v2 CA made by nebula-cert: (ca.crt path, ca.key path).
+    """
+    ca_crt, ca_key = str(tmp_path / "ca.crt"), str(tmp_path / "ca.key")
+    run_nebula_cert(
+        nebula_cert, "ca", "-version", "2", "-name", "test-ca",
+        "-networks", "10.1.0.0/16,fd00:1::/48", "-duration", "24h",
+        "-out-crt", ca_crt, "-out-key", ca_key,
+    )
+    return ca_crt, ca_key
+
+
+@pytest.fixture
+def registry(tmp_path):
+    """
+    A HostRegistry with its database and YAML export under tmp_path.
+    """
+    orgs_dir = tmp_path / "orgs"
+    registry = HostRegistry(str(tmp_path / "registry.db"), str(orgs_dir), str(orgs_dir / "orgs.yaml"))
+    yield registry
+    registry.flush_export()
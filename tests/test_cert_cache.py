@@ -0,0 +1,35 @@
+"""
+The in-process `nebula-cert print -json` rendering used by CertInfoCache must
+match nebula-cert's own output, fingerprints included.
+"""
+import hashlib
+import json
+
+from cert_cache import _print_in_process
+from nebula_cert import NebulaSigner
+from tests.conftest import run_nebula_cert
+
+
+def test_print_fingerprint_without_nebula_cert(python_ca):
+    ca_crt, _, ca = python_ca
+    [printed] = json.loads(_print_in_process(ca_crt))
+    details = ca.marshal_details() + bytes([ca.curve]) + ca.public_key + ca.signature
+    assert printed["fingerprint"] == hashlib.sha256(details).hexdigest()
+
+
+def test_print_matches_nebula_cert(tmp_path, nebula_cert, nebula_ca):
+    ca_crt, ca_key = nebula_ca
+    host_crt, host_key = str(tmp_path / "host.crt"), str(tmp_path / "host.key")
+    run_nebula_cert(nebula_cert, "sign", "-version", "2", "-name", "host", "-networks", "10.1.0.3/16",
+                    "-groups", "servers", "-ca-crt", ca_crt, "-ca-key", ca_key,
+                    "-out-crt", host_crt, "-out-key", host_key)
+    signed_crt, signed_key = str(tmp_path / "signed.crt"), str(tmp_path / "signed.key")
+    NebulaSigner().sign(name="signed", networks="10.1.0.4/16", out_crt=signed_crt, out_key=signed_key,
+                        ca_crt=ca_crt, ca_key=ca_key)
+    # A file holding several certificates, like a CA bundle
+    bundle = tmp_path / "bundle.crt"
+    bundle.write_bytes(open(ca_crt, "rb").read() + open(host_crt, "rb").read())
+
+    for path in (ca_crt, host_crt, signed_crt, str(bundle)):
+        expected = json.loads(run_nebula_cert(nebula_cert, "print", "-json", "-path", path))
+        assert json.loads(_print_in_process(path)) == expected, path
@@ -0,0 +1,85 @@
+"""
+HostRegistry transactions, change counters and the delayed YAML export.
+"""
+import pytest
+import yaml
+
+from host_registry import HostRegistry
+
+
+def test_nested_transactions_commit_once(registry):
+    seen = []
+    registry.add_listener(lambda changes, version: seen.append(([c[0] for c in changes], version)))
+    with registry.transaction():
+        registry.add_host("org", "a", "fd00::1", ["web"])
+        with registry.transaction():
+            registry.add_host("org", "b", "fd00::2", [])
+        # The inner block didn't commit on its own
+        assert seen == []
+    assert seen == [(["add", "add"], 2)]
+    assert [h["name"] for h in registry.list_hosts("org")] == ["a", "b"]
+
+
+def test_error_in_nested_transaction_rolls_back_everything(registry):
+    registry.add_host("org", "kept", "fd00::1", [])
+    with pytest.raises(RuntimeError):
+        with registry.transaction():
+            registry.add_host("org", "a", "fd00::2", [])
+            with registry.transaction():
+                registry.add_host("org", "b", "fd00::3", [])
+                raise RuntimeError("boom")
+    assert [h["name"] for h in registry.list_hosts("org")] == ["kept"]
+    assert registry.hosts_version() == 1
+    # The registry is usable again after the rollback
+    registry.add_host("org", "a", "fd00::2", [])
+    assert registry.hosts_version() == 2
+
+
+def test_duplicate_host_or_ip_is_rejected(registry):
+    registry.add_host("org", "a", "fd00::1", [])
+    with pytest.raises(ValueError):
+        registry.add_host("org", "a", "fd00::2", [])
+    with pytest.raises(ValueError):
+        registry.add_host("org", "b", "fd00::1", [])
+    assert registry.hosts_version() == 1
+
+
+def test_hosts_version_counts_adds_and_removes(registry):
+    assert registry.hosts_version() == 0
+    registry.add_host("org", "a", "fd00::1", ["web"])
+    registry.add_host("org", "b", "fd00::2", [])
+    assert registry.remove_host("org", "a") == {"name": "a", "ip": "fd00::1", "tags": ["web"]}
+    assert registry.remove_host("org", "a") is None
+    assert registry.hosts_version() == 3
+    assert registry.hosts_with_tag("web") == []
+
+
+def test_host_versions_come_from_one_sequence(registry):
+    registry.add_host("org", "a", "fd00::1", [])
+    registry.add_host("org", "b", "fd00::2", [])
+    assert registry.host_version("org", "a") == 0
+    first = registry.bump_host_version("org", "a")
+    second = registry.bump_host_version("org", "b")
+    assert second > first
+    assert registry.bump_host_version("org", "missing") is None
+    assert registry.hosts_changed_since(first) == [("org", "b", second)]
+    # A host's version doesn't change hosts_version, which only counts adds and removes
+    assert registry.hosts_version() == 2
+
+
+def test_version_is_shared_across_connections(registry):
+    other = HostRegistry(registry.db_path, registry.orgs_dir, registry.orgs_file)
+    registry.add_host("org", "a", "fd00::1", [])
+    assert other.hosts_version() == 1
+    assert other.get_host("org", "a") == {"name": "a", "ip": "fd00::1", "tags": []}
+
+
+def test_export_waits_for_flush(tmp_path):
+    orgs_dir = tmp_path / "orgs"
+    registry = HostRegistry(str(tmp_path / "registry.db"), str(orgs_dir), str(orgs_dir / "orgs.yaml"), export_delay=60)
+    registry.set_org_subnet("org", "fd00:0:0:1::/64")
+    registry.add_host("org", "a", "fd00:0:0:1::1", [])
+    assert not (orgs_dir / "org" / "hosts.yaml").exists()
+    registry.flush_export()
+    assert yaml.safe_load((orgs_dir / "orgs.yaml").read_text()) == {"org": "fd00:0:0:1::/64"}
+    assert yaml.safe_load((orgs_dir / "org" / "hosts.yaml").read_text()) == [{"name": "a", "ip": "fd00:0:0:1::1", "tags": []}]
@@ -0,0 +1,96 @@
+"""
+InviteStore redemption: atomic across connections (worker processes),
+refunds, and spent or expired invites moving to the archive.
+"""
+import threading
+import time
+
+import pytest
+
+from host_registry import HostRegistry
+from invite_store import InviteError, InviteStore
+
+
+@pytest.fixture
+def store(registry):
+    return InviteStore(registry)
+
+
+def redeem_concurrently(registry, code, attempts):
+    """
+    Redeem code from `attempts` threads at once, each with its own registry
+    connection as separate workers would have. Returns how many succeeded.
+    """
+    stores = [InviteStore(HostRegistry(registry.db_path, registry.orgs_dir, registry.orgs_file)) for _ in range(attempts)]
+    barrier = threading.Barrier(attempts)
+    results = []
+
+    def redeem(store):
+        barrier.wait()
+        try:
+            store.redeem(code)
+        except InviteError:
+            results.append(False)
+        else:
+            results.append(True)
+
+    threads = [threading.Thread(target=redeem, args=(s,)) for s in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results.count(True)
+
+
+def test_last_use_is_redeemed_once(registry, store):
+    store.create("org", "single", days_valid=1, uses=1)
+    assert redeem_concurrently(registry, "single", 8) == 1
+    assert store.get("single")["available_uses"] == 0
+    with pytest.raises(InviteError, match="already used"):
+        store.redeem("single")
+
+
+def test_uses_are_never_overspent(registry, store):
+    store.create("org", "multi", days_valid=1, uses=3)
+    assert redeem_concurrently(registry, "multi", 10) == 3
+    assert store.page(active=True) == []
+
+
+def test_redeem_returns_invite_and_archives_last_use(store):
+    store.create("org", "code", days_valid=1, uses=2, tags=["web"], name_prefix="node")
+    first = store.redeem("code")
+    assert (first["org"], first["available_uses"], first["tags"], first["name_prefix"]) == ("org", 2, ["web"], "node")
+    store.redeem("code")
+    assert [i["code"] for i in store.page(active=False)] == ["code"]
+
+
+def test_refund_gives_back_the_last_use(store):
+    store.create("org", "code", days_valid=1, uses=1)
+    store.redeem("code")
+    store.refund("code")
+    assert store.get("code")["available_uses"] == 1
+    assert store.redeem("code")["code"] == "code"
+
+
+def test_refund_of_a_partly_used_invite(store):
+    store.create("org", "code", days_valid=1, uses=3)
+    store.redeem("code")
+    store.refund("code")
+    assert store.get("code")["available_uses"] == 3
+
+
+def test_expired_invite_is_rejected_and_archived(store):
+    store.create("org", "old", days_valid=1, uses=1)
+    store.registry.execute("UPDATE invites SET expires_at = ? WHERE code = 'old'", (time.time() - 1,))
+    with pytest.raises(InviteError, match="expired"):
+        store.redeem("old")
+    # The archiving committed even though redeem raised
+    row = store.registry.execute("SELECT reason FROM invites_archive WHERE code = 'old'").fetchone()
+    assert row["reason"] == "expired"
+    with pytest.raises(InviteError, match="expired"):
+        store.redeem("old")
+
+
+def test_unknown_code(store):
+    with pytest.raises(InviteError, match="Invalid"):
+        store.redeem("nope")
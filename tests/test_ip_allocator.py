@@ -0,0 +1,54 @@
+"""
+HostAddressAllocator: fresh addresses from the high-water mark, released
+ones reused first, and a clean error once the subnet is used up.
+"""
+import pytest
+
+from ip_allocator import HostAddressAllocator
+
+SUBNET = "fd00:1:2:3::/64"
+
+
+@pytest.fixture
+def allocator(registry):
+    registry.ensure_org("org")
+    return HostAddressAllocator(registry)
+
+
+def test_allocates_sequential_addresses(allocator):
+    assert allocator.allocate("org", SUBNET, 3) == ["fd00:1:2:3::1", "fd00:1:2:3::2", "fd00:1:2:3::3"]
+    assert allocator.allocate("org", SUBNET) == ["fd00:1:2:3::4"]
+
+
+def test_reuses_released_addresses_lowest_first(allocator):
+    allocator.allocate("org", SUBNET, 5)
+    allocator.release(SUBNET, "fd00:1:2:3::4")
+    allocator.release(SUBNET, "fd00:1:2:3::2")
+    assert allocator.allocate("org", SUBNET, 3) == ["fd00:1:2:3::2", "fd00:1:2:3::4", "fd00:1:2:3::6"]
+
+
+def test_ignores_releases_outside_the_pool(allocator):
+    allocator.allocate("org", SUBNET, 2)
+    # Never handed out, and not in this subnet at all
+    allocator.release(SUBNET, "fd00:1:2:3::99")
+    allocator.release(SUBNET, "fd00:9::1")
+    assert allocator.allocate("org", SUBNET) == ["fd00:1:2:3::3"]
+
+
+def test_skips_addresses_already_in_use(registry, allocator):
+    registry.add_host("org", "manual", "fd00:1:2:3::1", [])
+    registry.add_host("org", "other", "fd00:1:2:3::5", [])
+    # The pool is seeded from existing hosts: after the highest, gaps become free
+    assert allocator.allocate("org", SUBNET, 4) == ["fd00:1:2:3::2", "fd00:1:2:3::3", "fd00:1:2:3::4", "fd00:1:2:3::6"]
+
+
+def test_exhaustion_raises_and_rolls_back(allocator):
+    small = "fd00:1:2:3::/126"  # host ids 1..3
+    assert allocator.allocate("org", small, 3) == ["fd00:1:2:3::1", "fd00:1:2:3::2", "fd00:1:2:3::3"]
+    with pytest.raises(ValueError):
+        allocator.allocate("org", small)
+    allocator.release(small, "fd00:1:2:3::2")
+    # Asking for more than is free fails without taking the free address
+    with pytest.raises(ValueError):
+        allocator.allocate("org", small, 2)
+    assert allocator.allocate("org", small) == ["fd00:1:2:3::2"]
@@ -0,0 +1,79 @@
+"""
+Conformance of the in-process v2 signer (nebula_cert.py) with nebula-cert.
+
+The tests that need the nebula-cert binary are skipped without it; run
+./install_nebula_binaries.sh (or set NEBULA_CERT_BIN) to include them.
+"""
+import hashlib
+import json
+
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+
+from nebula_cert import NebulaSigner, load_certificate_v2
+from tests.conftest import run_nebula_cert
+
+
+def _sign(tmp_path, ca_crt, ca_key, name="host1", networks="10.1.0.5/16,fd00:1::5/48", **kwargs):
+    out_crt, out_key = str(tmp_path / f"{name}.crt"), str(tmp_path / f"{name}.key")
+    NebulaSigner().sign(name=name, networks=networks, out_crt=out_crt, out_key=out_key,
+                        ca_crt=ca_crt, ca_key=ca_key, **kwargs)
+    return out_crt, out_key
+
+
+def test_fingerprint_is_nebulas(python_ca):
+    _, _, ca = python_ca
+    expected = hashlib.sha256(ca.marshal_details() + bytes([ca.curve]) + ca.public_key + ca.signature).hexdigest()
+    assert ca.fingerprint() == expected
+    # A parsed certificate hashes the details exactly as read
+    assert load_certificate_v2(ca.marshal_pem()).fingerprint() == expected
+
+
+def test_host_issuer_is_ca_fingerprint(tmp_path, python_ca):
+    ca_crt, ca_key, ca = python_ca
+    out_crt, _ = _sign(tmp_path, ca_crt, ca_key, groups="laptop,admin", duration="1h")
+    with open(out_crt, "rb") as f:
+        host = load_certificate_v2(f.read())
+    assert host.issuer == ca.fingerprint()
+    assert host.groups == ["laptop", "admin"]
+    Ed25519PublicKey.from_public_bytes(ca.public_key).verify(host.signature, host.marshal_for_signing())
+
+
+def test_signed_cert_verifies_with_nebula_cert(tmp_path, nebula_cert, nebula_ca):
+    ca_crt, ca_key = nebula_ca
+    out_crt, _ = _sign(tmp_path, ca_crt, ca_key, groups="laptop", subnets="192.168.50.0/24")
+    run_nebula_cert(nebula_cert, "verify", "-ca", ca_crt, "-crt", out_crt)
+
+    printed = json.loads(run_nebula_cert(nebula_cert, "print", "-json", "-path", out_crt))
+    with open(out_crt, "rb") as f:
+        assert [load_certificate_v2(f.read()).to_json()] == printed
+    ca_printed = json.loads(run_nebula_cert(nebula_cert, "print", "-json", "-path", ca_crt))
+    assert printed[0]["details"]["issuer"] == ca_printed[0]["fingerprint"]
+
+
+def test_python_ca_works_with_nebula_cert(tmp_path, nebula_cert, python_ca):
+    ca_crt, ca_key, ca = python_ca
+    out_crt, out_key = str(tmp_path / "host.crt"), str(tmp_path / "host.key")
+    run_nebula_cert(nebula_cert, "sign", "-version", "2", "-name", "host", "-networks", "10.1.0.9/16",
+                    "-ca-crt", ca_crt, "-ca-key", ca_key, "-out-crt", out_crt, "-out-key", out_key)
+    run_nebula_cert(nebula_cert, "verify", "-ca", ca_crt, "-crt", out_crt)
+    ca_printed = json.loads(run_nebula_cert(nebula_cert, "print", "-json", "-path", ca_crt))
+    assert ca_printed == [ca.to_json()]
+
+
+def test_parses_nebula_cert_output(tmp_path, nebula_cert, nebula_ca):
+    ca_crt, ca_key = nebula_ca
+    out_crt, out_key = str(tmp_path / "host.crt"), str(tmp_path / "host.key")
+    run_nebula_cert(nebula_cert, "sign", "-version", "2", "-name", "host", "-networks", "10.1.0.7/16,fd00:1::7/48",
+                    "-groups", "a,b", "-subnets", "192.168.60.0/24", "-duration", "2h",
+                    "-ca-crt", ca_crt, "-ca-key", ca_key, "-out-crt", out_crt, "-out-key", out_key)
+    with open(out_crt, "rb") as f:
+        pem = f.read()
+    host = load_certificate_v2(pem)
+    printed = json.loads(run_nebula_cert(nebula_cert, "print", "-json", "-path", out_crt))
+    assert [host.to_json()] == printed
+    # Re-encoding a parsed certificate gives back the same bytes
+    assert host.marshal_pem() == pem
+
+    with open(ca_crt, "rb") as f:
+        ca = load_certificate_v2(f.read())
+    Ed25519PublicKey.from_public_bytes(ca.public_key).verify(host.signature, host.marshal_for_signing())
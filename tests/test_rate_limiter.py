@@ -0,0 +1,79 @@
+"""
+SQLiteRateLimiter token buckets, shared by every connection (worker
+process) on the same database.
+"""
+import threading
+
+import pytest
+
+import rate_limiter
+from rate_limiter import SQLiteRateLimiter, parse_rate
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(rate_limiter.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "ratelimit.db")
+
+
+def test_parse_rate():
+    assert parse_rate("5/minute") == (5, 60)
+    assert parse_rate("100 per 2 hours") == (100, 7200)
+    with pytest.raises(ValueError):
+        parse_rate("often")
+
+
+def test_bucket_is_shared_across_connections(db_path, clock):
+    first, second = SQLiteRateLimiter(db_path), SQLiteRateLimiter(db_path)
+    assert first.hit("ip:1", "3/minute") == (True, 0.0)
+    assert second.hit("ip:1", "3/minute") == (True, 0.0)
+    assert first.hit("ip:1", "3/minute") == (True, 0.0)
+    allowed, retry_after = second.hit("ip:1", "3/minute")
+    assert not allowed
+    assert retry_after == pytest.approx(20)
+    # Other keys have their own bucket
+    assert second.hit("ip:2", "3/minute") == (True, 0.0)
+
+
+def test_bucket_refills_over_time(db_path, clock):
+    limiter = SQLiteRateLimiter(db_path)
+    for _ in range(3):
+        assert limiter.hit("key", "3/minute")[0]
+    assert not limiter.hit("key", "3/minute")[0]
+    clock[0] += 20
+    assert limiter.hit("key", "3/minute")[0]
+    assert not limiter.hit("key", "3/minute")[0]
+    # Never refills past the bucket size
+    clock[0] += 3600
+    assert [SQLiteRateLimiter(db_path).hit("key", "3/minute")[0] for _ in range(4)] == [True, True, True, False]
+
+
+def test_concurrent_hits_take_each_token_once(db_path, clock):
+    limiters = [SQLiteRateLimiter(db_path) for _ in range(10)]
+    barrier = threading.Barrier(len(limiters))
+    results = []
+
+    def hit(limiter):
+        barrier.wait()
+        results.append(limiter.hit("code", "5/hour")[0])
+
+    threads = [threading.Thread(target=hit, args=(limiter,)) for limiter in limiters]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 5
+
+
+def test_reset(db_path, clock):
+    limiter = SQLiteRateLimiter(db_path)
+    limiter.hit("key", "1/minute")
+    assert not limiter.hit("key", "1/minute")[0]
+    limiter.reset("key")
+    assert limiter.hit("key", "1/minute")[0]
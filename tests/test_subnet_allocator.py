@@ -0,0 +1,50 @@
+"""
+SubnetAllocator: lowest free /64 first, the lighthouse id and reserved
+ranges never handed out, released ids reused, and exhaustion reported.
+"""
+import pytest
+
+from subnet_allocator import SUBNET_COUNT, SubnetAllocator, subnet_for_id, subnet_id_for
+
+
+@pytest.fixture
+def allocator(registry):
+    return SubnetAllocator(registry)
+
+
+def test_allocates_lowest_free_id_after_the_lighthouse(allocator):
+    assert [subnet_id_for(allocator.allocate()) for _ in range(3)] == [1, 2, 3]
+
+
+def test_release_makes_the_id_available_again(allocator):
+    subnets = [allocator.allocate() for _ in range(4)]
+    allocator.release(subnets[1])
+    assert allocator.allocate() == subnets[1]
+    assert subnet_id_for(allocator.allocate()) == 5
+
+
+def test_reserved_ranges_are_skipped(allocator):
+    assert allocator.reserve_range(1, 10) == 10
+    assert subnet_id_for(allocator.allocate()) == 11
+    assert allocator.unreserve_range(0, 10) == 10
+    assert subnet_id_for(allocator.allocate()) == 1
+    # The lighthouse id stays reserved
+    assert allocator.utilization()["reserved"] == 1
+
+
+def test_skips_subnets_already_held_by_orgs(registry, allocator):
+    registry.set_org_subnet("imported", subnet_for_id(2))
+    allocator.allocate()  # builds the bitmap from orgs.yaml-era subnets
+    registry.set_org_subnet("late", subnet_for_id(3))
+    assert subnet_id_for(allocator.allocate()) == 4
+
+
+def test_exhaustion(allocator):
+    allocator.reserve_range(2, SUBNET_COUNT - 1)
+    last = allocator.allocate()
+    assert subnet_id_for(last) == 1
+    with pytest.raises(ValueError):
+        allocator.allocate()
+    allocator.release(last)
+    assert allocator.allocate() == last
+    assert allocator.utilization()["free"] == 0
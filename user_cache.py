@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from fastapi_users.db import SQLAlchemyUserDatabase
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from vars import USER_CACHE_TTL, USER_CACHE_MAX_ENTRIES
+
+
+class UserCache:
+    """
+    In-process cache of user rows by id, so authenticating a request with a
+    valid token doesn't need a database query.
+
+    Entries expire after `ttl` seconds, which bounds how long a change made
+    by another worker process (or directly in the database) goes unnoticed;
+    changes made through this process invalidate the entry at once. Column
+    values are stored rather than ORM objects, so every hit gets its own
+    instance and no session ever sees another request's object.
+    """
+
+    def __init__(self, ttl: float = USER_CACHE_TTL, max_entries: int = USER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Any, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id) -> Optional[dict]:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id, fields: dict) -> None:
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, fields)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id=None) -> None:
+        """
+        Drop one user's entry, or every entry if user_id is None.
+        """
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+
+_user_cache: Optional[UserCache] = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache() -> UserCache:
+    """
+    Return the process-wide UserCache.
+    """
+    global _user_cache
+    with _user_cache_lock:
+        if _user_cache is None:
+            _user_cache = UserCache()
+        return _user_cache
+
+
+class CachedUserDatabase(SQLAlchemyUserDatabase):
+    """
+    SQLAlchemyUserDatabase whose lookups by id (the one fastapi-users makes
+    for every authenticated request) go through get_user_cache(). Updates
+    and deletes made through it invalidate the user's entry.
+    """
+
+    async def get(self, id):
+        cache = get_user_cache()
+        fields = cache.get(id)
+        if fields is not None:
+            user = self.user_table(**fields)
+            make_transient_to_detached(user)
+            # Attach it (or return the instance the session already holds) without a query,
+            # so it can be updated or deleted through this session like a loaded row
+            return await self.session.merge(user, load=False)
+        user = await super().get(id)
+        if user is not None:
+            cache.put(id, {attr.key: getattr(user, attr.key) for attr in inspect(self.user_table).column_attrs})
+        return user
+
+    async def update(self, user, update_dict: dict[str, Any]):
+        try:
+            return await super().update(user, update_dict)
+        finally:
+            get_user_cache().invalidate(user.id)
+
+    async def delete(self, user) -> None:
+        try:
+            await super().delete(user)
+        finally:
+            get_user_cache().invalidate(user.id)
@@ -6,9 +6,93 @@ ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(ROOT_DIR, 'data')
 ORGS_DIR = os.path.join(DATA_DIR, 'orgs')
 ORGS_FILE = os.path.join(ORGS_DIR, 'orgs.yaml')
+REGISTRY_DB = os.path.join(DATA_DIR, 'registry.db')
+BUNDLES_DIR = os.path.join(DATA_DIR, 'bundles')
+INVITES_FILE = os.path.join(DATA_DIR, 'invites.yaml')
 
 SAFE_STRING_RE = re.compile(r'^[a-z0-9]+$')
 
 IPV6_PREFIX = os.getenv("IPV6_PREFIX", "fdc8:d559:029d")
 LIGHTHOUSE_IP = f"{IPV6_PREFIX}::1"
-EXTERNAL_IP = os.getenv("LIGHTHOUSE_PUBLIC_IP")
\ No newline at end of file
+EXTERNAL_IP = os.getenv("LIGHTHOUSE_PUBLIC_IP")
+
+# Number of certificates signed in parallel when provisioning hosts in bulk
+SIGN_WORKERS = int(os.getenv("NEBULA_SIGN_WORKERS", os.cpu_count() or 4))
+
+# Maximum number of nebula/nebula-cert processes request handlers run at the same time
+NEBULA_MAX_SUBPROCESSES = int(os.getenv("NEBULA_MAX_SUBPROCESSES", SIGN_WORKERS))
+
+# "subprocess" shells out to nebula-cert; "python" signs host certificates in-process
+# (opt-in until tests/test_nebula_cert.py passes against the nebula-cert in use)
+NEBULA_SIGNER = os.getenv("NEBULA_SIGNER", "subprocess")
+
+# Certificates expiring within this many days are renewed by the scheduled renewal job
+CERT_RENEW_WINDOW_DAYS = float(os.getenv("NEBULA_CERT_RENEW_WINDOW_DAYS", 30))
+
+# Seconds between scheduled expiry checks; 0 disables scheduled renewal
+CERT_RENEW_INTERVAL = float(os.getenv("NEBULA_CERT_RENEW_INTERVAL", 24 * 60 * 60))
+
+# Maximum certificates re-signed per second by a renewal job
+CERT_RENEW_RATE = float(os.getenv("NEBULA_CERT_RENEW_RATE", 20))
+
+# Held by whichever worker is running a renewal job, so workers never run two at once
+CERT_RENEW_LOCK = os.path.join(DATA_DIR, 'renewal.lock')
+
+# Lighthouse supervisor: restart delay doubles from the min up to the max after each crash
+NEBULA_RESTART_BACKOFF_MIN = float(os.getenv("NEBULA_RESTART_BACKOFF_MIN", 1))
+NEBULA_RESTART_BACKOFF_MAX = float(os.getenv("NEBULA_RESTART_BACKOFF_MAX", 60))
+
+# Stop restarting after this many crashes within NEBULA_CRASH_LOOP_WINDOW seconds
+NEBULA_CRASH_LOOP_RESTARTS = int(os.getenv("NEBULA_CRASH_LOOP_RESTARTS", 5))
+NEBULA_CRASH_LOOP_WINDOW = float(os.getenv("NEBULA_CRASH_LOOP_WINDOW", 300))
+
+# Whether the lighthouse was left running, so it can be started again with the API
+NEBULA_PROCESS_STATE = os.path.join(DATA_DIR, 'lighthouse', 'process.json')
+
+# Lighthouse log lines kept in memory for /admin/api/nebula_process/logs (whichever limit is hit first)
+NEBULA_LOG_MAX_LINES = int(os.getenv("NEBULA_LOG_MAX_LINES", 5000))
+NEBULA_LOG_MAX_BYTES = int(os.getenv("NEBULA_LOG_MAX_BYTES", 2 * 1024 * 1024))
+
+# Shared lighthouse state for multi-worker deployments: the worker holding the lock file
+# owns the nebula process (pid in the pid file) and serves the others on the control socket
+NEBULA_PID_FILE = os.path.join(DATA_DIR, 'lighthouse', 'nebula.pid')
+NEBULA_CONTROL_LOCK = os.path.join(DATA_DIR, 'lighthouse', 'control.lock')
+NEBULA_CONTROL_SOCKET = os.getenv("NEBULA_CONTROL_SOCKET", os.path.join(DATA_DIR, 'lighthouse', 'control.sock'))
+
+# Preload the config template, CA metadata and host/certificate indexes before a worker takes traffic
+SERVER_WARMUP = os.getenv("SERVER_WARMUP", "1").lower() not in ("0", "false", "no")
+
+# Rate limits on invite redemption, shared by all workers through RATE_LIMIT_DB
+RATE_LIMIT_DB = os.path.join(DATA_DIR, 'ratelimit.db')
+INVITE_RATE_LIMIT_PER_IP = os.getenv("INVITE_RATE_LIMIT_PER_IP", "5/minute")
+INVITE_RATE_LIMIT_PER_CODE = os.getenv("INVITE_RATE_LIMIT_PER_CODE", "20/hour")
+# Rate limit on the client host-change long-poll, per client IP
+HOST_CHANGES_RATE_LIMIT_PER_IP = os.getenv("HOST_CHANGES_RATE_LIMIT_PER_IP", "60/minute")
+
+# Per-worker cache of user rows for token authentication; changes made in another
+# worker apply within USER_CACHE_TTL seconds (0 disables the cache)
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 10))
+USER_CACHE_MAX_ENTRIES = 1000
+
+# Argon2 cost for new password hashes (passes, and memory in KiB per hash), and how many
+# hashes/verifications each worker runs at once on its password thread pool
+PASSWORD_ARGON2_TIME_COST = int(os.getenv("PASSWORD_ARGON2_TIME_COST", 3))
+PASSWORD_ARGON2_MEMORY_COST = int(os.getenv("PASSWORD_ARGON2_MEMORY_COST", 65536))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+
+# User database (DATABASE_URL) connections kept open per worker, and extra ones allowed under load
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+# SQLite only: how long a write waits for the database lock before failing, and bytes memory-mapped for reads
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", 5000))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", 64 * 1024 * 1024))
+
+# Seconds between moving expired invites to the archive (also done at startup)
+INVITE_ARCHIVE_INTERVAL = float(os.getenv("INVITE_ARCHIVE_INTERVAL", 60 * 60))
+
+# The orgs.yaml/hosts.yaml export of the registry is written this many seconds after a change,
+# batching everything changed meanwhile (and on shutdown)
+REGISTRY_EXPORT_DELAY = float(os.getenv("REGISTRY_EXPORT_DELAY", 2))
+
+# Seconds a superseded host bundle is kept, so downloads that already picked it can finish
+BUNDLE_RETIRE_GRACE = float(os.getenv("BUNDLE_RETIRE_GRACE", 300))